@@ -28,6 +28,11 @@ DEBUG = True
 ALLOWED_HOSTS = []
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'Eco Activities <no-reply@example.com>'
+# Absolute links in notification emails
+SITE_URL = 'http://127.0.0.1:8000'
+# send_notifications never sends faster than this (messages per second); None for no limit
+NOTIFICATION_MAX_PER_SECOND = 20
 
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
@@ -44,7 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so its timings cover the whole stack
+    'main.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -55,18 +63,26 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'Environmental_Activity_Information_Website.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times each page render for /metrics
+        'BACKEND': 'main.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # in production compiled templates are kept per process; with DEBUG on
+            # every render reads the files again, so edits show up straight away
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
         },
     },
 ]
@@ -81,9 +97,51 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # take the write lock at BEGIN so concurrent registrations queue on the
+            # busy timeout instead of failing on a read-to-write lock upgrade
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+        'TEST': {
+            # a file database so multi-process tests can share it
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Test databases are copied from a migrated template kept here, rebuilt when migrations (or what they import) change;
+# TEST_DB_SNAPSHOT optionally names a dump_snapshot file loaded into the template
+TEST_RUNNER = 'main.testing.TemplateDatabaseRunner'
+TEST_DB_TEMPLATE_DIR = BASE_DIR / 'test_db_templates'
+TEST_DB_SNAPSHOT = None
+
+
+# Cache
+# Local memory is per process; point this at a shared cache in production so rate
+# limits and cached pages are shared between workers. main.metrics.InstrumentedRedisCache
+# and InstrumentedPyMemcacheCache count hits and misses for /metrics like the local ones.
+
+CACHES = {
+    # LocMemCache that also counts hits and misses for /metrics, labeled by METRICS_LABEL
+    'default': {
+        'BACKEND': 'main.metrics.InstrumentedLocMemCache',
+    },
+    # rendered {% cache %} fragments, kept apart so they cannot evict rate-limit counters
+    'template_fragments': {
+        'BACKEND': 'main.metrics.InstrumentedLocMemCache',
+        'LOCATION': 'template-fragments',
+        'METRICS_LABEL': 'template-fragments',
+    },
+}
+
+# Rate limiting (see main/urls.py for per-URL budgets)
+RATELIMIT_ENABLE = True
+RATELIMIT_CACHE = 'default'
+# Set to e.g. 'HTTP_X_FORWARDED_FOR' when running behind a trusted reverse proxy
+RATELIMIT_IP_HEADER = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -120,6 +178,20 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes hashed names plus .gz/.br variants; main.middleware serves them
+STORAGES = {
+    # uploads are named by content hash and stored once; see main.storage and gc_media
+    'default': {
+        'BACKEND': 'main.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'main.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+# Cache lifetime (seconds) for static files without a hashed name
+STATIC_MAX_AGE = 60
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -129,6 +201,20 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_MAX_AGE = 3600
+# Let the front proxy send media files: None, 'x-sendfile' (Apache, lighttpd) or
+# 'x-accel-redirect' (nginx, with an internal location at MEDIA_ACCEL_REDIRECT_PREFIX)
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Dotted paths of hook(request, name) callables; a hook returning False denies the file
+MEDIA_ACCESS_CHECKS = []
+# Upload limits (bytes). Large files go through the resumable chunked upload endpoint,
+# whose partial files are kept in UPLOAD_TEMP_DIR for up to UPLOAD_SESSION_MAX_AGE seconds
+MEDIA_MAX_UPLOAD_BYTES = 500 * 1024 * 1024
+MEDIA_USER_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+UPLOAD_CHUNK_MAX_BYTES = 8 * 1024 * 1024
+UPLOAD_TEMP_DIR = BASE_DIR / 'upload_parts'
+UPLOAD_SESSION_MAX_AGE = 24 * 3600
 
 
 
@@ -136,3 +222,58 @@ TEMPLATES[0]['DIRS'] = [BASE_DIR / 'templates']
 
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
+
+# Events that started this many days ago are archived by the archive_activities command
+ARCHIVE_AFTER_DAYS = 180
+
+# Buffered writes (trending counters, slow queries) are made by a background thread in each process.
+# The test runner turns it off; tests flush the buffers themselves.
+BACKGROUND_FLUSH = True
+# Trending counters are buffered per process and written this often (seconds)
+TRENDING_FLUSH_INTERVAL = 60
+TRENDING_MAX_PENDING = 1000
+
+# Live activity updates (Server-Sent Events). LocalBackend only reaches connections in the
+# same process; run a single ASGI worker or plug in a shared pub/sub backend.
+LIVE_BACKEND = 'main.live.LocalBackend'
+# a burst of changes within this many seconds goes out as one batch
+LIVE_COALESCE_SECONDS = 0.5
+LIVE_KEEPALIVE_SECONDS = 15
+# streams are closed after this long and the browser reconnects
+LIVE_STREAM_SECONDS = 600
+LIVE_MAX_COMMENTS = 10
+
+# Prometheus metrics at /metrics. With several worker processes, point METRICS_DIR at a
+# directory they share; each worker writes its totals there at most every
+# METRICS_FLUSH_INTERVAL seconds and a scrape sums them, folding exited workers into one file.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 10
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Statements slower than this (ms) are logged with their EXPLAIN plan to SLOW_QUERY_LOG
+# and summed per fingerprint in the SlowQuery admin. None turns the log off.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_LOG = BASE_DIR / 'slow_queries.log'
+# captures are saved to SlowQuery this often (seconds), off the request path
+SLOW_QUERY_FLUSH_INTERVAL = 30
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 3,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'main.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
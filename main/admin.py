@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Profile, Activity, Media, Registration
+from django.db.models import CharField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat
+from .caching import profiles_changed
+from .deletion import soft_delete_activity
+from .models import Profile, Activity, Media, Registration, SlowQuery, UserHistory
+from .paginators import EstimatedCountPaginator
+from .seating import fill_from_waitlist, resync_seats
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -14,7 +20,10 @@ class UserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'is_organizer', 'date_joined')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
-    
+    list_select_related = ('profile',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     def is_organizer(self, obj):
         if hasattr(obj, 'profile'):
             return obj.profile.is_organizer
@@ -32,21 +41,29 @@ class ProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'organization_name')
     fields = ('user', 'is_organizer', 'organization_name', 'user_photo', 'description')
     actions = ['downgrade_to_regular', 'upgrade_to_organizer']
-    
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     def downgrade_to_regular(self, request, queryset):
         updated = queryset.update(is_organizer=False, organization_name='')
+        profiles_changed(queryset.values_list('user_id', flat=True))
         self.message_user(request, f'{updated} user(s) downgraded to regular member(s).')
     downgrade_to_regular.short_description = 'Downgrade selected organizers to regular members'
-    
+
     def upgrade_to_organizer(self, request, queryset):
-        count = 0
-        for profile in queryset:
-            if not profile.is_organizer:
-                profile.is_organizer = True
-                if not profile.organization_name:
-                    profile.organization_name = f"Organization for {profile.user.username}"
-                profile.save()
-                count += 1
+        pending = queryset.filter(is_organizer=False)
+        default_name = Concat(
+            Value('Organization for '),
+            Subquery(User.objects.filter(pk=OuterRef('user_id')).values('username')[:1]),
+            output_field=CharField(),
+        )
+        unnamed = Q(organization_name__isnull=True) | Q(organization_name='')
+        changed = list(pending.values_list('pk', flat=True))
+        count = pending.filter(unnamed).update(is_organizer=True, organization_name=default_name)
+        count += pending.update(is_organizer=True)
+        profiles_changed(Profile.objects.filter(pk__in=changed).values_list('user_id', flat=True))
         self.message_user(request, f'{count} user(s) upgraded to organizer(s).')
     upgrade_to_organizer.short_description = 'Upgrade selected users to organizers'
 
@@ -56,17 +73,39 @@ class ActivityAdmin(admin.ModelAdmin):
     list_filter = ('category', 'date', 'is_featured', 'created_by__profile__is_organizer')
     search_fields = ('title', 'description', 'location', 'created_by__username')
     list_editable = ('is_featured',)
-    fields = ('category', 'title', 'description', 'location', 'date', 'created_by', 'is_featured')
-    
+    fields = ('category', 'title', 'description', 'location', 'latitude', 'longitude', 'date', 'capacity', 'seats_taken', 'created_by', 'is_featured')
+    list_select_related = ('created_by__profile',)
+    autocomplete_fields = ('created_by',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
     def is_official(self, obj):
         if hasattr(obj.created_by, 'profile'):
             return obj.created_by.profile.is_organizer
         return False
     is_official.boolean = True
     is_official.short_description = 'Official'
-    
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # a raised capacity frees seats for people on the waitlist
+        fill_from_waitlist(obj)
+
+    #deleting only hides the activity; purge_deleted_activities removes it and its rows in batches
+    def delete_model(self, request, obj):
+        soft_delete_activity(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            soft_delete_activity(obj)
+
+    def get_deleted_objects(self, objs, request):
+        # skip collecting every registration and rating just to list them on the confirmation page
+        objs = list(objs)
+        return [str(obj) for obj in objs], {Activity._meta.verbose_name_plural: len(objs)}, set(), []
+
     def get_readonly_fields(self, request, obj=None):
-        readonly = []
+        readonly = ['seats_taken']
         if not request.user.is_staff:
             readonly.append('is_featured')
         return readonly
@@ -75,9 +114,74 @@ class ActivityAdmin(admin.ModelAdmin):
 class MediaAdmin(admin.ModelAdmin):
     list_display = ('activity', 'created_by', 'file', 'created_at')
     search_fields = ('activity__title', 'created_by__username')
+    list_select_related = ('activity', 'created_by')
+    autocomplete_fields = ('activity', 'created_by')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Registration)
 class RegistrationAdmin(admin.ModelAdmin):
     list_display = ('user', 'joined_activity', 'status', 'joined_at')
     list_filter = ('status',)
     search_fields = ('user__username', 'joined_activity__title')
+    list_select_related = ('user', 'joined_activity')
+    autocomplete_fields = ('user', 'joined_activity')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        resync_seats(obj.joined_activity_id)
+
+    def delete_queryset(self, request, queryset):
+        activity_ids = set(queryset.values_list('joined_activity_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for activity_id in activity_ids:
+            resync_seats(activity_id)
+
+@admin.register(UserHistory)
+class UserHistoryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'action', 'timestamp')
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('statement', 'view', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'last_seen')
+    list_filter = ('view',)
+    search_fields = ('sql', 'view', 'location')
+    exclude = ('samples',)
+
+    #captured automatically; only reading and clearing make sense here
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='SQL')
+    def statement(self, obj):
+        return obj.sql if len(obj.sql) <= 120 else obj.sql[:117] + '...'
+
+    @admin.display(description='mean ms', ordering='total_ms')
+    def mean_ms(self, obj):
+        return round(obj.total_ms / obj.count, 1) if obj.count else None
+
+    def _percentile(self, obj, fraction):
+        value = obj.percentile(fraction)
+        return None if value is None else round(value, 1)
+
+    @admin.display(description='p50 ms')
+    def p50_ms(self, obj):
+        return self._percentile(obj, 0.50)
+
+    @admin.display(description='p95 ms')
+    def p95_ms(self, obj):
+        return self._percentile(obj, 0.95)
+
+    @admin.display(description='p99 ms')
+    def p99_ms(self, obj):
+        return self._percentile(obj, 0.99)
@@ -0,0 +1,260 @@
+# main/analytics.py
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    Activity, ActivityCounter, ActivityDailyStats, DailyStats, JobCheckpoint, OrganizerDailyStats, Rating,
+    Registration,
+)
+from .trending import counter_buffer
+
+CHECKPOINT = 'analytics'
+FIELDS = DailyStats.FIELDS
+CHUNK_SIZE = 500
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 366
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+#incremental refresh
+def changed_activities(since):
+    """{activity_id: first day whose rollup may be stale} for source rows written since `since`.
+
+    Deleted registrations and ratings leave no trace here; `refresh_rollups(full=True)`
+    picks those up.
+    """
+    first_days = {}
+
+    def touch(rows):
+        for activity_id, moment in rows:
+            day = timezone.localdate(moment)
+            if activity_id not in first_days or day < first_days[activity_id]:
+                first_days[activity_id] = day
+
+    # a registration counts on the day it was made, and on the day it was cancelled, which is later
+    touch(
+        Registration.objects.filter(updated_at__gte=since).order_by()
+        .values('joined_activity_id').annotate(first=Min('joined_at')).values_list('joined_activity_id', 'first')
+    )
+    touch(
+        Rating.objects.filter(updated_at__gte=since).order_by()
+        .values('activity_id').annotate(first=Min('created_at')).values_list('activity_id', 'first')
+    )
+    # other workers may still be holding counts for an earlier hour in their buffers
+    lag = timedelta(seconds=getattr(settings, 'TRENDING_FLUSH_INTERVAL', 60))
+    counters_since = (since - lag).replace(minute=0, second=0, microsecond=0)
+    touch(
+        ActivityCounter.objects.filter(hour__gte=counters_since).order_by()
+        .values('activity_id').annotate(first=Min('hour')).values_list('activity_id', 'first')
+    )
+    return first_days
+
+
+def _daily(queryset, activity_field, moment_field, since, **aggregates):
+    """Yield (activity_id, day, {aggregate: value}) for rows of `queryset` from `since` on."""
+    if since is not None:
+        queryset = queryset.filter(**{f'{moment_field}__gte': since})
+    rows = queryset.order_by().values(key=F(activity_field), day=TruncDate(moment_field)).annotate(**aggregates)
+    for row in rows:
+        yield row['key'], row['day'], {name: row[name] for name in aggregates}
+
+
+def _rebuild_activities(activity_ids, start):
+    """Recompute ActivityDailyStats of `activity_ids` from `start` (None: all days); returns their organizers."""
+    since = day_start(start) if start else None
+    organizers = dict(Activity.objects.filter(pk__in=activity_ids).values_list('pk', 'created_by_id'))
+    stats = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    sources = (
+        _daily(Registration.objects.filter(joined_activity_id__in=activity_ids),
+               'joined_activity_id', 'joined_at', since, registrations=Count('pk')),
+        _daily(Registration.objects.filter(joined_activity_id__in=activity_ids, status='cancelled'),
+               'joined_activity_id', 'updated_at', since, cancellations=Count('pk')),
+        _daily(Rating.objects.filter(activity_id__in=activity_ids, rating__isnull=False),
+               'activity_id', 'created_at', since, ratings=Count('pk'), rating_total=Sum('rating')),
+        _daily(ActivityCounter.objects.filter(activity_id__in=activity_ids),
+               'activity_id', 'hour', since, views=Sum('views')),
+    )
+    for rows in sources:
+        for activity_id, day, values in rows:
+            stats[(activity_id, day)].update(values)
+
+    with transaction.atomic():
+        stale = ActivityDailyStats.objects.filter(activity_id__in=activity_ids)
+        if start:
+            stale = stale.filter(day__gte=start)
+        stale.delete()
+        ActivityDailyStats.objects.bulk_create(
+            [
+                ActivityDailyStats(activity_id=activity_id, organizer_id=organizers[activity_id], day=day, **values)
+                for (activity_id, day), values in stats.items()
+                if activity_id in organizers
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+    return set(organizers.values())
+
+
+def _rebuild_organizers(organizer_ids, start):
+    """Recompute OrganizerDailyStats of `organizer_ids` from their activities' rollups."""
+    rows = ActivityDailyStats.objects.filter(organizer_id__in=organizer_ids)
+    stale = OrganizerDailyStats.objects.filter(organizer_id__in=organizer_ids)
+    if start:
+        rows = rows.filter(day__gte=start)
+        stale = stale.filter(day__gte=start)
+    rows = rows.order_by().values('organizer_id', 'day').annotate(**{f'sum_{field}': Sum(field) for field in FIELDS})
+    with transaction.atomic():
+        stale.delete()
+        OrganizerDailyStats.objects.bulk_create(
+            [
+                OrganizerDailyStats(
+                    organizer_id=row['organizer_id'], day=row['day'],
+                    **{field: row[f'sum_{field}'] for field in FIELDS},
+                )
+                for row in rows
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for begin in range(0, len(ids), CHUNK_SIZE):
+        yield ids[begin:begin + CHUNK_SIZE]
+
+
+def rebuild_rollups(first_days=None):
+    """Recompute rollups for {activity_id: first stale day}, or everything when None.
+
+    Returns the number of activities recomputed.
+    """
+    if first_days is None:
+        by_start = {None: list(Activity.objects.values_list('pk', flat=True))}
+        OrganizerDailyStats.objects.all().delete()
+    else:
+        by_start = defaultdict(list)
+        for activity_id, day in first_days.items():
+            by_start[day].append(activity_id)
+
+    organizer_starts = {}
+    for start, activity_ids in by_start.items():
+        for chunk in _chunks(activity_ids):
+            for organizer_id in _rebuild_activities(chunk, start):
+                current = organizer_starts.get(organizer_id, start)
+                organizer_starts[organizer_id] = None if None in (current, start) else min(current, start)
+
+    organizers_by_start = defaultdict(list)
+    for organizer_id, start in organizer_starts.items():
+        organizers_by_start[start].append(organizer_id)
+    for start, organizer_ids in organizers_by_start.items():
+        for chunk in _chunks(organizer_ids):
+            _rebuild_organizers(chunk, start)
+    return sum(len(activity_ids) for activity_ids in by_start.values())
+
+
+def refresh_rollups(full=False):
+    """Bring the rollups up to date with everything written since the last run.
+
+    Returns the number of activities recomputed.
+    """
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    started = timezone.now()
+    counter_buffer.flush()
+    if full or checkpoint.value is None:
+        count = rebuild_rollups()
+    else:
+        count = rebuild_rollups(changed_activities(checkpoint.value))
+    checkpoint.value = started
+    checkpoint.save()
+    return count
+
+
+#reading: only the rollup tables, summed with numpy
+def parse_range(start, end, today=None):
+    """(start, end) dates from ISO strings, defaulting to the last DEFAULT_RANGE_DAYS; None if invalid."""
+    today = today or timezone.localdate()
+    try:
+        end = date.fromisoformat(end) if end else today
+        start = date.fromisoformat(start) if start else end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    except ValueError:
+        return None
+    if start > end or (end - start).days >= MAX_RANGE_DAYS:
+        return None
+    return start, end
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=np.asarray(denominator) > 0)
+
+
+def _rates(counts):
+    """Cancellation rate and average stars for rows (or a single row) of FIELDS-ordered counts."""
+    counts = np.asarray(counts)
+    column = {field: counts[..., index] for index, field in enumerate(FIELDS)}
+    return (
+        np.round(_ratio(column['cancellations'], column['registrations']), 3),
+        np.round(_ratio(column['rating_total'], column['ratings']), 2),
+    )
+
+
+def organizer_report(organizer_id, start, end):
+    """Daily series, totals and per-activity figures for one organizer between two dates."""
+    days = (end - start).days + 1
+    series = np.zeros((days, len(FIELDS)), dtype=np.int64)
+    rows = list(
+        OrganizerDailyStats.objects.filter(organizer_id=organizer_id, day__range=(start, end))
+        .values_list('day', *FIELDS)
+    )
+    if rows:
+        offsets = np.array([row[0].toordinal() for row in rows]) - start.toordinal()
+        series[offsets] = np.array([row[1:] for row in rows], dtype=np.int64)
+
+    rows = list(
+        ActivityDailyStats.objects.filter(organizer_id=organizer_id, day__range=(start, end))
+        .values_list('activity_id', *FIELDS)
+    )
+    activities = []
+    if rows:
+        data = np.array(rows, dtype=np.int64)
+        activity_ids, positions = np.unique(data[:, 0], return_inverse=True)
+        per_activity = np.zeros((len(activity_ids), len(FIELDS)), dtype=np.int64)
+        np.add.at(per_activity, positions, data[:, 1:])
+        cancellation_rates, averages = _rates(per_activity)
+        details = Activity.objects.in_bulk(activity_ids.tolist())
+        for index in np.argsort(-per_activity[:, FIELDS.index('views')], kind='stable'):
+            activity = details.get(int(activity_ids[index]))
+            if activity is None:
+                continue
+            activities.append({
+                'id': activity.pk,
+                'title': activity.title,
+                'date': activity.date,
+                **dict(zip(FIELDS, per_activity[index].tolist())),
+                'cancellation_rate': float(cancellation_rates[index]),
+                'average_rating': float(averages[index]),
+            })
+
+    totals = series.sum(axis=0)
+    cancellation_rate, average = _rates(totals)
+    return {
+        'start': start,
+        'end': end,
+        'days': [start + timedelta(days=offset) for offset in range(days)],
+        'series': {field: series[:, index].tolist() for index, field in enumerate(FIELDS)},
+        'totals': {
+            **dict(zip(FIELDS, totals.tolist())),
+            'cancellation_rate': float(cancellation_rate),
+            'average_rating': float(average),
+        },
+        'activities': activities,
+    }
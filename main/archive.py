@@ -0,0 +1,64 @@
+# main/archive.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .caching import activities_changed
+from .models import Activity, ActivityArchive, Media, RatingSummary, Registration
+
+ARCHIVE_AFTER_DAYS = 180
+BATCH_SIZE = 500
+
+
+def archive_cutoff(now=None):
+    """Events that started before this are moved out of the hot indexes."""
+    days = getattr(settings, 'ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _freeze(activity_ids):
+    """ActivityArchive rows holding the current totals of `activity_ids`."""
+    participants = dict(
+        Registration.objects.filter(joined_activity_id__in=activity_ids, status='joined')
+        .values_list('joined_activity_id').annotate(count=Count('pk')).order_by()
+    )
+    media = dict(
+        Media.objects.filter(activity_id__in=activity_ids)
+        .values_list('activity_id').annotate(count=Count('pk')).order_by()
+    )
+    summaries = RatingSummary.objects.in_bulk(activity_ids)
+    archives = []
+    for activity_id in activity_ids:
+        summary = summaries.get(activity_id)
+        archives.append(ActivityArchive(
+            activity_id=activity_id,
+            participants=participants.get(activity_id, 0),
+            media_count=media.get(activity_id, 0),
+            rating_count=summary.total if summary else 0,
+            rating_average=summary.average if summary else 0,
+        ))
+    return archives
+
+
+def archive_activities(now=None, batch_size=BATCH_SIZE):
+    """Archive every event older than ARCHIVE_AFTER_DAYS, `batch_size` per transaction.
+
+    Archived events keep their rows, so detail pages and the past tab still show them,
+    but they leave the hot indexes and stop taking ratings and uploads. Returns the number archived.
+    """
+    candidates = Activity.objects.hot().filter(date__lt=archive_cutoff(now)).order_by('pk')
+    archived = 0
+    while True:
+        batch = list(candidates.values_list('pk', 'created_by_id')[:batch_size])
+        if not batch:
+            return archived
+        activity_ids = [pk for pk, _ in batch]
+        with transaction.atomic():
+            ActivityArchive.objects.filter(activity_id__in=activity_ids).delete()
+            ActivityArchive.objects.bulk_create(_freeze(activity_ids))
+            Activity.objects.filter(pk__in=activity_ids).update(archived_at=timezone.now())
+        activities_changed(batch)
+        archived += len(batch)
@@ -0,0 +1,56 @@
+# main/background.py
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """Calls `flush` every `interval()` seconds from a daemon thread, so no request waits for it.
+
+    Each process starts its own thread on first use, including workers forked after import.
+    With BACKGROUND_FLUSH off (the test runner turns it off) no thread is started and the
+    owner of the buffer is expected to flush it itself.
+    """
+
+    def __init__(self, name, flush, interval):
+        self.name = name
+        self.flush = flush
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def start(self):
+        """Make sure this process has a flusher thread; False when background flushing is off."""
+        if not getattr(settings, 'BACKGROUND_FLUSH', True):
+            return False
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # threads do not survive a fork, so a child starts from scratch
+                    self._wake = threading.Event()
+                    threading.Thread(target=self._run, name=self.name, daemon=True).start()
+                    self._pid = os.getpid()
+        return True
+
+    def wake(self):
+        """Flush now rather than at the end of the current interval."""
+        self._wake.set()
+
+    def _run(self):
+        wake = self._wake
+        while True:
+            wake.wait(self.interval())
+            wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("%s: flush failed", self.name)
+            finally:
+                # this thread's own connections; nothing is held open between flushes
+                connections.close_all()
@@ -0,0 +1,71 @@
+# main/caching.py
+import time
+
+from django.core.cache import cache
+
+
+#version counters used to build cache keys; bumping one invalidates every key built from it
+def _version_key(name):
+    return f"version:{name}"
+
+
+def get_version(name):
+    """Return the current version for `name`, starting it if the cache has none."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # seed from the clock so an evicted counter never reuses an old value
+        version = time.time_ns()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, None)
+        return version
+
+
+def versioned_key(prefix, *names, extra=()):
+    """Build a cache key from `prefix`, the current versions of `names` and any extra parts."""
+    parts = [prefix]
+    parts.extend(f"{name}.{get_version(name)}" for name in names)
+    parts.extend(str(part) for part in extra)
+    return ":".join(parts)
+
+
+def get_versions(**names):
+    """Map each keyword to the current version of the named counter, e.g. for {% cache %} keys."""
+    return {alias: get_version(name) for alias, name in names.items()}
+
+
+#what to bump when rows change; queryset updates and deletes send no signals, so code that
+#uses them calls these directly, and the signal handlers call them for everything else
+def activities_changed(pairs):
+    """Invalidate lists and pages showing the activities given as (pk, created_by_id) pairs."""
+    bump_version('activities')
+    for activity_id, created_by_id in pairs:
+        bump_version(f'activity.{activity_id}')
+        bump_version(f'activities.user.{created_by_id}')
+
+
+def registrations_changed(user_ids):
+    """Invalidate the cached registrations of each of `user_ids`, and the site-wide participant totals."""
+    changed = False
+    for user_id in user_ids:
+        bump_version(f'registrations.user.{user_id}')
+        changed = True
+    if changed:
+        bump_version('registrations')
+
+
+def profiles_changed(user_ids):
+    """Invalidate the profiles of `user_ids`; organizer status also decides which activities count as official."""
+    bump_version('activities')
+    for user_id in user_ids:
+        bump_version(f'profile.{user_id}')
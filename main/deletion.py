@@ -0,0 +1,106 @@
+# main/deletion.py
+import logging
+import time
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .caching import activities_changed, registrations_changed
+from .models import Activity, Media, Registration
+from .recommendations import note_registration_deleted
+from .seating import registrants_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# pause between batches so other writers get the SQLite write lock in between
+PAUSE_SECONDS = 0.05
+
+
+def soft_delete_activity(activity):
+    """Hide `activity` from every page at once; purge_deleted_activities removes it later.
+
+    Returns False if it was already deleted.
+    """
+    if not Activity.all_objects.filter(pk=activity.pk, deleted_at__isnull=True).update(deleted_at=timezone.now()):
+        return False
+    activities_changed([(activity.pk, activity.created_by_id)])
+    registrants_changed(activity.pk)
+    return True
+
+
+def _cascades():
+    """(model, field name) for every relation whose rows go when an activity is deleted."""
+    return [
+        (relation.related_model, relation.field.name)
+        for relation in Activity._meta.related_objects
+        if relation.on_delete is models.CASCADE
+    ]
+
+
+def _fast_deletable(model):
+    # rows nothing else points at can be deleted without loading them or sending signals;
+    # the cover pointer into Media is cleared before the purge starts
+    cover = Activity._meta.get_field('cover')
+    return all(relation.field is cover for relation in model._meta.related_objects)
+
+
+def _delete_files(names):
+    storage = Media._meta.get_field('file').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning("Could not delete media file %s", name, exc_info=True)
+
+
+def _purge_rows(model, field_name, activity_id, batch_size, pause):
+    """Delete the rows of `model` pointing at the activity, `batch_size` per transaction."""
+    rows = model._base_manager.filter(**{field_name: activity_id}).order_by('pk')
+    deleted = 0
+    while True:
+        pks = list(rows.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        files, user_ids = [], set()
+        with transaction.atomic():
+            batch = model._base_manager.filter(pk__in=pks)
+            if model is Media:
+                files = [name for name in batch.values_list('file', flat=True) if name]
+            elif model is Registration:
+                user_ids = set(batch.values_list('user_id', flat=True))
+            if _fast_deletable(model):
+                batch._raw_delete(batch.db)
+            else:
+                batch.delete()
+            if model is Registration:
+                # a raw delete skips registration_deleted; co-registrations through these rows are gone
+                note_registration_deleted()
+        # files go only once no row refers to them any more
+        _delete_files(files)
+        registrations_changed(user_ids)
+        deleted += len(pks)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_activity(activity_id, batch_size=BATCH_SIZE, pause=PAUSE_SECONDS):
+    """Remove a soft-deleted activity, its dependent rows and its media files; returns rows deleted."""
+    Activity.all_objects.filter(pk=activity_id).update(cover=None)
+    deleted = sum(
+        _purge_rows(model, field_name, activity_id, batch_size, pause)
+        for model, field_name in _cascades()
+    )
+    # nothing hangs off the row any more, so this is a single-row delete
+    deleted += Activity.all_objects.filter(pk=activity_id, deleted_at__isnull=False).delete()[0]
+    return deleted
+
+
+def purge_deleted_activities(batch_size=BATCH_SIZE, pause=PAUSE_SECONDS):
+    """Purge every soft-deleted activity, oldest first; returns the number of activities removed."""
+    activity_ids = list(
+        Activity.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at').values_list('pk', flat=True)
+    )
+    for activity_id in activity_ids:
+        purge_activity(activity_id, batch_size, pause)
+    return len(activity_ids)
@@ -0,0 +1,57 @@
+# main/facets.py
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .caching import versioned_key
+from .models import Activity
+
+# counts move as events start, so even an unchanged table is recounted this often
+FACETS_MAX_AGE = 60
+TABS = ('upcoming', 'past', 'official')
+
+
+def normalize_query(q):
+    """The search text as matched: trimmed, with runs of whitespace collapsed."""
+    return ' '.join((q or '').split())
+
+
+def search_filter(q):
+    return Q(title__icontains=q) | Q(description__icontains=q) | Q(location__icontains=q)
+
+
+def compute_facets(q, now=None):
+    """{category: {'upcoming', 'past', 'official'}} for activities matching `q`, in one grouped query."""
+    now = now or timezone.now()
+    queryset = Activity.objects.all()
+    if q:
+        queryset = queryset.filter(search_filter(q))
+    # archived events are all long past, so they only add to the past column
+    rows = queryset.values('category').order_by().annotate(
+        upcoming=Count('pk', filter=Q(date__gte=now)),
+        past=Count('pk', filter=Q(date__lt=now)),
+        official=Count('pk', filter=Q(date__gte=now, created_by__profile__is_organizer=True)),
+    )
+    return {row.pop('category'): row for row in rows}
+
+
+def get_facets(q):
+    """Cached compute_facets for the normalized `q`, rebuilt after any activity or organizer change."""
+    q = normalize_query(q)
+    digest = hashlib.md5(q.encode(), usedforsecurity=False).hexdigest()
+    key = versioned_key('facets', 'activities', extra=[digest])
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(q)
+        cache.set(key, facets, FACETS_MAX_AGE)
+    return facets
+
+
+def facet_counts(facets, tab, category=''):
+    """(per-category counts for `tab`, per-tab counts for `category` or all categories)."""
+    categories = {value: facets.get(value, {}).get(tab, 0) for value, _ in Activity.CATEGORY_CHOICES}
+    selected = [facets.get(category, {})] if category else list(facets.values())
+    tabs = {name: sum(counts.get(name, 0) for counts in selected) for name in TABS}
+    return categories, tabs
@@ -0,0 +1,122 @@
+# main/feeds.py
+import datetime
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import versioned_key
+from .models import Activity
+
+FEED_SALT = 'main.feeds.user'
+FEED_CACHE_MAX_AGE = 60 * 60
+FEED_COLUMNS = ('id', 'title', 'description', 'location', 'category', 'date', 'updated_at')
+
+
+#private per-user feed tokens
+def make_user_feed_token(user):
+    return signing.Signer(salt=FEED_SALT).sign(str(user.pk))
+
+
+def read_user_feed_token(token):
+    """Return the user id signed into `token`, or None if the token is invalid."""
+    try:
+        return int(signing.Signer(salt=FEED_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Fold a content line to 75 octets as required by RFC 5545."""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while data:
+        cut = min(limit, len(data))
+        # never split inside a multi-byte character
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+        limit = 74
+    return '\r\n '.join(parts)
+
+
+def _format_dt(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def iter_ical_lines(rows, name, host):
+    yield 'BEGIN:VCALENDAR'
+    yield 'VERSION:2.0'
+    yield 'PRODID:-//Eco Activities//Activity Feed//EN'
+    yield 'CALSCALE:GREGORIAN'
+    yield _fold(f'X-WR-CALNAME:{_escape(name)}')
+    for pk, title, description, location, category, date, updated_at in rows:
+        yield 'BEGIN:VEVENT'
+        yield f'UID:activity-{pk}@{host}'
+        yield f'DTSTAMP:{_format_dt(updated_at)}'
+        yield f'DTSTART:{_format_dt(date)}'
+        yield _fold(f'SUMMARY:{_escape(title)}')
+        yield _fold(f'DESCRIPTION:{_escape(description)}')
+        yield _fold(f'LOCATION:{_escape(location)}')
+        yield _fold(f'CATEGORIES:{_escape(category)}')
+        yield 'END:VEVENT'
+    yield 'END:VCALENDAR'
+
+
+def upcoming_feed_queryset(category=None, official=False, user_id=None):
+    queryset = Activity.objects.upcoming()
+    if category:
+        queryset = queryset.filter(category=category)
+    if official:
+        queryset = queryset.filter(created_by__profile__is_organizer=True)
+    if user_id is not None:
+        queryset = queryset.filter(registrations__user_id=user_id, registrations__status='joined')
+    return queryset.order_by('date').values_list(*FEED_COLUMNS)
+
+
+def build_feed(queryset, name, host):
+    """Stream `queryset` into an iCalendar body; return (body, etag, seconds until it goes stale)."""
+    rows = queryset.iterator(chunk_size=500)
+    first_date = None
+
+    def tracked():
+        nonlocal first_date
+        for row in rows:
+            if first_date is None:
+                first_date = row[5]
+            yield row
+
+    body = '\r\n'.join(iter_ical_lines(tracked(), name, host)) + '\r\n'
+    etag = '"%s"' % hashlib.md5(body.encode('utf-8')).hexdigest()
+    timeout = FEED_CACHE_MAX_AGE
+    if first_date is not None:
+        # the earliest event drops out of an "upcoming" feed once it starts
+        timeout = max(1, min(timeout, int((first_date - timezone.now()).total_seconds()) + 1))
+    return body, etag, timeout
+
+
+def get_feed(feed_key, version_names, queryset, name, host):
+    """Return a cached (body, etag) pair, building it only after a relevant change."""
+    key = versioned_key(f'ics:{feed_key}', *version_names, extra=(host,))
+    cached = cache.get(key)
+    if cached is None:
+        body, etag, timeout = build_feed(queryset, name, host)
+        cached = (body, etag)
+        cache.set(key, cached, timeout)
+    return cached
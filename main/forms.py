@@ -3,18 +3,37 @@ from .models import Activity
 from .models import Media, ContactMessage, Profile, Rating
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from .uploads import SNIFF_BYTES, UploadError, check_limits, sniff
 
 class ActivityForm(forms.ModelForm):
     class Meta:
         model = Activity
-        fields = ['category', 'title', 'description', 'location', 'date']
+        fields = ['category', 'title', 'description', 'location', 'latitude', 'longitude', 'date', 'capacity']
         widgets = {
             'category': forms.Select(attrs={'class': 'form-control'}),
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
             'location': forms.TextInput(attrs={'class': 'form-control'}),
+            'latitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'min': -90, 'max': 90}),
+            'longitude': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'min': -180, 'max': 180}),
             'date': forms.DateTimeInput(attrs={'class': 'form-control', 'type': 'datetime-local'}),
+            'capacity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
+        help_texts = {
+            'latitude': "Optional. Leave blank to look the location up automatically; a changed location is looked up again, and coordinates you entered are kept if it is not found.",
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        latitude = cleaned_data.get('latitude')
+        longitude = cleaned_data.get('longitude')
+
+        if (latitude is None) != (longitude is None):
+            raise forms.ValidationError("Enter both latitude and longitude, or leave both blank.")
+        if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise forms.ValidationError("Latitude must be between -90 and 90 and longitude between -180 and 180.")
+
+        return cleaned_data
 
 
 class MediaForm(forms.ModelForm):
@@ -32,11 +51,30 @@ class MediaForm(forms.ModelForm):
         model = Media
         fields = ['file']
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user=None, **kwargs):
         super().__init__(*args, **kwargs)
+        # uploads are counted against this user's quota
+        self.user = user
         # Store description as a custom attribute
         self.upload_description = "Images or Videos (PNG, JPG, MP4, etc.)"
 
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        # trust the file's first bytes, not the name or Content-Type the browser sent
+        upload.seek(0)
+        detected = sniff(upload.read(SNIFF_BYTES))
+        upload.seek(0)
+        if detected is None:
+            raise forms.ValidationError("Only images (PNG, JPG, GIF) and videos (MP4, MOV, AVI, MKV) can be uploaded.")
+        try:
+            if self.user is not None:
+                check_limits(self.user, upload.size)
+        except UploadError as error:
+            raise forms.ValidationError(str(error))
+        stem = upload.name.rsplit('.', 1)[0] if '.' in upload.name else upload.name
+        upload.name = stem + detected[1]
+        return upload
+
 
 class CustomSignupForm(UserCreationForm):
     email = forms.EmailField(required=True, help_text="Required.")
@@ -73,10 +111,10 @@ class CustomSignupForm(UserCreationForm):
         user.email = self.cleaned_data["email"]
         if commit:
             user.save()
-            profile, created = Profile.objects.get_or_create(user=user)
-            profile.is_organizer = self.cleaned_data.get('is_organizer', False)
-            profile.organization_name = self.cleaned_data.get('organization_name', '')
-            profile.save()
+            Profile.objects.update_or_create(user=user, defaults={
+                'is_organizer': self.cleaned_data.get('is_organizer', False),
+                'organization_name': self.cleaned_data.get('organization_name', ''),
+            })
         return user
 
 
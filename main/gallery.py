@@ -0,0 +1,31 @@
+# main/gallery.py
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .caching import activities_changed
+from .models import Activity, Media
+from .paging import keyset_page
+
+GALLERY_PAGE_SIZE = 12
+
+
+def image_filter():
+    return reduce(or_, (Q(file__iendswith=extension) for extension in Media.IMAGE_EXTENSIONS))
+
+
+def refresh_cover(activity_id):
+    """Point Activity.cover at the activity's first uploaded image, or clear it."""
+    cover_id = (
+        Media.objects.filter(image_filter(), activity_id=activity_id)
+        .order_by('pk').values_list('pk', flat=True).first()
+    )
+    if Activity.objects.filter(pk=activity_id).exclude(cover_id=cover_id).update(cover_id=cover_id):
+        # cards and headers show the cover
+        activities_changed(Activity.objects.filter(pk=activity_id).values_list('pk', 'created_by_id'))
+
+
+def gallery_page(activity, after=None, size=GALLERY_PAGE_SIZE):
+    """Newest-first media for an activity, starting after the cursor position `after`."""
+    return keyset_page(Media.objects.filter(activity=activity), after, size)
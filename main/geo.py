@@ -0,0 +1,169 @@
+# main/geo.py
+import csv
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+
+from django.db.models import Q
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+MAX_CELLS = 16
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+#geohash encoding; prefixes of a hash are the enclosing grid cells
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            value, bounds = longitude, lon_range
+        else:
+            value, bounds = latitude, lat_range
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a geohash cell at `precision`."""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle of `radius_km`."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, dlat / cos_lat)
+    return (
+        max(-90.0, latitude - dlat),
+        max(-180.0, longitude - dlon),
+        min(90.0, latitude + dlat),
+        min(180.0, longitude + dlon),
+    )
+
+
+def cover_cells(min_lat, min_lon, max_lat, max_lon):
+    """Return the geohash prefixes covering a bounding box, using the finest level with few cells."""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols > MAX_CELLS:
+            continue
+        cells = set()
+        for row in range(rows):
+            lat = min(max_lat, min_lat + row * height)
+            for col in range(cols):
+                lon = min(max_lon, min_lon + col * width)
+                cells.add(encode_geohash(lat, lon, precision))
+        return sorted(cells)
+    return []
+
+
+def _cells_q(cells):
+    # range scans use the geohash index, unlike LIKE on SQLite's default collation
+    query = Q()
+    for cell in cells:
+        query |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+    return query
+
+
+def filter_bbox(queryset, min_lat, min_lon, max_lat, max_lon):
+    cells = cover_cells(min_lat, min_lon, max_lat, max_lon)
+    if cells:
+        queryset = queryset.filter(_cells_q(cells))
+    return queryset.filter(
+        latitude__gte=min_lat, latitude__lte=max_lat,
+        longitude__gte=min_lon, longitude__lte=max_lon,
+    )
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """Narrow `queryset` to rows within `radius_km`; returns (queryset, {pk: distance_km})."""
+    candidates = filter_bbox(queryset, *bbox_around(latitude, longitude, radius_km))
+    distances = {}
+    for pk, lat, lon in candidates.values_list('pk', 'latitude', 'longitude'):
+        distance = haversine_km(latitude, longitude, lat, lon)
+        if distance <= radius_km:
+            distances[pk] = distance
+    return queryset.filter(pk__in=list(distances)), distances
+
+
+def parse_point(value):
+    """Parse "lat,lon" into a pair of floats, or return None."""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def parse_bbox(value):
+    """Parse "min_lat,min_lon,max_lat,max_lon" into floats, or return None."""
+    try:
+        min_lat, min_lon, max_lat, max_lon = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        return None
+    return min_lat, min_lon, max_lat, max_lon
+
+
+#offline gazetteer lookups for free-text locations
+def _normalize(text):
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+@lru_cache(maxsize=1)
+def load_gazetteer():
+    entries = {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as handle:
+        for row in csv.DictReader(handle):
+            entries[_normalize(row['name'])] = (float(row['latitude']), float(row['longitude']))
+    # longest names first so "niagara falls" wins over shorter matches
+    return sorted(entries.items(), key=lambda item: -len(item[0]))
+
+
+def geocode(location):
+    """Return (latitude, longitude) for a free-text location from the gazetteer, or None."""
+    text = f" {_normalize(location or '')} "
+    if not text.strip():
+        return None
+    for name, point in load_gazetteer():
+        if f" {name} " in text:
+            return point
+    return None
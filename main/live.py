@@ -0,0 +1,201 @@
+# main/live.py
+import asyncio
+import json
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Registration
+
+#event names sent to the browser
+PARTICIPANTS = 'participants'
+COMMENT = 'comment'
+
+
+class LocalBackend:
+    """In-process publish/subscribe: fans messages out to subscribers in this worker only.
+
+    It is the default and what the tests use. A cross-process backend (e.g. Redis pub/sub)
+    implements the same four methods and is selected with LIVE_BACKEND.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._channels.get(channel)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._channels[channel]
+
+    def has_subscribers(self, channel):
+        return channel in self._channels
+
+    def publish(self, channel, event, data):
+        with self._lock:
+            callbacks = list(self._channels.get(channel, ()))
+        for callback in callbacks:
+            callback(event, data)
+
+
+@lru_cache(maxsize=None)
+def _backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _backend(getattr(settings, 'LIVE_BACKEND', 'main.live.LocalBackend'))
+
+
+def activity_channel(activity_id):
+    return f'activity.{activity_id}'
+
+
+def publish(channel, event, build_data):
+    """Send an event once the current transaction commits.
+
+    `build_data` is only called if someone is listening, so writes on pages nobody is
+    watching cost nothing extra.
+    """
+    def send():
+        backend = get_backend()
+        if backend.has_subscribers(channel):
+            backend.publish(channel, event, build_data())
+    transaction.on_commit(send)
+
+
+def participants_changed(activity_id):
+    def build():
+        return {'count': Registration.objects.filter(joined_activity_id=activity_id, status='joined').count()}
+    publish(activity_channel(activity_id), PARTICIPANTS, build)
+
+
+def comment_added(rating):
+    def build():
+        return {
+            'id': rating.pk,
+            'user': rating.user.username,
+            'rating': rating.rating,
+            'comment': rating.comment[:280],
+            'created_at': rating.created_at.isoformat(),
+        }
+    publish(activity_channel(rating.activity_id), COMMENT, build)
+
+
+class Subscription:
+    """One connection's view of a channel; bursts between reads are coalesced.
+
+    Only the latest participant count is kept, and at most LIVE_MAX_COMMENTS comments.
+    `wake` is called (from any thread) whenever something is pending.
+    """
+
+    def __init__(self, channel, wake):
+        self.channel = channel
+        self.wake = wake
+        self.max_comments = getattr(settings, 'LIVE_MAX_COMMENTS', 10)
+        self._lock = threading.Lock()
+        self._participants = None
+        self._comments = []
+
+    def __call__(self, event, data):
+        with self._lock:
+            if event == PARTICIPANTS:
+                self._participants = data
+            elif event == COMMENT:
+                self._comments = (self._comments + [data])[-self.max_comments:]
+        self.wake()
+
+    def drain(self):
+        """Pending events as (event, data) pairs, oldest comment first."""
+        with self._lock:
+            events = [(COMMENT, comment) for comment in self._comments]
+            if self._participants is not None:
+                events.append((PARTICIPANTS, self._participants))
+            self._participants, self._comments = None, []
+        return events
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_settings():
+    return (
+        getattr(settings, 'LIVE_COALESCE_SECONDS', 0.5),
+        getattr(settings, 'LIVE_KEEPALIVE_SECONDS', 15),
+        getattr(settings, 'LIVE_STREAM_SECONDS', 600),
+    )
+
+
+async def event_stream(channel, initial=()):
+    """Server-Sent Events for one channel; an idle connection is just a parked coroutine.
+
+    Connections end after LIVE_STREAM_SECONDS and the browser reconnects on its own, so
+    workers can be rotated without stranding clients.
+    """
+    coalesce, keepalive, lifetime = stream_settings()
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # the connection's loop already closed; it unsubscribes on its way out
+
+    subscription = Subscription(channel, wake)
+    backend = get_backend()
+    backend.subscribe(channel, subscription)
+    try:
+        yield 'retry: 5000\n\n'
+        for event, data in initial:
+            yield format_event(event, data)
+        deadline = loop.time() + lifetime
+        while loop.time() < deadline:
+            try:
+                await asyncio.wait_for(ready.wait(), timeout=min(keepalive, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # let the rest of a burst arrive, then send it as one batch
+            await asyncio.sleep(coalesce)
+            ready.clear()
+            for event, data in subscription.drain():
+                yield format_event(event, data)
+    finally:
+        backend.unsubscribe(channel, subscription)
+
+
+def event_stream_sync(channel, initial=()):
+    """Same stream for WSGI servers such as runserver; holds a thread per connection."""
+    coalesce, keepalive, lifetime = stream_settings()
+    ready = threading.Event()
+    subscription = Subscription(channel, ready.set)
+    backend = get_backend()
+    backend.subscribe(channel, subscription)
+    try:
+        yield 'retry: 5000\n\n'
+        for event, data in initial:
+            yield format_event(event, data)
+        deadline = time.monotonic() + lifetime
+        while time.monotonic() < deadline:
+            if not ready.wait(timeout=min(keepalive, deadline - time.monotonic())):
+                yield ': keepalive\n\n'
+                continue
+            time.sleep(coalesce)
+            ready.clear()
+            for event, data in subscription.drain():
+                yield format_event(event, data)
+    finally:
+        backend.unsubscribe(channel, subscription)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.archive import BATCH_SIZE, archive_activities
+
+
+class Command(BaseCommand):
+    help = "Move events older than ARCHIVE_AFTER_DAYS out of the hot indexes, freezing their totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Activities archived per transaction")
+
+    def handle(self, *args, **options):
+        count = archive_activities(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} activities."))
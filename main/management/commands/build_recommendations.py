@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import JobCheckpoint
+from main.recommendations import BLOCK_SIZE, TOP_K, affected_activity_ids, rebuild_recommendations
+
+CHECKPOINT = 'recommendations'
+
+
+class Command(BaseCommand):
+    help = "Rebuild co-registration recommendations for activities with registrations changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every activity instead of only changed ones")
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Neighbors stored per activity")
+        parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="Activities scored per block; bounds memory")
+
+    def handle(self, *args, **options):
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+        started = timezone.now()
+
+        activity_ids = None
+        if not options['full'] and checkpoint.value is not None:
+            activity_ids = affected_activity_ids(checkpoint.value)
+        if activity_ids is None:
+            self.stdout.write("Rebuilding recommendations for all activities...")
+        else:
+            self.stdout.write(f"Rebuilding recommendations for {len(activity_ids)} affected activities...")
+            if not activity_ids:
+                checkpoint.value = started
+                checkpoint.save()
+                return
+
+        count = rebuild_recommendations(activity_ids, top_k=options['top_k'], block_size=options['block_size'])
+
+        checkpoint.value = started
+        checkpoint.save()
+        self.stdout.write(self.style.SUCCESS(f"Updated recommendations for {count} activities."))
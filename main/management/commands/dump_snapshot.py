@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from main.snapshots import dump_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write every table to a snapshot file that load_snapshot restores (gzip-compressed if it ends in .gz)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('-e', '--exclude', action='append', default=[],
+                            help="Leave out a model, e.g. sessions.session (can be repeated)")
+
+    def handle(self, *args, **options):
+        exclude = {label.lower() for label in options['exclude']}
+        count = dump_snapshot(options['path'], using=options['database'], exclude=exclude)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} rows to {options['path']}."))
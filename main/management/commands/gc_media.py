@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from main.media_gc import GRACE_HOURS, WORKERS, adopt_legacy_files, collect_garbage
+from main.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete files under MEDIA_ROOT that no profile photo or activity media refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=GRACE_HOURS,
+                            help="Never delete files modified more recently than this")
+        parser.add_argument('--workers', type=int, default=WORKERS, help="Threads walking directories and deleting files")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+        parser.add_argument('--adopt', action='store_true',
+                            help="First move uploads saved under their original names to content-hashed names")
+
+    def handle(self, *args, **options):
+        if options['adopt'] and not options['dry_run']:
+            count = adopt_legacy_files()
+            self.stdout.write(f"Moved {count} files to content-hashed names.")
+        if not options['dry_run']:
+            expired = expire_uploads()
+            self.stdout.write(f"Dropped {expired} abandoned chunked uploads.")
+        removed, freed = collect_garbage(
+            grace_hours=options['grace_hours'], workers=options['workers'], dry_run=options['dry_run'],
+        )
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} unreferenced files ({freed / 1024 / 1024:.1f} MB)."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from main.geo import encode_geohash, geocode
+from main.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Fill missing activity coordinates from the offline gazetteer and rebuild geohashes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-geocode activities that already have coordinates")
+
+    def handle(self, *args, **options):
+        queryset = Activity.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(latitude__isnull=True)
+
+        updated = 0
+        missing = 0
+        for pk, location in queryset.values_list('pk', 'location').iterator():
+            point = geocode(location)
+            if point is None:
+                missing += 1
+                continue
+            Activity.objects.filter(pk=pk).update(
+                latitude=point[0], longitude=point[1], geohash=encode_geohash(*point)
+            )
+            updated += 1
+
+        # rows whose coordinates came from organizer input but predate the geohash column
+        stale = Activity.objects.filter(latitude__isnull=False, longitude__isnull=False, geohash='')
+        for pk, latitude, longitude in stale.values_list('pk', 'latitude', 'longitude').iterator():
+            Activity.objects.filter(pk=pk).update(geohash=encode_geohash(latitude, longitude))
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Geocoded {updated} activities ({missing} locations not in the gazetteer)."))
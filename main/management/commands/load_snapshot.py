@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from main.snapshots import BATCH_SIZE, SnapshotError, load_snapshot
+
+
+class Command(BaseCommand):
+    help = "Replace the tables in a dump_snapshot file with its rows, without per-object saves or signals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows per INSERT")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Do not ask before replacing existing rows")
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            answer = input("This replaces every row in the tables the snapshot contains. Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError("Load cancelled.")
+        try:
+            count = load_snapshot(options['path'], using=options['database'], batch_size=options['batch_size'])
+        except (OSError, SnapshotError) as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Loaded {count} rows from {options['path']}."))
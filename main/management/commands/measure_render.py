@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from main.models import Activity
+
+
+class Command(BaseCommand):
+    help = "Time the heavy pages with and without template fragment caching"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--username', help="user to render the dashboard and detail page as (default: first user)")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first() if options['username'] else User.objects.first()
+        activity = Activity.objects.order_by('pk').first()
+        if user is None or activity is None:
+            raise CommandError("Load some data first (python manage.py loaddata fixtures/initial_data.json).")
+        pages = [
+            ('home', reverse('home')),
+            ('activity detail', reverse('activity_detail', args=[activity.pk])),
+            ('dashboard', reverse('user_dashboard')),
+        ]
+        uncached = {**settings.CACHES, 'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+        # page views write history rows and counters; throw them away afterwards
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver'], RATELIMIT_ENABLE=False):
+            client = Client()
+            client.force_login(user)
+            for name, url in pages:
+                with override_settings(CACHES=uncached):
+                    before = self.measure(client, url, options['iterations'])
+                after = self.measure(client, url, options['iterations'])
+                self.stdout.write(
+                    f"{name:<16} without fragments {before[0]:7.2f} ms {before[1]:3d} queries   "
+                    f"with fragments {after[0]:7.2f} ms {after[1]:3d} queries"
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, client, url, iterations):
+        """Median milliseconds and query count per request, after one warm-up request."""
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+        timings = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings), len(queries)
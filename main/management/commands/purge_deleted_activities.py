@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from main.deletion import BATCH_SIZE, PAUSE_SECONDS, purge_deleted_activities
+
+
+class Command(BaseCommand):
+    help = "Remove deleted activities, their registrations, ratings and media rows, and their media files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows deleted per transaction")
+        parser.add_argument('--pause', type=float, default=PAUSE_SECONDS,
+                            help="Seconds to wait between batches so other writers are not held up")
+
+    def handle(self, *args, **options):
+        count = purge_deleted_activities(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} deleted activities."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Update the daily organizer analytics rollups with everything written since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Rebuild every rollup instead of only changed activities (also picks up deletions)")
+
+    def handle(self, *args, **options):
+        count = refresh_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed analytics for {count} activities."))
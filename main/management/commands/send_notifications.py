@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main.notifications import BATCH_SIZE, REMINDER, REMINDER_WINDOW, UPDATE, send_notifications
+
+
+class Command(BaseCommand):
+    help = "Email registrants about activities starting within a day and about changed activities"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=REMINDER_WINDOW.total_seconds() / 3600,
+                            help="remind about activities starting within this many hours")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--rate', type=float, default=None,
+                            help="maximum messages per second (default: NOTIFICATION_MAX_PER_SECOND)")
+        parser.add_argument('--dry-run', action='store_true', help="count recipients without sending")
+
+    def handle(self, *args, **options):
+        counts = send_notifications(
+            window=timedelta(hours=options['hours']),
+            batch_size=options['batch_size'],
+            max_per_second=options['rate'],
+            dry_run=options['dry_run'],
+        )
+        verb = "Would send" if options['dry_run'] else "Sent"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts[REMINDER]} reminder(s) and {counts[UPDATE]} update notice(s)."
+        ))
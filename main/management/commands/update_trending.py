@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from main.trending import update_trending
+
+
+class Command(BaseCommand):
+    help = "Recompute time-decayed trending scores for upcoming activities"
+
+    def handle(self, *args, **options):
+        count = update_trending()
+        self.stdout.write(self.style.SUCCESS(f"Ranked {count} trending activities."))
@@ -0,0 +1,140 @@
+# main/media_gc.py
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db import models
+
+from .models import MediaBlob
+from .storage import HASHED_NAME_RE, add_reference
+
+logger = logging.getLogger(__name__)
+
+GRACE_HOURS = 24
+WORKERS = 8
+
+
+def _scan(directory):
+    files, subdirectories = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                files.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+    return files, subdirectories
+
+
+def walk_media(root, workers=WORKERS):
+    """Yield (path, mtime) for every file under `root`, scanning directories on a thread pool."""
+    if not os.path.isdir(root):
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirectories = future.result()
+                yield from files
+                pending |= {pool.submit(_scan, directory) for directory in subdirectories}
+
+
+def file_fields():
+    """(model, field) for every FileField kept in the default storage."""
+    return [
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and field.storage is default_storage
+    ]
+
+
+def referenced_names():
+    """How many rows point at each stored name, including rows hidden by default managers."""
+    counts = Counter()
+    for model, field in file_fields():
+        names = model._base_manager.exclude(**{f'{field.name}__isnull': True}).exclude(**{field.name: ''})
+        counts.update(names.values_list(field.name, flat=True).iterator(chunk_size=5000))
+    return counts
+
+
+def _remove(path, cutoff):
+    try:
+        # checked again here: an upload may have reused the file since the walk
+        if os.stat(path).st_mtime >= cutoff:
+            return 0
+        size = os.path.getsize(path)
+        os.unlink(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def collect_garbage(grace_hours=GRACE_HOURS, workers=WORKERS, dry_run=False):
+    """Delete files under MEDIA_ROOT that no row refers to and that are older than `grace_hours`.
+
+    Reference counts are corrected to the number of rows actually pointing at each file.
+    Returns (files removed, bytes freed).
+    """
+    root = os.path.abspath(settings.MEDIA_ROOT)
+    cutoff = time.time() - grace_hours * 3600
+    # list first: a file uploaded after this still has a fresh mtime and is left alone
+    files = [
+        (os.path.relpath(path, root).replace(os.sep, '/'), path)
+        for path, mtime in walk_media(root, workers)
+        if mtime < cutoff
+    ]
+    references = referenced_names()
+
+    if not dry_run:
+        for blob in MediaBlob.objects.iterator():
+            actual = references.get(blob.name, 0)
+            if blob.references != actual:
+                MediaBlob.objects.filter(name=blob.name).update(references=actual)
+    claimed = set(MediaBlob.objects.filter(references__gt=0).values_list('name', flat=True))
+    orphans = [(name, path) for name, path in files if name not in references and name not in claimed]
+    if dry_run:
+        return len(orphans), sum(os.path.getsize(path) for _, path in orphans)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sizes = list(pool.map(lambda orphan: _remove(orphan[1], cutoff), orphans))
+    removed = [name for (name, _), size in zip(orphans, sizes) if size]
+    MediaBlob.objects.filter(name__in=removed, references=0).delete()
+    logger.info("Removed %d unreferenced media files", len(removed))
+    return len(removed), sum(sizes)
+
+
+def adopt_legacy_files():
+    """Move files saved before content addressing to hashed names, so duplicates collapse.
+
+    The old files lose their references and are removed by the next collect_garbage.
+    Returns the number of rows updated.
+    """
+    adopted = {}
+    updated = 0
+    for model, field in file_fields():
+        rows = model._base_manager.exclude(**{f'{field.name}__isnull': True}).exclude(**{field.name: ''})
+        for pk, name in rows.values_list('pk', field.name).iterator(chunk_size=1000):
+            if HASHED_NAME_RE.search(name):
+                continue
+            if name in adopted:
+                add_reference(adopted[name], default_storage.size(adopted[name]))
+            else:
+                if not default_storage.exists(name):
+                    logger.warning("Skipping %s.%s %s: %s is missing", model.__name__, field.name, pk, name)
+                    continue
+                with default_storage.open(name) as handle:
+                    adopted[name] = default_storage.save(name, handle)
+            model._base_manager.filter(pk=pk).update(**{field.name: adopted[name]})
+            updated += 1
+    if updated:
+        # pages and fragments of any model may embed the old file URLs, not just activities
+        for cache in caches.all():
+            cache.clear()
+    return updated
@@ -0,0 +1,145 @@
+# main/media_serving.py
+import mimetypes
+import os
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+from .middleware import not_modified
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 256 * 1024
+
+
+class RangedFile:
+    """A file limited to `length` bytes from its current offset.
+
+    read() stops at the end of the range for servers that stream in blocks, while
+    fileno() lets wsgi.file_wrapper implementations that use sendfile (gunicorn) send
+    Content-Length bytes from the current offset without copying through Python.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+@lru_cache(maxsize=None)
+def _access_checks(paths):
+    return [import_string(path) for path in paths]
+
+
+def check_access(request, name):
+    """Run the MEDIA_ACCESS_CHECKS hooks; any of them may deny access.
+
+    Each hook is called as hook(request, name) with the path relative to MEDIA_ROOT and
+    returns False (or raises PermissionDenied) to refuse the file. Returns True when
+    at least one hook ran, i.e. the file may be private and must not be cached publicly.
+    """
+    checks = _access_checks(tuple(getattr(settings, 'MEDIA_ACCESS_CHECKS', ())))
+    for check in checks:
+        if check(request, name) is False:
+            raise PermissionDenied
+    return bool(checks)
+
+
+def parse_range(header, size):
+    """Return (start, end) for a single "bytes=" range, None to send the whole file,
+    or False when the range cannot be satisfied."""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # multiple ranges or other units: answering with the full body is allowed
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def media_response(request, name):
+    """Serve `name` from MEDIA_ROOT with Range/206, conditional requests and proxy offload."""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        stat = os.stat(path)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404("Media file not found")
+    if not os.path.isfile(path):
+        raise Http404("Media file not found")
+    private = check_access(request, name)
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{last_modified:x}-{size:x}"'
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    max_age = getattr(settings, 'MEDIA_MAX_AGE', 3600)
+    cache_control = f'private, max-age={max_age}' if private else f'public, max-age={max_age}'
+
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', None)
+    if not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    elif sendfile:
+        # the front proxy reads the file and handles Range itself; the worker is free at once
+        response = HttpResponse(content_type=content_type)
+        if sendfile == 'x-accel-redirect':
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + name
+        else:
+            response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if request.META.get('HTTP_RANGE') and (
+            not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified
+        ):
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+            response['Content-Length'] = str(size)
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(RangedFile(open(path, 'rb'), start, length), status=206, content_type=content_type)
+            response.block_size = BLOCK_SIZE
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = BLOCK_SIZE
+            response.headers.pop('Content-Disposition', None)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
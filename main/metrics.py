@@ -0,0 +1,404 @@
+# main/metrics.py
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; exited workers' files are then just kept
+    fcntl = None
+
+#url name of the request being handled, for metrics recorded outside the middleware
+current_view = contextvars.ContextVar('current_view', default='none')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value if not isinstance(value, list) else list(value)] for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram; values are stored as [bucket counts..., +Inf count, sum]."""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+
+REGISTRY = {}
+
+REQUESTS = Counter('eco_http_requests_total', 'Requests handled.', ['view', 'method', 'status'])
+REQUEST_LATENCY = Histogram('eco_http_request_duration_seconds', 'Time to produce a response.', ['view'])
+DB_QUERIES = Counter('eco_db_queries_total', 'SQL queries executed.', ['view'])
+DB_TIME = Counter('eco_db_query_seconds_total', 'Time spent executing SQL.', ['view'])
+TEMPLATE_RENDER = Histogram('eco_template_render_seconds', 'Time to render a page template.', ['template'])
+HISTORY_WRITES = Counter('eco_history_writes_total', 'UserHistory rows written.', ['view'])
+CACHE_REQUESTS = Counter('eco_cache_requests_total', 'Cache lookups by result.', ['cache', 'result'])
+UPLOAD_BYTES = Counter('eco_upload_bytes_total', 'Bytes of uploaded files received.', ['view'])
+
+
+#exposition
+def _merge(into, snapshot):
+    for name, rows in snapshot.items():
+        merged = into.setdefault(name, {})
+        for key, value in rows:
+            key = tuple(key)
+            if isinstance(value, list):
+                current = merged.get(key)
+                merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def local_snapshot():
+    return {name: metric.snapshot() for name, metric in REGISTRY.items()}
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for key, value in sorted(snapshot.get(name, {}).items()):
+            if metric.type == 'counter':
+                lines.append(f'{name}{_format_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            cumulative = 0
+            bounds = [_number(bound) for bound in metric.buckets] + ['+Inf']
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                labels = _format_labels(metric.labelnames, key, [f'le="{bound}"'])
+                lines.append(f'{name}_bucket{labels} {cumulative}')
+            labels = _format_labels(metric.labelnames, key)
+            lines.append(f'{name}_sum{labels} {_number(value[-1])}')
+            lines.append(f'{name}_count{labels} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+#multi-process aggregation: each worker writes its totals to METRICS_DIR and /metrics sums the files
+class SnapshotWriter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0
+        self._pid = None
+        self._filename = None
+
+    def filename(self):
+        # unique per process, so a reused pid never overwrites an exited worker's totals;
+        # checked on every write because workers may be forked after import
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._filename = f'{self._pid}-{uuid.uuid4().hex[:8]}.json'
+        return self._filename
+
+    def maybe_write(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        if time.monotonic() - self._last >= interval:
+            self.write()
+
+    def write(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last = time.monotonic()
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(local_snapshot(), handle)
+            os.replace(tmp, os.path.join(directory, self.filename()))
+        finally:
+            self._lock.release()
+
+
+snapshot_writer = SnapshotWriter()
+atexit.register(snapshot_writer.write)
+
+
+#files of exited workers are folded into this one, so scrapes do not read more files forever
+RETIRED_FILENAME = 'retired.json'
+_WORKER_FILENAME = re.compile(r'^(\d+)-[0-9a-f]+\.json$')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, but belongs to someone else
+    return True
+
+
+def _read_retired(directory):
+    try:
+        with open(os.path.join(directory, RETIRED_FILENAME)) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {'files': [], 'metrics': {}}
+
+
+@contextmanager
+def _directory_lock(directory, exclusive):
+    """Scrapes read under a shared lock and compaction holds it exclusively.
+
+    Yields False when the exclusive lock is busy (someone else is compacting).
+    """
+    if fcntl is None:
+        yield not exclusive
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def compact(directory):
+    """Merge the snapshot files of exited workers into RETIRED_FILENAME and remove them.
+
+    Returns the number of files folded in; 0 as well when another process is compacting.
+    """
+    with _directory_lock(directory, exclusive=True) as locked:
+        if not locked:
+            return 0
+        retired = _read_retired(directory)
+        dead = []
+        for entry in os.scandir(directory):
+            match = _WORKER_FILENAME.match(entry.name)
+            if match and not _pid_alive(int(match.group(1))):
+                dead.append(entry.name)
+        # files listed in the retired file are already in it; they outlived an interrupted compaction
+        fresh = [name for name in dead if name not in retired['files']]
+        if fresh:
+            merged = {}
+            _merge(merged, retired['metrics'])
+            for name in fresh:
+                try:
+                    with open(os.path.join(directory, name)) as handle:
+                        _merge(merged, json.load(handle))
+                except (OSError, ValueError):
+                    continue
+            retired = {
+                'files': fresh,
+                'metrics': {name: [[list(key), value] for key, value in rows.items()] for name, rows in merged.items()},
+            }
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as handle:
+                json.dump(retired, handle)
+            os.replace(tmp, os.path.join(directory, RETIRED_FILENAME))
+        for name in dead:
+            os.remove(os.path.join(directory, name))
+    return len(fresh)
+
+
+def collect():
+    """Totals for every worker sharing METRICS_DIR, or just this process without one.
+
+    Exited workers stay counted through the retired file, so counters never go backwards.
+    """
+    directory = getattr(settings, 'METRICS_DIR', None)
+    merged = {}
+    if not directory:
+        _merge(merged, local_snapshot())
+        return merged
+    snapshot_writer.write()
+    compact(directory)
+    with _directory_lock(directory, exclusive=False):
+        retired = _read_retired(directory)
+        _merge(merged, retired['metrics'])
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.json') and entry.name != RETIRED_FILENAME and entry.name not in retired['files']:
+                try:
+                    with open(entry.path) as handle:
+                        _merge(merged, json.load(handle))
+                except (OSError, ValueError):
+                    continue  # a file being replaced; its worker is counted on the next scrape
+    return merged
+
+
+#instrumentation
+class MetricsMiddleware:
+    """Request rate, latency, SQL count and time, and upload bytes, labeled by URL name.
+
+    Latency of streaming responses is the time to the first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set('unmatched')
+        stats = {'queries': 0, 'seconds': 0.0}
+
+        def record_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['seconds'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            current_view.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(elapsed, view=view)
+        DB_QUERIES.inc(stats['queries'], view=view)
+        DB_TIME.inc(stats['seconds'], view=view)
+        # only count files the view actually parsed
+        files = getattr(request, '_files', None)
+        if files:
+            UPLOAD_BYTES.inc(sum(upload.size for upload in files.values()), view=view)
+        snapshot_writer.maybe_write()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        current_view.set(match.url_name or match.view_name)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_RENDER.observe(
+                time.perf_counter() - started, template=self.template.origin.template_name or '<string>')
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that times every top-level template render."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class InstrumentedCacheMixin:
+    """Counts hits and misses of get and get_many (get_or_set uses get) for any cache backend.
+
+    Mix it in ahead of the backend class; the `cache` label is the entry's METRICS_LABEL.
+    """
+
+    _missing = object()
+    _batch = threading.local()
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self.label = params.get('METRICS_LABEL', 'default')
+
+    def _count(self, hits, misses):
+        if hits:
+            CACHE_REQUESTS.inc(hits, cache=self.label, result='hit')
+        if misses:
+            CACHE_REQUESTS.inc(misses, cache=self.label, result='miss')
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self._missing, version)
+        if not getattr(self._batch, 'active', False):
+            self._count(value is not self._missing, value is self._missing)
+        return default if value is self._missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        # backends without their own get_many go through get; count those keys once, here
+        self._batch.active = True
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            self._batch.active = False
+        self._count(len(found), len(keys) - len(found))
+        return found
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class InstrumentedPyMemcacheCache(InstrumentedCacheMixin, PyMemcacheCache):
+    pass
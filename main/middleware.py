@@ -0,0 +1,114 @@
+# main/middleware.py
+import mimetypes
+import os
+import posixpath
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+#preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+StaticFile = namedtuple('StaticFile', 'variants content_type last_modified immutable')
+
+
+def not_modified(request, etag, last_modified):
+    """True when the client's copy is current; If-None-Match wins over If-Modified-Since (RFC 9110)."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in parse_etags(if_none_match)
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return since is not None and last_modified <= since
+
+
+class StaticFilesMiddleware:
+    """Serve collected files from STATIC_ROOT before the rest of the stack runs.
+
+    Manifest-hashed names are cached forever; the smallest precompressed variant the
+    client accepts (.br, then .gz) is sent with Vary: Accept-Encoding. Responses are
+    FileResponses, so servers with wsgi.file_wrapper (gunicorn, uWSGI) send them with
+    sendfile. The file index is built lazily and lives for the life of the process, so
+    restart workers after collectstatic, as for any code deploy.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = settings.STATIC_ROOT
+        self.prefix = urlsplit(settings.STATIC_URL or '').path
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+        self._files = {}
+
+    def __call__(self, request):
+        if self.root and self.prefix and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def find(self, name):
+        if name in self._files:
+            return self._files[name]
+        normalized = posixpath.normpath(name).lstrip('/')
+        if normalized != name or normalized.startswith('..') or name.endswith(('.gz', '.br')):
+            return None
+        try:
+            path = safe_join(self.root, name)
+            stat = os.stat(path)
+        except (ValueError, OSError):
+            return None
+        if not os.path.isfile(path):
+            return None
+        variants = {None: (path, stat.st_size)}
+        for encoding, suffix in ENCODINGS:
+            try:
+                variants[encoding] = (path + suffix, os.stat(path + suffix).st_size)
+            except OSError:
+                pass
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'image/svg+xml'):
+            content_type += '; charset=utf-8'
+        hashed_names = getattr(staticfiles_storage, 'hashed_files', {})
+        entry = StaticFile(
+            variants=variants,
+            content_type=content_type,
+            last_modified=int(stat.st_mtime),
+            immutable=name in hashed_names.values(),
+        )
+        self._files[name] = entry
+        return entry
+
+    def serve(self, request, name):
+        entry = self.find(name)
+        if entry is None:
+            return None
+        accepted = {
+            token.split(';')[0].strip().lower()
+            for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+        }
+        encoding = next((enc for enc, _ in ENCODINGS if enc in accepted and enc in entry.variants), None)
+        path, size = entry.variants[encoding]
+        etag = f'"{entry.last_modified:x}-{size:x}{"-" + encoding if encoding else ""}"'
+
+        if not_modified(request, etag, entry.last_modified):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=entry.content_type)
+            response['Content-Length'] = str(size)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=entry.content_type)
+            response.headers.pop('Content-Disposition', None)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry.last_modified)
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if entry.immutable else f'public, max-age={self.max_age}'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(entry.variants) > 1:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
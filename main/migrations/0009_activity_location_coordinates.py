@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:16
+
+from django.db import migrations, models
+
+from main.geo import encode_geohash, geocode
+
+
+def fill_coordinates(apps, schema_editor):
+    Activity = apps.get_model('main', 'Activity')
+    for activity in Activity.objects.only('id', 'location').iterator():
+        point = geocode(activity.location)
+        if point:
+            Activity.objects.filter(pk=activity.pk).update(
+                latitude=point[0], longitude=point[1], geohash=encode_geohash(*point)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_alter_rating_comment_alter_rating_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingActivity',
+            fields=[
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='main.activity')),
+                ('score', models.FloatField(db_index=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('registrations', models.PositiveIntegerField(default=0)),
+                ('ratings', models.PositiveIntegerField(default=0)),
+                ('activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='main.activity')),
+            ],
+            options={
+                'unique_together': {('activity', 'hour')},
+            },
+        ),
+    ]
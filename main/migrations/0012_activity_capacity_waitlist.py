@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Activity = apps.get_model('main', 'Activity')
+    Registration = apps.get_model('main', 'Registration')
+    joined = (
+        Registration.objects.filter(joined_activity=models.OuterRef('pk'), status='joined')
+        .order_by()
+        .values('joined_activity')
+        .annotate(total=models.Count('pk'))
+        .values('total')
+    )
+    Activity.objects.update(seats_taken=Coalesce(models.Subquery(joined), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_trending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave blank for unlimited seats', null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='waitlisted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='registration',
+            name='status',
+            field=models.CharField(choices=[('joined', 'Joined'), ('waitlisted', 'Waitlisted'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='joined', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['joined_activity', 'status', 'waitlisted_at'], name='registration_waitlist_idx'),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def build_summaries(apps, schema_editor):
+    Rating = apps.get_model('main', 'Rating')
+    RatingSummary = apps.get_model('main', 'RatingSummary')
+    counts = {f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in range(1, 6)}
+    rows = Rating.objects.values('activity_id').annotate(comments=Count('pk'), **counts).order_by()
+    RatingSummary.objects.bulk_create([RatingSummary(**row) for row in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_notifications'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingSummary',
+            fields=[
+                ('activity', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='main.activity')),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['activity', '-created_at', '-id'], name='rating_activity_page_idx'),
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min, Q
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+
+def set_covers(apps, schema_editor):
+    Activity = apps.get_model('main', 'Activity')
+    Media = apps.get_model('main', 'Media')
+    images = Q()
+    for extension in IMAGE_EXTENSIONS:
+        images |= Q(file__iendswith=extension)
+    covers = Media.objects.filter(images).values('activity_id').annotate(cover_id=Min('pk')).order_by()
+    for row in covers:
+        Activity.objects.filter(pk=row['activity_id']).update(cover_id=row['cover_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_rating_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='cover',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.media'),
+        ),
+        migrations.AddIndex(
+            model_name='media',
+            index=models.Index(fields=['activity', '-created_at', '-id'], name='media_activity_page_idx'),
+        ),
+        migrations.RunPython(set_covers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_activity_cover'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True)),
+                ('sql', models.TextField(help_text='Normalized statement')),
+                ('sample_params', models.TextField(blank=True, help_text='Parameters of the latest occurrence, redacted')),
+                ('view', models.CharField(blank=True, max_length=100)),
+                ('location', models.CharField(blank=True, help_text='Calling file, line and function', max_length=255)),
+                ('plan', models.TextField(blank=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('samples', models.JSONField(default=list)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
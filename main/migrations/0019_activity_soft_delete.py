@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
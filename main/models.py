@@ -1,5 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .geo import encode_geohash, geocode
 
 
 #user profile
@@ -10,10 +15,41 @@ class Profile(models.Model):
     is_organizer = models.BooleanField(default=False)
     organization_name = models.CharField(max_length=200, blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # a replaced photo's file is released once the new one is saved
+        instance._loaded_photo = instance.__dict__.get('user_photo')
+        return instance
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
 
+# rows in the hot partial indexes: neither archived nor deleted
+HOT = models.Q(archived_at__isnull=True, deleted_at__isnull=True)
+
+
+class ActivityQuerySet(models.QuerySet):
+    def hot(self):
+        """Activities not yet archived, the rows covered by the hot partial indexes."""
+        return self.filter(archived_at__isnull=True)
+
+    def upcoming(self, now=None):
+        # upcoming events are never archived, so this only reads the hot indexes
+        return self.hot().filter(date__gte=now or timezone.now())
+
+    def past(self, now=None):
+        return self.filter(date__lt=now or timezone.now())
+
+
+class ActivityManager(models.Manager.from_queryset(ActivityQuerySet)):
+    """Activities that have not been deleted; `Activity.all_objects` also sees those awaiting purge."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 #environmental activities and events
 class Activity(models.Model):
     CATEGORY_CHOICES = [
@@ -29,11 +65,102 @@ class Activity(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     location = models.CharField(max_length=200)
-    date = models.DateTimeField()
+    date = models.DateTimeField(db_index=True)
     is_featured = models.BooleanField(default=False, help_text="Mark as featured to show on homepage (staff only)")
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
+    capacity = models.PositiveIntegerField(blank=True, null=True, help_text="Leave blank for unlimited seats")
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities_created')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # when the title, place or time last changed; registrants are told about it once per change
+    details_changed_at = models.DateTimeField(blank=True, null=True, db_index=True, editable=False)
+    # first uploaded image, kept by main.gallery so cards and headers need no media query
+    cover = models.ForeignKey('Media', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', editable=False)
+    # set by main.deletion; the row and everything hanging off it are removed later in batches
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False)
+    # set by main.archive once the event is long past; its frozen totals are in ActivityArchive
+    archived_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    objects = ActivityManager()
+    all_objects = models.Manager.from_queryset(ActivityQuerySet)()
+
+    class Meta:
+        indexes = [
+            # hot rows only, so upcoming queries stay the same size however much history piles up
+            models.Index(fields=['date'], condition=HOT, name='activity_hot_date_idx'),
+            models.Index(fields=['category', 'date'], condition=HOT, name='activity_hot_category_idx'),
+            models.Index(fields=['is_featured', 'date'], condition=HOT, name='activity_hot_featured_idx'),
+            # only the few rows waiting for purge; an index of the NULLs would match every live row
+            models.Index(fields=['deleted_at'], condition=models.Q(deleted_at__isnull=False), name='activity_deleted_idx'),
+        ]
+
+    NOTIFY_FIELDS = ('title', 'location', 'date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_details = {name: instance.__dict__.get(name) for name in cls.NOTIFY_FIELDS}
+        instance._loaded_point = (instance.__dict__.get('latitude'), instance.__dict__.get('longitude'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_details', None)
+        if not self._state.adding and loaded and any(getattr(self, name) != loaded[name] for name in self.NOTIFY_FIELDS):
+            self.details_changed_at = timezone.now()
+        # fill coordinates from the offline gazetteer when the organizer gave none, and again
+        # when the place moves, unless the coordinates were edited along with it
+        loaded_point = getattr(self, '_loaded_point', None)
+        moved = (
+            loaded is not None and self.location != loaded['location']
+            and (self.latitude, self.longitude) == loaded_point
+        )
+        if self.latitude is None or self.longitude is None:
+            self.latitude, self.longitude = geocode(self.location) or (None, None)
+        elif moved:
+            point = geocode(self.location)
+            if point is None and geocode(loaded['location']) != loaded_point:
+                # the organizer's own coordinates; an unlisted new name (a typo fix, a room number) keeps them
+                point = loaded_point
+            self.latitude, self.longitude = point or (None, None)
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        # registrants' cached counts depend on the date; signals.activity_changed invalidates them
+        self._rescheduled = loaded is not None and self.date != loaded['date']
+        # a new date brings an archived event back; the next archive run takes it again if still old
+        unarchived = self.archived_at is not None and self._rescheduled
+        if unarchived:
+            self.archived_at = None
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # seats_taken is only changed by the conditional UPDATEs in main.seating, deleted_at
+            # by main.deletion and archived_at by main.archive; writing back a stale copy would undo them
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('seats_taken', 'deleted_at', 'archived_at')
+            ]
+        if unarchived and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'archived_at']
+        if moved and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'latitude', 'longitude', 'geohash']
+        super().save(*args, **kwargs)
+        if unarchived:
+            ActivityArchive.objects.filter(activity_id=self.pk).delete()
+        self._loaded_details = {name: getattr(self, name) for name in self.NOTIFY_FIELDS}
+        self._loaded_point = (self.latitude, self.longitude)
+
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.seats_taken >= self.capacity
+
+    @property
+    def seats_left(self):
+        if self.capacity is None:
+            return None
+        return max(0, self.capacity - self.seats_taken)
 
     def __str__(self):
         return f"{self.title} ({self.category})"
@@ -44,13 +171,32 @@ class Media(models.Model):
     activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='media')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_media')
     file = models.FileField(upload_to='activity_media/')
+    # bytes, counted against the uploader's MEDIA_USER_QUOTA_BYTES
+    size = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+    VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+    class Meta:
+        indexes = [
+            # newest-first gallery pages for one activity
+            models.Index(fields=['activity', '-created_at', '-id'], name='media_activity_page_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.size and self.file:
+            try:
+                self.size = self.file.size
+            except OSError:
+                pass
+        super().save(*args, **kwargs)
+
     def is_image(self):
-        return self.file.name.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
+        return self.file.name.lower().endswith(self.IMAGE_EXTENSIONS)
 
     def is_video(self):
-        return self.file.name.lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))
+        return self.file.name.lower().endswith(self.VIDEO_EXTENSIONS)
 
     def __str__(self):
         return f"Media for {self.activity.title} by {self.created_by.username}"
@@ -60,6 +206,7 @@ class Media(models.Model):
 class Registration(models.Model):
     STATUS_CHOICES = [
         ('joined', 'Joined'),
+        ('waitlisted', 'Waitlisted'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
@@ -67,15 +214,37 @@ class Registration(models.Model):
     joined_activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='registrations')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='registrations')
     joined_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='joined')
+    waitlisted_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         unique_together = ('joined_activity', 'user')  # prevent duplicate joins
+        indexes = [
+            models.Index(fields=['joined_activity', 'status', 'waitlisted_at'], name='registration_waitlist_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} joined {self.joined_activity.title} ({self.status})"
 
 
+#a resumable upload in progress; its bytes sit in UPLOAD_TEMP_DIR/<id>.part until the last chunk arrives
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='upload_sessions')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # taken from the file's first bytes, not its name
+    extension = models.CharField(max_length=10, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.filename}: {self.received}/{self.size} bytes"
+
+
 class UserHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='history')
     action = models.CharField(max_length=255)
@@ -110,14 +279,223 @@ class Rating(models.Model):
     rating = models.IntegerField(choices=RATING_CHOICES, blank=True, null=True)
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         unique_together = ('activity', 'user')
         ordering = ['-created_at']
+        indexes = [
+            # newest-first comment pages for one activity
+            models.Index(fields=['activity', '-created_at', '-id'], name='rating_activity_page_idx'),
+        ]
     
     def __str__(self):
         if self.rating:
             return f"{self.user.username} - {self.rating} stars for {self.activity.title}"
         else:
             return f"{self.user.username} - comment for {self.activity.title}"
+
+
+#star histogram and comment count per activity, kept in step with Rating by signals
+class RatingSummary(models.Model):
+    activity = models.OneToOneField(Activity, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    def counts(self):
+        return [getattr(self, f'stars_{stars}') for stars in range(1, 6)]
+
+    @property
+    def total(self):
+        return sum(self.counts())
+
+    @property
+    def average(self):
+        total = self.total
+        if not total:
+            return 0
+        return sum(stars * count for stars, count in enumerate(self.counts(), 1)) / total
+
+    def histogram(self):
+        """(stars, count, percent) rows from five stars down to one."""
+        total = self.total
+        return [
+            (stars, count, round(100 * count / total) if total else 0)
+            for stars, count in reversed(list(enumerate(self.counts(), 1)))
+        ]
+
+    def __str__(self):
+        return f"{self.activity_id}: {self.total} ratings"
+
+
+#totals of an archived activity, frozen by main.archive so its pages skip the per-row tables
+class ActivityArchive(models.Model):
+    activity = models.OneToOneField(Activity, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    participants = models.PositiveIntegerField(default=0)
+    media_count = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.activity_id}: archived {self.archived_at:%Y-%m-%d}"
+
+
+#top-K "people who joined this also joined" neighbors, rebuilt by build_recommendations
+class ActivityRecommendation(models.Model):
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('activity', 'rank')
+        ordering = ['activity', 'rank']
+
+    def __str__(self):
+        return f"{self.activity_id} -> {self.recommended_id} (#{self.rank})"
+
+
+#high-water marks for incremental background jobs
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+#per-activity engagement counts bucketed by hour, written in batches by main.trending
+class ActivityCounter(models.Model):
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='counters')
+    hour = models.DateTimeField(db_index=True)
+    views = models.PositiveIntegerField(default=0)
+    registrations = models.PositiveIntegerField(default=0)
+    ratings = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('activity', 'hour')
+
+    def __str__(self):
+        return f"{self.activity_id} @ {self.hour}: {self.views} views"
+
+
+#precomputed time-decayed trending score, rebuilt by update_trending
+class TrendingActivity(models.Model):
+    activity = models.OneToOneField(Activity, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(db_index=True)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-score']
+
+    def __str__(self):
+        return f"{self.activity_id}: {self.score:.2f}"
+
+
+#sent-ledger for reminder and change emails, so reruns of send_notifications never repeat a message
+class NotificationLog(models.Model):
+    KIND_CHOICES = [
+        ('reminder', 'Reminder'),
+        ('update', 'Update'),
+    ]
+
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='notifications')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # the activity date (reminders) or details_changed_at (updates) the message was about
+    revision = models.DateTimeField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('activity', 'user', 'kind', 'revision')
+
+    def __str__(self):
+        return f"{self.kind} for {self.activity_id} to {self.user_id}"
+
+
+#daily engagement per activity and per organizer, rebuilt incrementally by main.analytics
+class DailyStats(models.Model):
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    registrations = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    ratings = models.PositiveIntegerField(default=0)
+    # sum of the stars given that day; the average is rating_total / ratings
+    rating_total = models.PositiveIntegerField(default=0)
+
+    FIELDS = ('views', 'registrations', 'cancellations', 'ratings', 'rating_total')
+
+    class Meta:
+        abstract = True
+
+
+class ActivityDailyStats(DailyStats):
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='daily_stats')
+    # the activity's creator, copied so an organizer's rows are one index range
+    organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('activity', 'day')
+        indexes = [models.Index(fields=['organizer', 'day'], name='activity_stats_organizer_idx')]
+        verbose_name_plural = 'activity daily stats'
+
+    def __str__(self):
+        return f"{self.activity_id} on {self.day}"
+
+
+class OrganizerDailyStats(DailyStats):
+    organizer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+
+    class Meta:
+        unique_together = ('organizer', 'day')
+        verbose_name_plural = 'organizer daily stats'
+
+    def __str__(self):
+        return f"{self.organizer_id} on {self.day}"
+
+
+#uploaded files stored by main.storage.ContentAddressedStorage, with the number of rows using each
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.references} refs)"
+
+
+#statements slower than SLOW_QUERY_THRESHOLD_MS, one row per normalized SQL shape; written by main.slow_queries
+class SlowQuery(models.Model):
+    fingerprint = models.CharField(max_length=40, unique=True)
+    sql = models.TextField(help_text="Normalized statement")
+    sample_params = models.TextField(blank=True, help_text="Parameters of the latest occurrence, redacted")
+    view = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=255, blank=True, help_text="Calling file, line and function")
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    # the most recent durations, for percentiles
+    samples = models.JSONField(default=list)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = 'slow queries'
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def __str__(self):
+        return f"{self.fingerprint}: {self.count} x, max {self.max_ms:.0f} ms"
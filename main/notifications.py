@@ -0,0 +1,112 @@
+# main/notifications.py
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Activity, NotificationLog, Registration
+
+REMINDER = 'reminder'
+UPDATE = 'update'
+REMINDER_WINDOW = timedelta(hours=24)
+BATCH_SIZE = 500
+
+
+def reminder_activities(now=None, window=REMINDER_WINDOW):
+    """Activities starting within `window`, found with a range scan on the date index."""
+    now = now or timezone.now()
+    return Activity.objects.upcoming(now).filter(date__lt=now + window).order_by('date')
+
+
+def changed_activities(now=None):
+    """Upcoming activities whose title, place or time changed after they were created."""
+    now = now or timezone.now()
+    return Activity.objects.upcoming(now).filter(details_changed_at__isnull=False).order_by('date')
+
+
+def revision_for(activity, kind):
+    # a moved event gets a new reminder; every change gets its own update
+    return activity.date if kind == REMINDER else activity.details_changed_at
+
+
+def pending_recipients(activity, kind, batch_size=BATCH_SIZE):
+    """Yield lists of (user_id, email, username) for joined registrants not yet sent this message.
+
+    Pages through registrations by primary key, so memory stays bounded by `batch_size` no
+    matter how many people registered, and a page never holds a cursor open while mail is sent.
+    """
+    sent = NotificationLog.objects.filter(
+        activity=activity, user=OuterRef('user'), kind=kind, revision=revision_for(activity, kind),
+    )
+    registrations = (
+        Registration.objects.filter(joined_activity=activity, status='joined')
+        .exclude(user__email='')
+        .filter(~Exists(sent))
+        .order_by('pk')
+    )
+    if kind == UPDATE:
+        # people who joined after the change already saw the new details
+        registrations = registrations.filter(joined_at__lt=activity.details_changed_at)
+    last_pk = 0
+    while True:
+        page = list(registrations.filter(pk__gt=last_pk).values_list('pk', 'user_id', 'user__email', 'user__username')[:batch_size])
+        if not page:
+            return
+        last_pk = page[-1][0]
+        yield [row[1:] for row in page]
+
+
+def build_message(activity, kind, email, username, connection):
+    when = timezone.localtime(activity.date).strftime("%B %d, %Y at %I:%M %p")
+    link = getattr(settings, 'SITE_URL', '').rstrip('/') + reverse('activity_detail', args=[activity.pk])
+    if kind == REMINDER:
+        subject = f"Reminder: {activity.title} starts soon"
+        intro = "This is a reminder that an activity you registered for starts within a day."
+    else:
+        subject = f"Updated: {activity.title}"
+        intro = "The organizer changed the details of an activity you registered for."
+    body = f"Hi {username},\n\n{intro}\n\n{activity.title}\nWhen: {when}\nWhere: {activity.location}\n\n{link}\n"
+    return EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [email], connection=connection)
+
+
+def send_for_activity(activity, kind, connection, batch_size=BATCH_SIZE, max_per_second=None, dry_run=False):
+    """Send one kind of message to everyone registered for `activity`; returns the number sent.
+
+    Each batch goes out over the shared `connection` and is written to the ledger as soon as
+    the backend accepts it, so a rerun after a failure resumes instead of repeating.
+    """
+    revision = revision_for(activity, kind)
+    sent = 0
+    started = time.monotonic()
+    for recipients in pending_recipients(activity, kind, batch_size):
+        if not dry_run:
+            messages = [build_message(activity, kind, email, username, connection) for _, email, username in recipients]
+            connection.send_messages(messages)
+            NotificationLog.objects.bulk_create(
+                [NotificationLog(activity=activity, user_id=user_id, kind=kind, revision=revision) for user_id, _, _ in recipients],
+                ignore_conflicts=True,
+            )
+        sent += len(recipients)
+        if max_per_second:
+            # throttle to the provider's send rate
+            ahead = sent / max_per_second - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+    return sent
+
+
+def send_notifications(now=None, window=REMINDER_WINDOW, batch_size=BATCH_SIZE, max_per_second=None, dry_run=False):
+    """Send due reminders and change notices over one mail connection; returns {kind: count}."""
+    now = now or timezone.now()
+    if max_per_second is None:
+        max_per_second = getattr(settings, 'NOTIFICATION_MAX_PER_SECOND', None)
+    counts = {REMINDER: 0, UPDATE: 0}
+    with get_connection() as connection:
+        for kind, activities in ((UPDATE, changed_activities(now)), (REMINDER, reminder_activities(now, window))):
+            for activity in activities.iterator():
+                counts[kind] += send_for_activity(activity, kind, connection, batch_size, max_per_second, dry_run)
+    return counts
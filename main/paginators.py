@@ -0,0 +1,59 @@
+# main/paginators.py
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimate_table_rows(model, using='default'):
+    """Return a cheap row-count estimate for `model`'s table, or None if unavailable."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    [table],
+                )
+            elif connection.vendor == 'sqlite':
+                # rowid lookups hit the end of the b-tree; deleted rows make this an overestimate
+                cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def is_unfiltered(queryset):
+    """True when `queryset` filters nothing beyond what its model's default manager always does.
+
+    Activity's manager hides soft-deleted rows, which are few; the table estimate covers it.
+    """
+    where = queryset.query.where
+    return not where or where == queryset.model._default_manager.all().query.where
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that skips the exact COUNT(*) on large, unfiltered tables.
+
+    Filtered querysets are still counted exactly; so are tables whose estimate is
+    below ADMIN_ESTIMATED_COUNT_THRESHOLD, where COUNT(*) is cheap anyway.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if getattr(queryset, 'query', None) is not None and is_unfiltered(queryset):
+            threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+            estimate = estimate_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,40 @@
+# main/paging.py
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class Page(NamedTuple):
+    objects: list
+    next_cursor: str
+
+
+def encode_cursor(obj):
+    """URL-safe position of a row: its created_at in microseconds since the epoch, and pk."""
+    return f'{(obj.created_at - EPOCH) // timedelta(microseconds=1)}_{obj.pk}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor from encode_cursor into (created_at, pk), or None if it is malformed."""
+    micros, _, pk = (cursor or '').partition('_')
+    try:
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+def keyset_page(queryset, after=None, size=10):
+    """Newest-first rows of `queryset`, starting after the (created_at, pk) position `after`.
+
+    Keyset paging keeps every page one indexed range scan, however deep the reader goes.
+    """
+    queryset = queryset.order_by('-created_at', '-pk')
+    if after is not None:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(queryset[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else ''
+    return Page(rows[:size], next_cursor)
@@ -0,0 +1,80 @@
+# main/ratelimit.py
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parse "30/m" or "5/10s" into (requests, period_seconds)."""
+    count, _, period = rate.partition('/')
+    multiplier = period.rstrip('smhd') or '1'
+    return int(count), int(multiplier) * PERIODS[period[-1]]
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # the proxy that sets this header is trusted to append the real client address last
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request, key):
+    if key == 'user' or (key == 'user_or_ip' and request.user.is_authenticated):
+        if request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def count_request(bucket, limit, period, now=None):
+    """Count one request against `bucket`; returns seconds to wait, or 0 if the request may proceed.
+
+    A bucket allows `limit` requests in each fixed window of `period` seconds. The count is a
+    cache incr, so it is atomic across processes sharing the cache and takes one round trip;
+    only the first request of a window also adds the key. Around a window boundary a client
+    can get up to twice `limit` requests through.
+    """
+    cache = caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+    now = time.time() if now is None else now
+    window = int(now // period)
+    key = f'ratelimit:{bucket}:{window}'
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # outlives the window, so a late request never restarts its count
+        cache.add(key, 0, math.ceil(period) + 1)
+        count = cache.incr(key)
+    if count <= limit:
+        return 0
+    return max(1, math.ceil((window + 1) * period - now))
+
+
+def ratelimit(rate, key='user_or_ip', methods=None):
+    """Limit a view to `rate` requests per client, answering 429 with Retry-After when exceeded.
+
+    `key` is 'ip', 'user' or 'user_or_ip'; `methods` restricts limiting to those HTTP methods.
+    """
+    limit, period = parse_rate(rate)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if getattr(settings, 'RATELIMIT_ENABLE', True) and (methods is None or request.method in methods):
+                name = request.resolver_match.url_name if request.resolver_match else view_func.__name__
+                retry_after = count_request(f'{name}:{client_key(request, key)}', limit, period)
+                if retry_after:
+                    response = HttpResponse(
+                        "Too many requests. Please slow down and try again shortly.",
+                        status=429, content_type='text/plain; charset=utf-8',
+                    )
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view_func(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,34 @@
+# main/ratings.py
+from django.db.models import Count, Q
+
+from .models import Rating, RatingSummary
+from .paging import keyset_page
+
+COMMENTS_PAGE_SIZE = 10
+
+
+def summary_counts(activity_id):
+    """Star histogram and comment count for one activity, in a single aggregate."""
+    counts = {f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in range(1, 6)}
+    return Rating.objects.filter(activity_id=activity_id).aggregate(comments=Count('pk'), **counts)
+
+
+def refresh_summary(activity_id, create=True):
+    """Recompute the stored summary; `create=False` only updates an existing row (used on deletes)."""
+    counts = summary_counts(activity_id)
+    updated = RatingSummary.objects.filter(activity_id=activity_id).update(**counts)
+    if not updated and create:
+        RatingSummary.objects.update_or_create(activity_id=activity_id, defaults=counts)
+
+
+def get_summary(activity):
+    """The stored summary, or an empty unsaved one for activities nobody has rated."""
+    try:
+        return activity.rating_summary
+    except RatingSummary.DoesNotExist:
+        return RatingSummary(activity=activity)
+
+
+def comment_page(activity, after=None, size=COMMENTS_PAGE_SIZE):
+    """Newest-first comments with their users, starting after the cursor position `after`."""
+    return keyset_page(Rating.objects.filter(activity=activity).select_related('user'), after, size)
@@ -0,0 +1,158 @@
+# main/recommendations.py
+from array import array
+
+import numpy as np
+from scipy import sparse
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Activity, ActivityRecommendation, JobCheckpoint, Registration
+
+TOP_K = 10
+BLOCK_SIZE = 512
+READ_CHUNK_SIZE = 10000
+#last time a registration row was deleted outright
+DELETED_CHECKPOINT = 'recommendations.deleted'
+
+
+def load_registration_matrix():
+    """Stream joined registrations into a sparse users x activities matrix.
+
+    Returns (matrix, activity_ids) where column j of the matrix is activity_ids[j].
+    Pairs are buffered in typed arrays, so memory is a few bytes per registration.
+    """
+    users = array('q')
+    items = array('q')
+    pairs = Registration.objects.filter(status='joined').values_list('user_id', 'joined_activity_id')
+    for user_id, activity_id in pairs.iterator(chunk_size=READ_CHUNK_SIZE):
+        users.append(user_id)
+        items.append(activity_id)
+
+    user_ids, rows = np.unique(np.frombuffer(users, dtype=np.int64), return_inverse=True)
+    activity_ids, cols = np.unique(np.frombuffer(items, dtype=np.int64), return_inverse=True)
+    del users, items
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(user_ids), len(activity_ids)),
+    )
+    return matrix, activity_ids
+
+
+def iter_neighbors(matrix, activity_ids, columns, top_k=TOP_K, block_size=BLOCK_SIZE):
+    """Yield (activity_id, [(neighbor_id, score), ...]) for each column index in `columns`.
+
+    Scores are cosine similarities of co-registration vectors. Columns are processed in
+    blocks, so only a block_size x n_activities slice of X^T X is ever materialized.
+    """
+    by_column = matrix.tocsc()
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    columns = np.asarray(columns, dtype=np.int64)
+
+    for start in range(0, len(columns), block_size):
+        block = columns[start:start + block_size]
+        co_counts = (by_column[:, block].T @ matrix).tocsr()
+        for row, column in enumerate(block):
+            begin, end = co_counts.indptr[row], co_counts.indptr[row + 1]
+            neighbors = co_counts.indices[begin:end]
+            counts = co_counts.data[begin:end]
+            keep = neighbors != column
+            neighbors, counts = neighbors[keep], counts[keep]
+            if not len(neighbors):
+                yield int(activity_ids[column]), []
+                continue
+            scores = counts / (norms[column] * norms[neighbors])
+            if len(scores) > top_k:
+                best = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                best = np.arange(len(scores))
+            best = best[np.argsort(-scores[best], kind='stable')]
+            yield int(activity_ids[column]), [
+                (int(activity_ids[neighbors[i]]), float(scores[i])) for i in best
+            ]
+
+
+def affected_activity_ids(since):
+    """Activities whose neighbor lists may change after registrations updated since `since`.
+
+    A changed registration on activity A changes A's norm, so every score against A moves:
+    A itself, every activity sharing a registrant with A, and every activity that listed A
+    are affected. Returns None when registrations were deleted since `since`; deleted rows
+    leave no trace to diff against, so only a full rebuild is correct then.
+    """
+    if JobCheckpoint.objects.filter(name=DELETED_CHECKPOINT, value__gte=since).exists():
+        return None
+    changed = Registration.objects.filter(updated_at__gte=since).values('joined_activity_id')
+    registrants = Registration.objects.filter(joined_activity_id__in=changed, status='joined').values('user_id')
+    affected = set(
+        Registration.objects.filter(user_id__in=registrants, status='joined')
+        .values_list('joined_activity_id', flat=True)
+        .distinct()
+    )
+    affected.update(changed.values_list('joined_activity_id', flat=True).distinct())
+    # neighbors that share nobody with A any more still list it until they are recomputed
+    affected.update(
+        ActivityRecommendation.objects.filter(recommended_id__in=changed)
+        .values_list('activity_id', flat=True)
+        .distinct()
+    )
+    return affected
+
+
+def note_registration_deleted():
+    """Record that a registration was deleted, so the next run rebuilds everything."""
+    now = timezone.now()
+    if not JobCheckpoint.objects.filter(name=DELETED_CHECKPOINT).update(value=now):
+        JobCheckpoint.objects.get_or_create(name=DELETED_CHECKPOINT, defaults={'value': now})
+
+
+def _write_block(rows):
+    activity_ids = [activity_id for activity_id, _ in rows]
+    with transaction.atomic():
+        ActivityRecommendation.objects.filter(activity_id__in=activity_ids).delete()
+        ActivityRecommendation.objects.bulk_create(
+            ActivityRecommendation(activity_id=activity_id, recommended_id=neighbor_id, rank=rank, score=score)
+            for activity_id, neighbors in rows
+            for rank, (neighbor_id, score) in enumerate(neighbors, start=1)
+        )
+
+
+def rebuild_recommendations(activity_ids=None, top_k=TOP_K, block_size=BLOCK_SIZE):
+    """Recompute neighbor lists for `activity_ids`, or for every activity when None.
+
+    Returns the number of activities whose lists were rewritten.
+    """
+    matrix, column_ids = load_registration_matrix()
+    if activity_ids is None:
+        targets = set(Activity.objects.values_list('pk', flat=True))
+    else:
+        targets = set(activity_ids)
+    if not targets:
+        return 0
+
+    positions = np.searchsorted(column_ids, sorted(targets))
+    positions = positions[positions < len(column_ids)]
+    columns = positions[np.isin(column_ids[positions], list(targets))]
+
+    pending = []
+    for activity_id, neighbors in iter_neighbors(matrix, column_ids, columns, top_k, block_size):
+        targets.discard(activity_id)
+        pending.append((activity_id, neighbors))
+        if len(pending) >= block_size:
+            _write_block(pending)
+            pending = []
+    # targets left over have no joined registrations any more
+    pending.extend((activity_id, []) for activity_id in targets)
+    for start in range(0, len(pending), block_size):
+        _write_block(pending[start:start + block_size])
+
+    return len(columns) + len(targets)
+
+
+def get_recommendations(activity, limit=4):
+    """Return the stored neighbors of `activity` with a single indexed lookup."""
+    rows = (
+        ActivityRecommendation.objects.filter(activity=activity, rank__lte=limit, recommended__deleted_at__isnull=True)
+        .select_related('recommended')
+        .order_by('rank')
+    )
+    return [row.recommended for row in rows]
@@ -0,0 +1,159 @@
+# main/seating.py
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .caching import registrations_changed
+from .live import participants_changed
+from .models import Activity, Registration
+
+#results of register_user / cancel_user
+JOINED = 'joined'
+WAITLISTED = 'waitlisted'
+ALREADY = 'already'
+CANCELLED = 'cancelled'
+NOT_REGISTERED = 'not_registered'
+
+PROMOTE_ATTEMPTS = 5
+
+
+def take_seat(activity_id):
+    """Claim one seat with a single conditional UPDATE; True if a seat was free."""
+    taken = Activity.objects.filter(
+        Q(capacity__isnull=True) | Q(seats_taken__lt=F('capacity')),
+        pk=activity_id,
+    ).update(seats_taken=F('seats_taken') + 1) == 1
+    if taken:
+        participants_changed(activity_id)
+    return taken
+
+
+def release_seat(activity_id):
+    if Activity.objects.filter(pk=activity_id, seats_taken__gt=0).update(seats_taken=F('seats_taken') - 1):
+        participants_changed(activity_id)
+
+
+def register_user(activity, user):
+    """Register `user` for `activity`, or waitlist them when the event is full.
+
+    Returns JOINED, WAITLISTED or ALREADY. The seat claim and the registration row are
+    written in one short transaction, so concurrent requests can never overbook.
+    """
+    existing = Registration.objects.filter(user=user, joined_activity=activity).values_list('status', flat=True).first()
+    if existing is not None and existing != CANCELLED:
+        return ALREADY
+
+    with transaction.atomic():
+        seated = take_seat(activity.pk)
+        status = JOINED if seated else WAITLISTED
+        waitlisted_at = None if seated else timezone.now()
+        try:
+            with transaction.atomic():
+                Registration.objects.create(
+                    user=user, joined_activity=activity, status=status, waitlisted_at=waitlisted_at,
+                )
+            changed = True
+        except IntegrityError:
+            # re-joining after a cancellation; active and completed rows are left alone
+            changed = Registration.objects.filter(
+                user=user, joined_activity=activity, status=CANCELLED,
+            ).update(
+                status=status, waitlisted_at=waitlisted_at, updated_at=timezone.now(),
+            ) == 1
+            if changed:
+                registrations_changed([user.pk])
+        if not changed:
+            if seated:
+                release_seat(activity.pk)
+            return ALREADY
+    return status
+
+
+def registrants_changed(activity_id):
+    """Invalidate the cached registrations of everyone registered for `activity_id`.
+
+    Their counts and lists depend on the activity's date and deleted state, which change
+    without any Registration being saved.
+    """
+    registrations_changed(Registration.objects.filter(joined_activity_id=activity_id).values_list('user_id', flat=True))
+
+
+def promote_next(activity_id):
+    """Hand a seat that is being freed to the oldest waitlisted registration.
+
+    Returns the promoted Registration, or None if the waitlist is empty.
+    """
+    for _ in range(PROMOTE_ATTEMPTS):
+        candidate = (
+            Registration.objects.filter(joined_activity_id=activity_id, status=WAITLISTED)
+            .order_by('waitlisted_at', 'pk')
+            .first()
+        )
+        if candidate is None:
+            return None
+        # another request may have promoted the same row first
+        if Registration.objects.filter(pk=candidate.pk, status=WAITLISTED).update(
+            status=JOINED, waitlisted_at=None, updated_at=timezone.now(),
+        ):
+            candidate.status = JOINED
+            candidate.waitlisted_at = None
+            registrations_changed([candidate.user_id])
+            return candidate
+    return None
+
+
+def cancel_user(activity, user):
+    """Cancel `user`'s registration; a freed seat goes to the head of the waitlist.
+
+    Returns (CANCELLED or NOT_REGISTERED, promoted registration or None).
+    """
+    with transaction.atomic():
+        registration = Registration.objects.filter(
+            user=user, joined_activity=activity, status__in=(JOINED, WAITLISTED),
+        ).first()
+        if registration is None:
+            return NOT_REGISTERED, None
+        if not Registration.objects.filter(pk=registration.pk, status=registration.status).update(
+            status=CANCELLED, waitlisted_at=None, updated_at=timezone.now(),
+        ):
+            return NOT_REGISTERED, None
+        registrations_changed([user.pk])
+        promoted = None
+        if registration.status == JOINED:
+            # the seat moves straight to the next person; only release it if nobody is waiting
+            promoted = promote_next(activity.pk)
+            if promoted is None:
+                release_seat(activity.pk)
+    return CANCELLED, promoted
+
+
+def fill_from_waitlist(activity):
+    """Promote waitlisted registrations into any seats that became available (e.g. capacity raised)."""
+    promoted = []
+    while Registration.objects.filter(joined_activity=activity, status=WAITLISTED).exists():
+        with transaction.atomic():
+            if not take_seat(activity.pk):
+                break
+            registration = promote_next(activity.pk)
+            if registration is None:
+                release_seat(activity.pk)
+                break
+        promoted.append(registration)
+    return promoted
+
+
+def waitlist_position(registration):
+    if registration.status != WAITLISTED:
+        return None
+    return Registration.objects.filter(
+        Q(waitlisted_at__lt=registration.waitlisted_at)
+        | Q(waitlisted_at=registration.waitlisted_at, pk__lt=registration.pk),
+        joined_activity_id=registration.joined_activity_id,
+        status=WAITLISTED,
+    ).count() + 1
+
+
+def resync_seats(activity_id):
+    """Recount seats from registrations, for rows edited outside this module (admin)."""
+    joined = Registration.objects.filter(joined_activity_id=activity_id, status=JOINED).aggregate(total=Count('pk'))
+    Activity.objects.filter(pk=activity_id).update(seats_taken=joined['total'])
@@ -0,0 +1,112 @@
+# main/signals.py
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import activities_changed, bump_version, profiles_changed, registrations_changed
+from .gallery import refresh_cover
+from .live import comment_added
+from .metrics import HISTORY_WRITES, current_view
+from .ratings import refresh_summary
+from .recommendations import note_registration_deleted
+from .seating import registrants_changed, release_seat
+from .slow_queries import install as install_slow_query_log
+from .models import Activity, Media, Profile, Rating, Registration, UserHistory
+
+
+#cache invalidation: anything keyed on these versions is rebuilt after the next change
+@receiver([post_save, post_delete], sender=Activity)
+def activity_changed(sender, instance, **kwargs):
+    activities_changed([(instance.pk, instance.created_by_id)])
+    if getattr(instance, '_rescheduled', False):
+        registrants_changed(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Media)
+def media_changed(sender, instance, signal, created=False, **kwargs):
+    bump_version(f'activity.{instance.activity_id}.media')
+    if signal is post_delete:
+        # SET_NULL may already have cleared the cover pointer without sending a signal
+        activities_changed(Activity.objects.filter(pk=instance.activity_id).values_list('pk', 'created_by_id'))
+    if created or signal is post_delete:
+        refresh_cover(instance.activity_id)
+
+
+@receiver([post_save, post_delete], sender=Rating)
+def rating_changed(sender, instance, signal, created=False, **kwargs):
+    bump_version(f'activity.{instance.activity_id}.ratings')
+    if created:
+        comment_added(instance)
+    # on delete the activity itself may be going away with its summary, so never recreate the row
+    refresh_summary(instance.activity_id, create=signal is post_save)
+
+
+@receiver([post_save, post_delete], sender=Registration)
+def registration_changed(sender, instance, **kwargs):
+    registrations_changed([instance.user_id])
+
+
+@receiver(post_delete, sender=Registration)
+def registration_deleted(sender, instance, **kwargs):
+    # keep Activity.seats_taken in step when a joined registration disappears
+    if instance.status == 'joined':
+        release_seat(instance.joined_activity_id)
+    # recommendations can only see changed rows, not missing ones
+    note_registration_deleted()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    profiles_changed([instance.user_id])
+
+
+#uploads are reference counted by the storage; let go of files no row points at any more
+@receiver(post_save, sender=Profile)
+def profile_photo_replaced(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_photo', None)
+    current = instance.user_photo.name or None
+    if previous and previous != current:
+        instance.user_photo.storage.delete(previous)
+    instance._loaded_photo = current
+
+
+@receiver(post_delete, sender=Profile)
+def profile_photo_deleted(sender, instance, **kwargs):
+    if instance.user_photo:
+        instance.user_photo.storage.delete(instance.user_photo.name)
+
+
+@receiver(post_delete, sender=Media)
+def media_file_deleted(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.storage.delete(instance.file.name)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # usernames appear in cached organizer boxes
+    bump_version(f'profile.{instance.pk}')
+    # and in every activity's cached comments; logging in only saves last_login
+    if not created and (update_fields is None or 'username' in update_fields):
+        bump_version('usernames')
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    # every account gets its profile up front, so views never have to create one
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=UserHistory)
+def history_written(sender, instance, created, **kwargs):
+    if created:
+        HISTORY_WRITES.inc(view=current_view.get())
+
+
+#slow query log: wrap every connection; captures are saved by the buffer's flusher thread
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_slow_query_log(connection)
+
@@ -0,0 +1,208 @@
+# main/slow_queries.py
+import atexit
+import datetime
+import decimal
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .background import PeriodicFlusher
+from .metrics import current_view
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+MAX_SAMPLES = 200
+
+_state = threading.local()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Collapse literals, placeholders and IN lists so repeats of one statement group together."""
+    normalized = _STRING.sub('?', sql)
+    normalized = normalized.replace('%s', '?')
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER_LIST.sub('(...)', normalized)
+    normalized = _SPACE.sub(' ', normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest(), normalized
+
+
+def redact(params):
+    """Keep numbers, dates and NULLs; replace text and bytes with their type and length."""
+    if params is None:
+        return ''
+    if isinstance(params, dict):
+        params = list(params.values())
+    shown = []
+    for value in params:
+        if value is None or isinstance(value, (bool, int, float, decimal.Decimal, datetime.date, datetime.time)):
+            shown.append(repr(value))
+        elif isinstance(value, (str, bytes, memoryview)):
+            shown.append(f'<{type(value).__name__} len={len(value)}>')
+        else:
+            shown.append(f'<{type(value).__name__}>')
+    return ', '.join(shown)
+
+
+def caller():
+    """file:line in function of the innermost project frame that led to the query."""
+    root = str(settings.BASE_DIR) + os.sep
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ''
+
+
+def explain(connection, sql, params):
+    """The plan for a read statement, run on a separate cursor of the same connection."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ''
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' | '.join(str(column) for column in row) for row in cursor.fetchall())
+    except DatabaseError as exc:
+        return f'(EXPLAIN failed: {exc})'
+
+
+class SlowQueryBuffer:
+    """Slow statements captured during requests, written to SlowQuery in batches.
+
+    A background thread writes them every SLOW_QUERY_FLUSH_INTERVAL seconds, so a request
+    that ran a slow statement never also waits for the SQLite write lock to record it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._explained = set()
+        self._flusher = PeriodicFlusher(
+            'slow-queries', self.flush, lambda: getattr(settings, 'SLOW_QUERY_FLUSH_INTERVAL', 30),
+        )
+
+    def add(self, connection, sql, params, elapsed_ms):
+        key, normalized = fingerprint(sql)
+        with self._lock:
+            needs_plan = key not in self._explained
+            self._explained.add(key)
+        plan = explain(connection, sql, params) if needs_plan else ''
+        entry = {
+            'sql': normalized,
+            'params': redact(params),
+            'view': current_view.get(),
+            'location': caller(),
+        }
+        logger.warning(
+            "slow query %.1f ms [%s] view=%s at %s\n%s\nparams: %s%s",
+            elapsed_ms, key[:12], entry['view'], entry['location'], normalized, entry['params'],
+            f'\nplan:\n{plan}' if plan else '',
+        )
+        with self._lock:
+            pending = self._pending.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'durations': [], 'plan': ''})
+            pending.update(entry)
+            pending['count'] += 1
+            pending['total_ms'] += elapsed_ms
+            pending['max_ms'] = max(pending['max_ms'], elapsed_ms)
+            # only the latest samples are kept anyway, however long the buffer waits
+            pending['durations'] = (pending['durations'] + [elapsed_ms])[-MAX_SAMPLES:]
+            pending['plan'] = pending['plan'] or plan
+        self._flusher.start()
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, entry in pending.items():
+                current = self._pending.setdefault(key, entry)
+                if current is entry:
+                    continue
+                current['count'] += entry['count']
+                current['total_ms'] += entry['total_ms']
+                current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+                current['durations'] = (entry['durations'] + current['durations'])[-MAX_SAMPLES:]
+                current['plan'] = current['plan'] or entry['plan']
+
+    def flush(self, quiet=False):
+        """Merge pending captures into SlowQuery; returns the number of fingerprints written."""
+        pending = self._take()
+        if not pending:
+            return 0
+        _state.recording = True
+        try:
+            now = timezone.now()
+            with transaction.atomic():
+                existing = {row.fingerprint: row for row in SlowQuery.objects.filter(fingerprint__in=pending)}
+                for key, entry in pending.items():
+                    row = existing.get(key) or SlowQuery(fingerprint=key, last_seen=now)
+                    durations = entry['durations']
+                    row.sql = entry['sql']
+                    row.sample_params = entry['params']
+                    row.view = entry['view'][:100]
+                    row.location = entry['location'][:255]
+                    row.plan = entry['plan'] or row.plan
+                    row.count += entry['count']
+                    row.total_ms += entry['total_ms']
+                    row.max_ms = max(row.max_ms, entry['max_ms'])
+                    row.samples = (row.samples + durations)[-MAX_SAMPLES:]
+                    row.last_seen = now
+                    row.save()
+        except DatabaseError as exc:
+            if quiet:
+                logger.warning("Could not save slow queries: %s", exc)
+            else:
+                logger.exception("Could not save slow queries; keeping them for the next flush")
+            self._restore(pending)
+            return 0
+        finally:
+            _state.recording = False
+        return len(pending)
+
+
+slow_query_buffer = SlowQueryBuffer()
+# the database may already be gone at exit (e.g. a torn-down test database)
+atexit.register(slow_query_buffer.flush, quiet=True)
+
+
+def record_slow_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; only slow statements do any extra work."""
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold is None or getattr(_state, 'recording', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= threshold:
+        _state.recording = True
+        try:
+            slow_query_buffer.add(context['connection'], sql, None if many else params, elapsed_ms)
+        finally:
+            _state.recording = False
+    return result
+
+
+def install(connection):
+    if record_slow_queries not in connection.execute_wrappers:
+        # at the bottom of the stack: the connection may open lazily inside a request's
+        # execute_wrapper block, which pops the last wrapper when it exits
+        connection.execute_wrappers.insert(0, record_slow_queries)
+
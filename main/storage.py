@@ -0,0 +1,146 @@
+# main/storage.py
+import gzip
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import tempfile
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import MediaBlob
+
+try:
+    import brotli
+except ImportError:  # .br variants are skipped without the brotli package
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+#file types worth precompressing; images, fonts and videos are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.mjs', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico')
+#keep a compressed variant only if it saves at least this much
+MIN_SAVING = 0.05
+#names written by ContentAddressedStorage: <upload dir>/<2 hex>/<64 hex><extension>
+HASHED_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.[A-Za-z0-9]+)?$')
+TEMP_PREFIX = '.upload-'
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest-hashed static files with precompressed .gz and .br variants written by collectstatic."""
+
+    # templates keep working before collectstatic has run (dev, tests); unknown names stay unhashed
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        compressed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                compressed.append(name)
+                if hashed_name:
+                    compressed.append(hashed_name)
+            yield name, hashed_name, processed
+        for name in dict.fromkeys(compressed):
+            if name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        variants = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, compressor in variants:
+            data = compressor(content)
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            if len(data) <= len(content) * (1 - MIN_SAVING):
+                self._save(name + suffix, ContentFile(data))
+
+
+def add_reference(name, size):
+    blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size, 'references': 1})
+    if not created:
+        MediaBlob.objects.filter(name=name).update(references=F('references') + 1)
+
+
+def release_reference(name):
+    """Drop one reference to `name`; True when none are left and the file may go.
+
+    Files from before content addressing have no MediaBlob and belong to a single row.
+    """
+    with transaction.atomic():
+        if MediaBlob.objects.filter(name=name, references__gt=1).update(references=F('references') - 1):
+            return False
+        MediaBlob.objects.filter(name=name).delete()
+    return True
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Uploads named by the SHA-256 of their content, so identical files are stored once.
+
+    Names keep the upload directory and extension (`activity_media/3f/3f2a...9c.jpg`).
+    MediaBlob counts the rows using each file and delete() only removes it with the last
+    one; `manage.py gc_media` clears up anything the counts miss.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # the final name depends on the content, and an existing file with it is the same file
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        folder = self.path(directory)
+        os.makedirs(folder, exist_ok=True)
+        # hash while copying, so the upload is read once and never held in memory
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=folder, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as handle:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    handle.write(chunk)
+                    size += len(chunk)
+            hexdigest = digest.hexdigest()
+            hashed_name = posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+            path = self.path(hashed_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.unlink(temp_path)
+                # a fresh mtime keeps gc_media's grace period from covering a file just reused
+                os.utime(path)
+            else:
+                os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+                os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        add_reference(hashed_name, size)
+        return hashed_name
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        if release_reference(name):
+            transaction.on_commit(lambda: self._remove_unreferenced(name))
+
+    def _remove_unreferenced(self, name):
+        # an identical upload may have claimed the file again in the meantime
+        if not MediaBlob.objects.filter(name=name).exists():
+            super().delete(name)
@@ -0,0 +1,163 @@
+# main/testing.py
+import hashlib
+import os
+import sqlite3
+import sys
+import types
+from contextlib import closing
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.migrations.loader import MigrationLoader
+from django.test.runner import DiscoverRunner
+
+from .snapshots import load_snapshot
+
+
+def _test_database_name(connection):
+    """The on-disk test database of a SQLite connection, or None if it lives in memory."""
+    if connection.vendor != 'sqlite':
+        return None
+    name = connection.creation._get_test_db_name()
+    if connection.creation.is_in_memory_db(name):
+        return None
+    return str(name)
+
+
+def _project_file(path):
+    """`path` as a string if it is an existing file inside the project (outside site-packages)."""
+    if not isinstance(path, (str, os.PathLike)):
+        return None
+    path = os.path.abspath(path)
+    if not path.startswith(str(settings.BASE_DIR) + os.sep) or 'site-packages' in path or not os.path.isfile(path):
+        return None
+    return path
+
+
+def migration_inputs(module):
+    """Project files a migration module depends on besides itself.
+
+    That is the project modules it imports from (a data migration calling main.geo, say) and
+    any data files those modules name at module level (such as the gazetteer main.geo reads).
+    """
+    inputs = set()
+    for value in vars(module).values():
+        name = value.__name__ if isinstance(value, types.ModuleType) else getattr(value, '__module__', None)
+        dependency = sys.modules.get(name) if isinstance(name, str) else None
+        source = _project_file(getattr(dependency, '__file__', None))
+        if dependency is None or dependency is module or source is None:
+            continue
+        inputs.add(source)
+        for attribute, member in vars(dependency).items():
+            # __file__ and __cached__ are the module itself, already covered by its source
+            data = None if attribute.startswith('__') else _project_file(member)
+            if data:
+                inputs.add(data)
+    return inputs
+
+
+def template_key(alias):
+    """Changes whenever the migrations, what they import, Django or TEST_DB_SNAPSHOT would give a different database."""
+    digest = hashlib.sha256(f'{alias}:{django.get_version()}'.encode())
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    inputs = set()
+    for key, migration in sorted(loader.disk_migrations.items()):
+        module = sys.modules[migration.__module__]
+        digest.update(repr(key).encode())
+        with open(module.__file__, 'rb') as handle:
+            digest.update(handle.read())
+        inputs |= migration_inputs(module)
+    for path in sorted(inputs):
+        digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+        with open(path, 'rb') as handle:
+            digest.update(handle.read())
+    snapshot = getattr(settings, 'TEST_DB_SNAPSHOT', None)
+    if snapshot:
+        stat = os.stat(snapshot)
+        digest.update(f'{snapshot}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:16]
+
+
+def template_path(alias):
+    return os.path.join(settings.TEST_DB_TEMPLATE_DIR, f'{alias}-{template_key(alias)}.sqlite3')
+
+
+class TemplateDatabaseRunner(DiscoverRunner):
+    """Copies SQLite test databases from a prepared template instead of migrating them every run.
+
+    The template is rebuilt by the first run after the migrations, the project code they import,
+    or TEST_DB_SNAPSHOT change; --rebuild-template forces it for anything that check misses.
+    Background flusher threads are turned off, so nothing writes outside a test's transaction.
+    """
+
+    def __init__(self, rebuild_template=False, **kwargs):
+        super().__init__(**kwargs)
+        self.rebuild_template = rebuild_template
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--rebuild-template', action='store_true',
+            help='Migrate a fresh test database template even if the saved one looks current.',
+        )
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._background_flush = getattr(settings, 'BACKGROUND_FLUSH', True)
+        settings.BACKGROUND_FLUSH = False
+
+    def teardown_test_environment(self, **kwargs):
+        settings.BACKGROUND_FLUSH = self._background_flush
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        aliases = kwargs.get('aliases') or list(connections)
+        if not getattr(settings, 'TEST_DB_TEMPLATE_DIR', None) or not all(
+            _test_database_name(connections[alias]) for alias in aliases
+        ):
+            return super().setup_databases(**kwargs)
+        for alias in aliases:
+            path = template_path(alias)
+            if self.rebuild_template or not os.path.exists(path):
+                self._build_template(alias, path)
+            self._restore_template(alias, path)
+        # the copy is up to date, so migrate only has to confirm there is nothing to apply
+        keepdb, self.keepdb = self.keepdb, True
+        try:
+            return super().setup_databases(**kwargs)
+        finally:
+            self.keepdb = keepdb
+
+    def _build_template(self, alias, path):
+        connection = connections[alias]
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=self.verbosity, autoclobber=not self.interactive, serialize=False)
+        try:
+            snapshot = getattr(settings, 'TEST_DB_SNAPSHOT', None)
+            if snapshot:
+                load_snapshot(snapshot, using=alias)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            for stale in os.listdir(directory):
+                if stale.startswith(f'{alias}-'):
+                    os.remove(os.path.join(directory, stale))
+            connection.ensure_connection()
+            with closing(sqlite3.connect(f'{path}.partial')) as target:
+                connection.connection.backup(target)
+            os.replace(f'{path}.partial', path)
+        finally:
+            connection.creation.destroy_test_db(old_name, self.verbosity)
+        if self.verbosity >= 1:
+            self.log(f"Saved test database template for alias '{alias}' to {path}")
+
+    def _restore_template(self, alias, path):
+        name = _test_database_name(connections[alias])
+        for leftover in (name, f'{name}-wal', f'{name}-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(name)) as target:
+            source.backup(target)
+        if self.verbosity >= 2:
+            self.log(f"Copied test database for alias '{alias}' from {path}")
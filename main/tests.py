@@ -1,3 +1,1505 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import multiprocessing
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import live, metrics, seating, slow_queries
+from .analytics import organizer_report, refresh_rollups
+from .archive import archive_activities
+from .caching import get_version
+from .deletion import purge_deleted_activities, soft_delete_activity
+from .media_gc import adopt_legacy_files, collect_garbage
+from .facets import get_facets
+from .feeds import make_user_feed_token
+from .gallery import refresh_cover
+from .geo import GAZETTEER_PATH, encode_geohash
+from .models import (
+    Activity, ActivityArchive, ActivityCounter, ActivityDailyStats, ActivityRecommendation, JobCheckpoint, Media, MediaBlob, NotificationLog, Profile, Rating,
+    RatingSummary, Registration, SlowQuery, UploadSession, UserHistory,
+)
+from .notifications import REMINDER, UPDATE, send_notifications
+from .paginators import EstimatedCountPaginator
+from .paging import encode_cursor
+from .ratelimit import count_request
+from .ratings import refresh_summary
+from .recommendations import DELETED_CHECKPOINT, affected_activity_ids, rebuild_recommendations
+from .snapshots import dump_snapshot, load_snapshot
+from .testing import migration_inputs, template_key
+from .background import PeriodicFlusher
+from .trending import counter_buffer, record_view, trending_activities, update_trending
+from .uploads import expire_uploads
+from .user_stats import get_user_stats
+
+
+def _register_many(args):
+    activity_id, user_ids = args
+    # forked workers must open their own database connections
+    connections.close_all()
+    activity = Activity.objects.get(pk=activity_id)
+    results = []
+    for user_id in user_ids:
+        results.append(seating.register_user(activity, User(pk=user_id)))
+    connections.close_all()
+    return results
+
+
+# lock waits here are expected, not slow queries worth logging
+@override_settings(SLOW_QUERY_THRESHOLD_MS=None)
+class SeatAllocationStressTest(TransactionTestCase):
+    """Concurrent registrations from several processes must never overbook an activity."""
+
+    PROCESSES = 4
+    USERS = 200
+    CAPACITY = 50
+    MIN_REGISTRATIONS_PER_SECOND = 25
+
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', 'pw')
+        self.activity = Activity.objects.create(
+            title='Popular Cleanup', description='Bring gloves', location='Windsor',
+            date=timezone.now() + timedelta(days=7), created_by=organizer, capacity=self.CAPACITY,
+        )
+        User.objects.bulk_create(User(username=f'runner{i}') for i in range(self.USERS))
+        self.user_ids = list(User.objects.filter(username__startswith='runner').values_list('pk', flat=True))
+
+    def test_concurrent_registrations(self):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            self.skipTest("needs the fork start method")
+        if connections['default'].vendor == 'sqlite' and connections['default'].is_in_memory_db():
+            self.skipTest("needs a file database shared between processes")
+
+        chunks = [(self.activity.pk, self.user_ids[i::self.PROCESSES]) for i in range(self.PROCESSES)]
+        connections.close_all()
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(self.PROCESSES) as pool:
+            results = [result for chunk in pool.map(_register_many, chunks) for result in chunk]
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(results.count(seating.JOINED), self.CAPACITY)
+        self.assertEqual(results.count(seating.WAITLISTED), self.USERS - self.CAPACITY)
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.seats_taken, self.CAPACITY)
+        registrations = Registration.objects.filter(joined_activity=self.activity)
+        self.assertEqual(registrations.filter(status='joined').count(), self.CAPACITY)
+        self.assertEqual(registrations.filter(status='waitlisted').count(), self.USERS - self.CAPACITY)
+
+        rate = self.USERS / elapsed
+        self.assertGreater(
+            rate, self.MIN_REGISTRATIONS_PER_SECOND,
+            f"{rate:.0f} registrations/s with {self.PROCESSES} processes",
+        )
+
+
+class RateLimitTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_requests_are_counted_per_window(self):
+        self.assertEqual([count_request('test', 3, 60, now=0) for _ in range(3)], [0, 0, 0])
+        self.assertEqual(count_request('test', 3, 60, now=10), 50)
+        self.assertEqual(count_request('test', 3, 60, now=59.5), 1)
+        self.assertEqual(count_request('test', 3, 60, now=60), 0)
+        self.assertEqual(count_request('other', 3, 60, now=10), 0)
+
+    def test_concurrent_requests_never_share_a_slot(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(count_request('test', 5, 60, now=1))) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 5)
+
+    def test_exceeding_the_limit_answers_429(self):
+        for _ in range(5):
+            self.assertEqual(self.client.post(reverse('signup'), {}).status_code, 200)
+        response = self.client.post(reverse('signup'), {})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 3601))
+        # only POSTs are limited here, and other clients have their own buckets
+        self.assertEqual(self.client.get(reverse('signup')).status_code, 200)
+        self.assertEqual(self.client.post(reverse('signup'), {}, REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1)
+class EstimatedCountPaginatorTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.activities = [
+            Activity.objects.create(
+                title=f'Cleanup {i}', description='Bring boots', location='Windsor', category='Cleanup' if i else 'Other',
+                date=timezone.now() + timedelta(days=i + 1), created_by=self.admin,
+            )
+            for i in range(3)
+        ]
+        # hidden by the default manager, but still in the table estimate
+        Activity.all_objects.filter(pk=self.activities[1].pk).update(deleted_at=timezone.now())
+
+    def test_default_manager_filter_uses_the_estimate(self):
+        estimate = max(activity.pk for activity in self.activities)
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(Activity.objects.order_by('-date'), 10).count, estimate)
+        self.assertEqual(EstimatedCountPaginator(Activity.objects.filter(category='Cleanup').order_by('pk'), 10).count, 1)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=estimate + 1):
+            self.assertEqual(EstimatedCountPaginator(Activity.objects.order_by('pk'), 10).count, 2)
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:main_activity_changelist'))
+        self.assertEqual(response.context['cl'].result_count, estimate)
+
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        organizer = User.objects.create(username='organizer')
+        self.quiet, self.popular = [
+            Activity.objects.create(
+                title=title, description='Bring boots', location='Windsor',
+                date=timezone.now() + timedelta(days=3), created_by=organizer,
+            )
+            for title in ('Quiet Cleanup', 'Popular Cleanup')
+        ]
+        self.addCleanup(counter_buffer.flush)
+
+    def test_views_are_counted_and_ranked(self):
+        for _ in range(3):
+            self.client.get(reverse('activity_detail', args=[self.popular.pk]))
+        self.client.get(reverse('activity_detail', args=[self.quiet.pk]))
+        self.assertEqual(counter_buffer.flush(), 2)
+        self.assertEqual(ActivityCounter.objects.get(activity=self.popular).views, 3)
+
+        self.assertEqual(update_trending(), 2)
+        self.assertEqual(trending_activities(2), [self.popular, self.quiet])
+
+    def test_counts_for_a_purged_activity_are_dropped(self):
+        record_view(self.quiet.pk)
+        record_view(self.popular.pk)
+        soft_delete_activity(self.quiet)
+        purge_deleted_activities(pause=0)
+        self.assertEqual(counter_buffer.flush(), 1)
+        self.assertEqual(list(ActivityCounter.objects.values_list('activity_id', flat=True)), [self.popular.pk])
+        self.assertEqual(counter_buffer.flush(), 0)
+
+    def test_recording_never_writes_in_the_request(self):
+        with override_settings(BACKGROUND_FLUSH=True), mock.patch.object(counter_buffer, '_flusher') as flusher:
+            with self.assertNumQueries(0):
+                record_view(self.popular.pk)
+        flusher.start.assert_called_once_with()
+        flusher.wake.assert_not_called()
+
+    def test_flusher_thread_flushes_when_woken(self):
+        flushed = threading.Event()
+        flusher = PeriodicFlusher('test-flusher', flushed.set, lambda: 3600)
+        self.assertFalse(flusher.start())
+        with override_settings(BACKGROUND_FLUSH=True):
+            self.assertTrue(flusher.start())
+        flusher.wake()
+        self.assertTrue(flushed.wait(5))
+
+
+class GeoSearchTest(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create(username='organizer')
+
+    def create(self, title, location, days, **kwargs):
+        return Activity.objects.create(
+            title=title, description='Bring boots', location=location,
+            date=timezone.now() + timedelta(days=days), created_by=self.organizer, **kwargs,
+        )
+
+    def test_location_is_geocoded_again_when_it_changes(self):
+        activity = self.create('River Cleanup', 'Windsor riverfront', 3)
+        self.assertEqual((activity.latitude, activity.longitude), (42.3149, -83.0364))
+        self.assertEqual(activity.geohash, encode_geohash(42.3149, -83.0364))
+
+        activity = Activity.objects.get(pk=activity.pk)
+        activity.location = 'Tecumseh marina'
+        activity.save()
+        activity = Activity.objects.get(pk=activity.pk)
+        self.assertEqual((activity.latitude, activity.longitude), (42.3036, -82.8862))
+        self.assertEqual(activity.geohash, encode_geohash(42.3036, -82.8862))
+
+        activity.location = 'Somewhere unlisted'
+        activity.save()
+        self.assertEqual(Activity.objects.filter(pk=activity.pk).values_list('latitude', 'geohash').get(), (None, ''))
+
+    def test_edited_coordinates_are_kept(self):
+        activity = self.create('River Cleanup', 'Windsor', 3)
+        activity = Activity.objects.get(pk=activity.pk)
+        activity.location = 'Tecumseh'
+        activity.latitude, activity.longitude = 42.31, -82.9
+        activity.save()
+        activity = Activity.objects.get(pk=activity.pk)
+        self.assertEqual((activity.latitude, activity.longitude), (42.31, -82.9))
+
+    def test_entered_coordinates_survive_an_unlisted_location_edit(self):
+        activity = self.create('River Cleanup', 'Old boathouse', 3, latitude=42.31, longitude=-82.9)
+        activity = Activity.objects.get(pk=activity.pk)
+        activity.location = 'Old boathouse, room 4B'
+        activity.save()
+        activity.location = 'Boathouse, room 4B'
+        activity.save()
+        self.assertEqual(
+            Activity.objects.filter(pk=activity.pk).values_list('latitude', 'longitude', 'geohash').get(),
+            (42.31, -82.9, encode_geohash(42.31, -82.9)),
+        )
+
+    def test_near_returns_the_nearest_not_the_soonest(self):
+        self.create('Tecumseh Cleanup', 'Tecumseh', 1)
+        self.create('Windsor Cleanup', 'Windsor', 5)
+        self.create('Toronto Cleanup', 'Toronto', 2)
+        url = reverse('activities_api') + '?near=42.3149,-83.0364&radius=30'
+        with mock.patch('main.views.API_PAGE_SIZE', 1):
+            results = self.client.get(url).json()['results']
+        self.assertEqual([row['title'] for row in results], ['Windsor Cleanup'])
+
+        results = self.client.get(url).json()['results']
+        self.assertEqual([row['title'] for row in results], ['Windsor Cleanup', 'Tecumseh Cleanup'])
+        self.assertEqual(results[0]['distance_km'], 0)
+
+        results = self.client.get(reverse('activities_api') + '?bbox=43,-80,44,-79').json()['results']
+        self.assertEqual([row['title'] for row in results], ['Toronto Cleanup'])
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        organizer = User.objects.create(username='organizer')
+        self.activities = [
+            Activity.objects.create(
+                title=f'Cleanup {i}', description='Bring boots', location='Windsor',
+                date=timezone.now() + timedelta(days=i + 1), created_by=organizer,
+            )
+            for i in range(4)
+        ]
+        self.users = [User.objects.create(username=f'user{i}') for i in range(5)]
+        for user, activity in [(0, 0), (1, 0), (0, 1), (1, 1), (1, 2), (2, 2), (2, 3), (3, 3)]:
+            Registration.objects.create(user=self.users[user], joined_activity=self.activities[activity])
+        call_command('build_recommendations', stdout=StringIO())
+
+    def stored(self):
+        rows = ActivityRecommendation.objects.values_list('activity_id', 'recommended_id', 'rank', 'score')
+        return [(activity_id, recommended_id, rank, round(score, 6)) for activity_id, recommended_id, rank, score in rows]
+
+    def assertMatchesFullRebuild(self):
+        incremental = self.stored()
+        rebuild_recommendations()
+        self.assertEqual(incremental, self.stored())
+
+    def test_incremental_rebuild_matches_full_rebuild(self):
+        since = JobCheckpoint.objects.get(name='recommendations').value
+        # a newcomer on activity 0 changes its norm, and so the scores activity 1 and 2 give it
+        Registration.objects.create(user=self.users[4], joined_activity=self.activities[0])
+        leaving = Registration.objects.get(user=self.users[3], joined_activity=self.activities[3])
+        leaving.status = 'cancelled'
+        leaving.save()
+        affected = affected_activity_ids(since)
+        self.assertEqual(affected, {activity.pk for activity in self.activities})
+
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertMatchesFullRebuild()
+
+    def test_deleted_registration_forces_full_rebuild(self):
+        Registration.objects.get(user=self.users[0], joined_activity=self.activities[1]).delete()
+        self.assertTrue(JobCheckpoint.objects.filter(name=DELETED_CHECKPOINT).exists())
+        self.assertIsNone(affected_activity_ids(JobCheckpoint.objects.get(name='recommendations').value))
+
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('all activities', out.getvalue())
+        self.assertMatchesFullRebuild()
+
+    def test_purged_activity_forces_full_rebuild(self):
+        since = JobCheckpoint.objects.get(name='recommendations').value
+        soft_delete_activity(self.activities[1])
+        purge_deleted_activities(pause=0)
+        self.assertIsNone(affected_activity_ids(since))
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertMatchesFullRebuild()
+
+
+class WaitlistTest(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', 'pw')
+        self.activity = Activity.objects.create(
+            title='Tree Planting', description='Bring a shovel', location='Windsor',
+            date=timezone.now() + timedelta(days=7), created_by=organizer, capacity=1,
+        )
+        self.users = [User.objects.create_user(f'user{i}', password='pw') for i in range(3)]
+
+    def test_cancel_promotes_oldest_waitlisted(self):
+        results = [seating.register_user(self.activity, user) for user in self.users]
+        self.assertEqual(results, [seating.JOINED, seating.WAITLISTED, seating.WAITLISTED])
+        self.assertEqual(seating.register_user(self.activity, self.users[0]), seating.ALREADY)
+
+        result, promoted = seating.cancel_user(self.activity, self.users[0])
+        self.assertEqual(result, seating.CANCELLED)
+        self.assertEqual(promoted.user, self.users[1])
+
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.seats_taken, 1)
+        waiting = Registration.objects.get(user=self.users[2], joined_activity=self.activity)
+        self.assertEqual(seating.waitlist_position(waiting), 1)
+
+    def test_only_cancelled_registrations_are_reopened(self):
+        Registration.objects.create(user=self.users[0], joined_activity=self.activity, status='completed')
+        Registration.objects.create(user=self.users[1], joined_activity=self.activity, status='cancelled')
+        self.assertEqual(seating.register_user(self.activity, self.users[0]), seating.ALREADY)
+        self.assertEqual(seating.register_user(self.activity, self.users[1]), seating.JOINED)
+        statuses = dict(Registration.objects.values_list('user__username', 'status'))
+        self.assertEqual(statuses, {'user0': 'completed', 'user1': 'joined'})
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.seats_taken, 1)
+
+
+class NotificationTest(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', 'pw')
+        self.activity = Activity.objects.create(
+            title='Beach Cleanup', description='Bring bags', location='Windsor',
+            date=timezone.now() + timedelta(hours=12), created_by=organizer,
+        )
+        for i in range(5):
+            user = User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw')
+            Registration.objects.create(user=user, joined_activity=self.activity, status='joined')
+        cancelled = User.objects.create_user('cancelled', 'cancelled@example.com', 'pw')
+        Registration.objects.create(user=cancelled, joined_activity=self.activity, status='cancelled')
+
+    def test_reminders_are_sent_once_in_batches(self):
+        counts = send_notifications(batch_size=2, max_per_second=0)
+        self.assertEqual(counts, {REMINDER: 5, UPDATE: 0})
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(NotificationLog.objects.filter(kind=REMINDER).count(), 5)
+
+        self.assertEqual(send_notifications(max_per_second=0), {REMINDER: 0, UPDATE: 0})
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_changed_activity_sends_update(self):
+        send_notifications(max_per_second=0)
+        activity = Activity.objects.get(pk=self.activity.pk)
+        activity.location = 'Tecumseh'
+        activity.save()
+
+        counts = send_notifications(max_per_second=0)
+        self.assertEqual(counts, {REMINDER: 0, UPDATE: 5})
+        self.assertIn('Tecumseh', mail.outbox[-1].body)
+
+
+class RatingPagesTest(TestCase):
+    def setUp(self):
+        organizer = User.objects.create_user('organizer', 'organizer@example.com', 'pw')
+        self.activity = Activity.objects.create(
+            title='Tree Planting', description='Bring gloves', location='Windsor',
+            date=timezone.now() - timedelta(days=1), created_by=organizer,
+        )
+        self.addCleanup(counter_buffer.flush)
+        for i in range(25):
+            user = User.objects.create(username=f'user{i}')
+            Rating.objects.create(activity=self.activity, user=user, rating=i % 5 + 1 if i else None, comment=f'Comment {i}')
+
+    def test_summary_follows_ratings(self):
+        summary = RatingSummary.objects.get(activity=self.activity)
+        self.assertEqual(summary.comments, 25)
+        self.assertEqual(summary.counts(), [4, 5, 5, 5, 5])
+        Rating.objects.filter(activity=self.activity, rating=5).first().delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.comments, summary.stars_5, summary.total), (24, 4, 23))
+
+    def test_comments_are_paged_by_cursor(self):
+        response = self.client.get(reverse('activity_detail', args=[self.activity.pk]))
+        first = response.context['comments']
+        self.assertEqual(len(first.objects), 10)
+
+        seen = [rating.pk for rating in first.objects]
+        cursor = first.next_cursor
+        while cursor:
+            data = self.client.get(reverse('activity_comments', args=[self.activity.pk]), {'after': cursor}).json()
+            seen += [int(pk) for pk in re.findall(r'id="rating_(\d+)"', data['html'])]
+            cursor = data['next_cursor']
+        expected = list(self.activity.ratings.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(reverse('activity_comments', args=[self.activity.pk]), {'after': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create(username='organizer')
+        self.member = User.objects.create(username='member')
+        self.activity = Activity.objects.create(
+            title='Beach Cleanup; bring gloves, bags', description='Meet at the pier\nat 9', location='Windsor',
+            category='Cleanup', date=timezone.now() + timedelta(days=3), created_by=self.organizer,
+        )
+        Activity.objects.create(
+            title='Past Planting', description='d', location='Windsor', category='Tree Planting',
+            date=timezone.now() - timedelta(days=3), created_by=self.organizer,
+        )
+
+    def test_feed_lists_upcoming_events_escaped(self):
+        response = self.client.get(reverse('activity_feed'))
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(f'UID:activity-{self.activity.pk}@testserver\r\n', body)
+        self.assertIn('SUMMARY:Beach Cleanup\\; bring gloves\\, bags\r\n', body)
+        self.assertIn('DESCRIPTION:Meet at the pier\\nat 9\r\n', body)
+        self.assertIn('DTSTART:' + self.activity.date.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ'), body)
+        self.assertNotIn('Past Planting', body)
+
+    def test_matching_etag_answers_304_until_the_activity_changes(self):
+        etag = self.client.get(reverse('activity_feed'))['ETag']
+        response = self.client.get(reverse('activity_feed'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        activity = Activity.objects.get(pk=self.activity.pk)
+        activity.title = 'Beach Cleanup'
+        activity.save()
+        response = self.client.get(reverse('activity_feed'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('SUMMARY:Beach Cleanup\r\n', response.content.decode())
+
+    def test_user_feed_lists_only_their_registrations(self):
+        url = reverse('user_feed', args=[make_user_feed_token(self.member)])
+        self.assertNotIn('BEGIN:VEVENT', self.client.get(url).content.decode())
+        Registration.objects.create(user=self.member, joined_activity=self.activity)
+        response = self.client.get(url)
+        self.assertIn(f'UID:activity-{self.activity.pk}@testserver', response.content.decode())
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('user_feed', args=['forged:token'])).status_code, 404)
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        self.organizer = User.objects.create(username='organizer')
+        self.commenter = User.objects.create(username='commenter')
+        self.activity = Activity.objects.create(
+            title='Tree Planting', description='Bring gloves', location='Windsor',
+            date=timezone.now() - timedelta(days=1), created_by=self.organizer,
+        )
+        Rating.objects.create(activity=self.activity, user=self.commenter, rating=5, comment='Lovely day')
+        self.addCleanup(counter_buffer.flush)
+
+    def detail(self):
+        return self.client.get(reverse('activity_detail', args=[self.activity.pk]))
+
+    def test_editing_the_activity_refreshes_its_fragments(self):
+        self.assertContains(self.detail(), 'Bring gloves')
+        activity = Activity.objects.get(pk=self.activity.pk)
+        activity.title = 'Tree Planting Day'
+        activity.description = 'Bring a shovel'
+        activity.save()
+        response = self.detail()
+        self.assertContains(response, 'Tree Planting Day')
+        self.assertContains(response, 'Bring a shovel')
+        self.assertNotContains(response, 'Bring gloves')
+
+    def test_renaming_a_commenter_refreshes_the_comments(self):
+        self.assertContains(self.detail(), 'commenter')
+        self.commenter.username = 'renamed'
+        self.commenter.save()
+        response = self.detail()
+        self.assertContains(response, 'renamed')
+        self.assertNotContains(response, 'commenter')
+
+    def test_registering_refreshes_the_homepage_totals(self):
+        participants = re.compile(r'(\d+)</h3>\s*<p class="card-text text-muted">Active Participants')
+        self.assertEqual(participants.search(self.client.get(reverse('home')).content.decode())[1], '0')
+        Registration.objects.create(user=self.commenter, joined_activity=self.activity)
+        self.assertEqual(participants.search(self.client.get(reverse('home')).content.decode())[1], '1')
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create(username='organizer')
+        Profile.objects.filter(user=self.organizer).update(is_organizer=True)
+        self.member = User.objects.create(username='member')
+        for title, category, days, creator in [
+            ('River Cleanup', 'Cleanup', 3, self.organizer),
+            ('Beach Cleanup', 'Cleanup', -3, self.member),
+            ('River Planting', 'Tree Planting', 5, self.member),
+            ('Compost Talk', 'Education', 5, self.member),
+        ]:
+            Activity.objects.create(
+                title=title, description='Bring boots', location='Windsor', category=category,
+                date=timezone.now() + timedelta(days=days), created_by=creator,
+            )
+
+    def test_counts_per_category_and_tab(self):
+        facets = get_facets('  river ')
+        self.assertEqual(facets, {
+            'Cleanup': {'upcoming': 1, 'past': 0, 'official': 1},
+            'Tree Planting': {'upcoming': 1, 'past': 0, 'official': 0},
+        })
+        response = self.client.get(reverse('activity_list') + '?q=cleanup&date_filter=past')
+        self.assertEqual(response.context['tab_counts'], {'upcoming': 1, 'past': 1, 'official': 1})
+        options = {value: count for value, _, count in response.context['category_options']}
+        self.assertEqual(options['Cleanup'], 1)
+        self.assertEqual(options['Education'], 0)
+        self.assertContains(response, '<option value="Education" disabled>Education (0)</option>', html=True)
+
+    def test_counts_are_cached_until_activities_change(self):
+        get_facets('river')
+        with self.assertNumQueries(0):
+            get_facets('river  ')
+        Activity.objects.create(
+            title='River Walk', description='', location='Windsor', category='Other',
+            date=timezone.now() + timedelta(days=1), created_by=self.member,
+        )
+        self.assertEqual(get_facets('river')['Other']['upcoming'], 1)
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create(username='organizer')
+        self.member = User.objects.create(username='member')
+        self.old = Activity.objects.create(
+            title='Old Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() - timedelta(days=400), created_by=self.organizer,
+        )
+        self.recent = Activity.objects.create(
+            title='Recent Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() - timedelta(days=3), created_by=self.organizer,
+        )
+        self.upcoming = Activity.objects.create(
+            title='Next Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() + timedelta(days=3), created_by=self.organizer,
+        )
+        Registration.objects.create(user=self.member, joined_activity=self.old)
+        Rating.objects.create(activity=self.old, user=self.member, rating=4, comment='Nice')
+
+    def test_old_events_are_archived_and_still_served(self):
+        self.assertEqual(archive_activities(batch_size=1), 1)
+        self.assertEqual(archive_activities(), 0)
+        archive = ActivityArchive.objects.get(activity=self.old)
+        self.assertEqual((archive.participants, archive.rating_count, archive.rating_average), (1, 1, 4))
+        self.assertEqual(list(Activity.objects.hot().order_by('date')), [self.recent, self.upcoming])
+
+        response = self.client.get(reverse('activity_list') + '?date_filter=past')
+        self.assertContains(response, 'Old Cleanup')
+        self.assertContains(response, '1 attended')
+        response = self.client.get(reverse('activity_detail', args=[self.old.pk]))
+        self.assertContains(response, 'Archived')
+        self.assertEqual(response.context['participant_count'], 1)
+
+        self.client.force_login(self.member)
+        self.client.post(reverse('submit_rating', args=[self.old.pk]), {'rating': 5, 'comment': 'Late'})
+        self.assertEqual(Rating.objects.filter(activity=self.old).count(), 1)
+
+    def test_upcoming_queries_read_only_the_hot_index(self):
+        sql, params = Activity.objects.upcoming().order_by('date').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('activity_hot_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_moving_the_date_brings_an_event_back(self):
+        archive_activities()
+        activity = Activity.objects.get(pk=self.old.pk)
+        activity.date = timezone.now() + timedelta(days=10)
+        activity.save()
+        self.assertIsNone(Activity.objects.get(pk=self.old.pk).archived_at)
+        self.assertFalse(ActivityArchive.objects.exists())
+        self.assertIn(activity, Activity.objects.upcoming())
+
+
+class DeletionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+        self.organizer = User.objects.create(username='organizer')
+        self.activity = Activity.objects.create(
+            title='River Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() - timedelta(days=1), created_by=self.organizer,
+        )
+        members = User.objects.bulk_create(User(username=f'member{i}') for i in range(5))
+        Registration.objects.bulk_create(Registration(user=member, joined_activity=self.activity) for member in members)
+        Rating.objects.create(activity=self.activity, user=members[0], rating=4, comment='Nice')
+        self.media = Media.objects.create(
+            activity=self.activity, created_by=self.organizer,
+            file=SimpleUploadedFile('river.jpg', b'jpeg bytes', content_type='image/jpeg'),
+        )
+        self.path = self.media.file.path
+
+    def test_delete_hides_at_once_and_purge_removes_rows_and_files(self):
+        self.client.force_login(self.organizer)
+        response = self.client.post(reverse('activity_delete', args=[self.activity.pk]))
+        self.assertRedirects(response, reverse('activity_list'))
+        self.assertEqual(self.client.get(reverse('activity_detail', args=[self.activity.pk])).status_code, 404)
+        self.assertNotContains(self.client.get(reverse('activity_list') + '?date_filter=past'), 'River Cleanup')
+        # nothing heavy happened in the request
+        self.assertEqual(Registration.objects.filter(joined_activity_id=self.activity.pk).count(), 5)
+        self.assertTrue(os.path.exists(self.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(purge_deleted_activities(batch_size=2, pause=0), 1)
+        self.assertFalse(Activity.all_objects.filter(pk=self.activity.pk).exists())
+        self.assertFalse(Registration.objects.filter(joined_activity_id=self.activity.pk).exists())
+        self.assertFalse(Rating.objects.filter(activity_id=self.activity.pk).exists())
+        self.assertFalse(Media.objects.filter(pk=self.media.pk).exists())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_purge_leaves_live_activities_alone(self):
+        self.assertEqual(purge_deleted_activities(pause=0), 0)
+        self.assertEqual(Registration.objects.count(), 5)
+        self.assertTrue(os.path.exists(self.path))
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organizer = User.objects.create(username='organizer')
+        self.member = User.objects.create(username='member')
+        self.activities = [
+            Activity.objects.create(
+                title=f'Cleanup {i}', description='Bring boots', location='Windsor',
+                date=timezone.now() + timedelta(days=i + 1), created_by=self.organizer,
+            )
+            for i in range(2)
+        ]
+        for activity in self.activities:
+            Registration.objects.create(user=self.member, joined_activity=activity)
+
+    def counts(self, user):
+        stats = get_user_stats(user.pk)
+        return stats['created_count'], stats['joined_count'], stats['upcoming_count']
+
+    def test_counts_are_cached(self):
+        self.assertEqual(self.counts(self.organizer), (2, 0, 0))
+        self.assertEqual(self.counts(self.member), (0, 2, 2))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(self.member), (0, 2, 2))
+
+    def test_registrants_see_rescheduled_and_deleted_events(self):
+        self.assertEqual(self.counts(self.member), (0, 2, 2))
+        activity = Activity.objects.get(pk=self.activities[0].pk)
+        activity.date = timezone.now() - timedelta(days=1)
+        activity.save()
+        self.assertEqual(self.counts(self.member), (0, 2, 1))
+
+        soft_delete_activity(self.activities[1])
+        self.assertEqual(self.counts(self.member), (0, 1, 0))
+        self.assertEqual(self.counts(self.organizer), (1, 0, 0))
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.body = b'body { color: green; }\n' * 50
+        for name, data in [
+            ('app.0123abcd.css', self.body),
+            ('app.0123abcd.css.gz', gzip.compress(self.body)),
+            ('app.0123abcd.css.br', b'brotli bytes'),
+            ('robots.txt', b'User-agent: *\n'),
+            ('staticfiles.json', json.dumps({'version': '1.1', 'paths': {'app.css': 'app.0123abcd.css'}}).encode()),
+        ]:
+            with open(os.path.join(root.name, name), 'wb') as handle:
+                handle.write(data)
+        self.enterContext(override_settings(STATIC_ROOT=root.name, STATIC_MAX_AGE=60))
+
+    def get(self, path, **headers):
+        response = self.client.get('/static/' + path, **headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response
+
+    def test_precompressed_variant_follows_accept_encoding(self):
+        for accept, encoding, body in [
+            ('gzip, deflate, br', 'br', b'brotli bytes'),
+            ('gzip;q=1.0', 'gzip', gzip.compress(self.body)),
+            ('', None, self.body),
+        ]:
+            response = self.get('app.0123abcd.css', HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get('Content-Encoding'), encoding)
+            self.assertEqual(response.body, body)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+
+        response = self.get('robots.txt', HTTP_ACCEPT_ENCODING='br')
+        self.assertIsNone(response.get('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        # compressed files are only reached through the original name
+        self.assertEqual(self.get('app.0123abcd.css.gz').status_code, 404)
+
+    def test_conditional_requests_get_304(self):
+        response = self.get('app.0123abcd.css', HTTP_ACCEPT_ENCODING='gzip')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get('app.0123abcd.css', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get('app.0123abcd.css', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # each encoding has its own validator, and If-None-Match wins over If-Modified-Since
+        response = self.get(
+            'app.0123abcd.css', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag, HTTP_IF_MODIFIED_SINCE=last_modified,
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class MediaServingTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, MEDIA_SENDFILE=None))
+        self.data = bytes(range(256)) * 4
+        os.makedirs(os.path.join(media_root.name, 'activity_media'))
+        with open(os.path.join(media_root.name, 'activity_media', 'clip.mp4'), 'wb') as handle:
+            handle.write(self.data)
+        self.url = settings.MEDIA_URL + 'activity_media/clip.mp4'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response
+
+    def test_byte_ranges(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response.body), (200, self.data))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response.body), (206, self.data[10:20]))
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.get(HTTP_RANGE='bytes=-100')
+        self.assertEqual((response.status_code, response.body), (206, self.data[-100:]))
+        self.assertEqual(response['Content-Range'], 'bytes 924-1023/1024')
+        response = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.body, self.data[1000:])
+
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+        # a stale If-Range gets the whole, current file
+        response = self.get(HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, response.body), (200, self.data))
+
+    def test_conditional_requests_get_304(self):
+        response = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT').status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_proxy_offload(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response.body), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/activity_media/clip.mp4')
+
+
+class MediaStorageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root.name))
+        self.organizer = User.objects.create(username='organizer')
+        self.activity = Activity.objects.create(
+            title='River Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() + timedelta(days=1), created_by=self.organizer,
+        )
+
+    def upload(self, name, data=b'same picture'):
+        return Media.objects.create(
+            activity=self.activity, created_by=self.organizer, file=SimpleUploadedFile(name, data),
+        )
+
+    def write(self, name, data, age_hours=0):
+        path = os.path.join(self.media_root.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+        stamp = time.time() - age_hours * 3600
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.upload('celebrates.png')
+        second = self.upload('celebrates_copy.PNG')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertRegex(first.file.name, r'^activity_media/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get(name=first.file.name).references, 2)
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replaced_profile_photo_is_released(self):
+        profile = Profile.objects.get(user=self.organizer)
+        profile.user_photo = SimpleUploadedFile('me.jpg', b'old face')
+        profile.save()
+        old_path = profile.user_photo.path
+        profile = Profile.objects.get(pk=profile.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.user_photo = SimpleUploadedFile('me.jpg', b'new face')
+            profile.save()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(profile.user_photo.path))
+
+    def test_garbage_collection_keeps_referenced_and_recent_files(self):
+        kept = self.upload('kept.jpg').file.path
+        os.utime(kept, (time.time() - 7200, time.time() - 7200))
+        orphan = self.write('profiles/left_behind.jpg', b'old photo', age_hours=2)
+        recent = self.write('activity_media/uploading.jpg', b'new upload')
+        self.assertEqual(collect_garbage(grace_hours=1, workers=2, dry_run=True), (1, 9))
+        self.assertTrue(os.path.exists(orphan))
+        self.assertEqual(collect_garbage(grace_hours=1, workers=2), (1, 9))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(kept))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_adopting_legacy_files_collapses_duplicates(self):
+        for name in ('celebrates.png', 'celebrates_WknA5yj.png'):
+            self.write(f'activity_media/{name}', b'party', age_hours=48)
+            Media.objects.create(activity=self.activity, created_by=self.organizer, file=f'activity_media/{name}')
+        self.assertEqual(adopt_legacy_files(), 2)
+        names = set(Media.objects.values_list('file', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(MediaBlob.objects.get(name=names.pop()).references, 2)
+        self.assertEqual(collect_garbage(grace_hours=1, workers=2)[0], 2)
+
+
+@override_settings(UPLOAD_CHUNK_MAX_BYTES=64, MEDIA_MAX_UPLOAD_BYTES=1000, MEDIA_USER_QUOTA_BYTES=1500)
+class ChunkedUploadTest(TestCase):
+    VIDEO = b'\x00\x00\x00\x18ftypmp42' + bytes(range(256)) * 2
+
+    def setUp(self):
+        for setting in ('MEDIA_ROOT', 'UPLOAD_TEMP_DIR'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            self.enterContext(override_settings(**{setting: directory.name}))
+        self.organizer = User.objects.create(username='organizer')
+        self.member = User.objects.create(username='member')
+        self.activity = Activity.objects.create(
+            title='River Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() - timedelta(days=1), created_by=self.organizer,
+        )
+        Registration.objects.create(user=self.member, joined_activity=self.activity)
+        self.client.force_login(self.member)
+
+    def start(self, size, filename='clip.bin'):
+        return self.client.post(
+            reverse('media_upload_start', args=[self.activity.pk]),
+            json.dumps({'filename': filename, 'size': size}), content_type='application/json',
+        )
+
+    def send(self, url, offset, data):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_are_assembled_into_media(self):
+        response = self.start(len(self.VIDEO))
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['upload_url']
+        offset = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            while offset < len(self.VIDEO):
+                response = self.send(url, offset, self.VIDEO[offset:offset + 64])
+                offset = response.json()['offset']
+        self.assertEqual(response.status_code, 201)
+        media = Media.objects.get(activity=self.activity)
+        self.assertTrue(media.file.name.endswith('.mp4'))
+        self.assertTrue(media.is_video())
+        self.assertEqual(media.size, len(self.VIDEO))
+        with media.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.VIDEO)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_TEMP_DIR), [])
+
+    def test_resume_after_offset_mismatch(self):
+        url = self.start(len(self.VIDEO)).json()['upload_url']
+        self.send(url, 0, self.VIDEO[:64])
+        # the client lost track; the server tells it where to carry on
+        response = self.send(url, 0, self.VIDEO[:64])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '64')
+        self.assertEqual(self.client.get(url).json()['offset'], 64)
+        self.assertEqual(self.send(url, 64, self.VIDEO[64:128]).json()['offset'], 128)
+
+    def test_unknown_file_type_is_rejected_on_first_chunk(self):
+        url = self.start(100, 'clip.mp4').json()['upload_url']
+        response = self.send(url, 0, b'#!/bin/sh\nrm -rf /\n' + b' ' * 44)
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_TEMP_DIR), [])
+
+    def test_size_and_quota_are_checked_before_upload(self):
+        self.assertEqual(self.start(1001).status_code, 413)
+        self.assertEqual(self.start(900).status_code, 201)
+        # the open upload already holds 900 bytes of the 1500 byte quota
+        self.assertEqual(self.start(700).status_code, 413)
+        url = self.start(10).json()['upload_url']
+        self.assertEqual(self.send(url, 0, self.VIDEO[:64]).status_code, 413)
+
+    def test_only_participants_after_the_event_can_upload(self):
+        self.client.force_login(User.objects.create(username='stranger'))
+        self.assertEqual(self.start(100).status_code, 403)
+
+    def test_upload_is_dropped_once_the_activity_is_archived(self):
+        url = self.start(len(self.VIDEO)).json()['upload_url']
+        self.send(url, 0, self.VIDEO[:64])
+        Activity.objects.filter(pk=self.activity.pk).update(archived_at=timezone.now())
+        self.assertEqual(self.send(url, 64, self.VIDEO[64:]).status_code, 403)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Media.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_TEMP_DIR), [])
+
+    def test_upload_is_dropped_once_the_activity_is_deleted(self):
+        url = self.start(len(self.VIDEO)).json()['upload_url']
+        self.send(url, 0, self.VIDEO[:64])
+        soft_delete_activity(self.activity)
+        self.assertEqual(self.send(url, 64, self.VIDEO[64:]).status_code, 403)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(Media.objects.exists())
+
+    def test_abandoned_uploads_expire(self):
+        url = self.start(len(self.VIDEO)).json()['upload_url']
+        self.send(url, 0, self.VIDEO[:64])
+        UploadSession.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(expire_uploads(max_age=3600), 1)
+        self.assertEqual(os.listdir(settings.UPLOAD_TEMP_DIR), [])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.jsonl.gz')
+        self.organizer = User.objects.create(username='organizer')
+        self.activity = Activity.objects.create(
+            title='River Cleanup', description='Bring boots', location='Windsor', latitude='42.301000',
+            date=timezone.now() - timedelta(days=1), created_by=self.organizer,
+        )
+        members = User.objects.bulk_create(User(username=f'member{i}') for i in range(300))
+        Registration.objects.bulk_create(Registration(user=member, joined_activity=self.activity) for member in members)
+        Rating.objects.create(activity=self.activity, user=members[0], rating=4, comment='Nice')
+        Activity.objects.filter(pk=self.activity.pk).update(created_at=timezone.now() - timedelta(days=30, microseconds=7))
+
+    def rows(self, model):
+        return list(model._base_manager.order_by('pk').values())
+
+    def test_round_trip_restores_rows_exactly(self):
+        expected = {model: self.rows(model) for model in (User, Activity, Registration, Rating, RatingSummary)}
+        self.assertGreater(dump_snapshot(self.path), 600)
+        Registration.objects.all().delete()
+        Activity.objects.filter(pk=self.activity.pk).update(title='Changed')
+        User.objects.create(username='late')
+
+        with CaptureQueriesContext(connection) as queries:
+            loaded = load_snapshot(self.path, batch_size=100)
+        self.assertGreater(loaded, 600)
+        # batched inserts rather than a save() per row
+        self.assertLess(len(queries), 120)
+        for model, rows in expected.items():
+            self.assertEqual(self.rows(model), rows, model.__name__)
+        # sequences continue after the restored keys
+        self.assertGreater(User.objects.create(username='after').pk, max(row['id'] for row in expected[User]))
+
+
+class TestDatabaseTemplateTest(TestCase):
+    def test_key_covers_code_and_data_the_migrations_import(self):
+        migration = importlib.import_module('main.migrations.0009_activity_location_coordinates')
+        self.assertEqual(migration_inputs(migration), {
+            os.path.join(settings.BASE_DIR, 'main', 'geo.py'), str(GAZETTEER_PATH),
+        })
+        key = template_key('default')
+
+        def edited_gazetteer(path, *args, **kwargs):
+            return BytesIO(b'name,latitude,longitude\n') if str(path) == str(GAZETTEER_PATH) else open(path, *args, **kwargs)
+
+        with mock.patch('main.testing.open', edited_gazetteer, create=True):
+            self.assertNotEqual(template_key('default'), key)
+        self.assertEqual(template_key('default'), key)
+
+
+class GalleryTest(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create(username='organizer')
+        self.activity = Activity.objects.create(
+            title='River Cleanup', description='Bring boots', location='Windsor',
+            date=timezone.now() - timedelta(days=1), created_by=self.organizer,
+        )
+
+    def add_media(self, name):
+        return Media.objects.create(activity=self.activity, created_by=self.organizer, file=f'activity_media/{name}')
+
+    def test_cover_is_first_image(self):
+        self.add_media('intro.mp4')
+        self.assertIsNone(Activity.objects.get(pk=self.activity.pk).cover)
+        first = self.add_media('a.jpg')
+        second = self.add_media('b.png')
+        self.assertEqual(Activity.objects.get(pk=self.activity.pk).cover, first)
+        first.delete()
+        self.assertEqual(Activity.objects.get(pk=self.activity.pk).cover, second)
+        second.delete()
+        self.assertIsNone(Activity.objects.get(pk=self.activity.pk).cover)
+
+    def test_new_cover_invalidates_the_organizers_list(self):
+        before = get_version(f'activities.user.{self.organizer.pk}')
+        self.add_media('a.jpg')
+        self.assertNotEqual(get_version(f'activities.user.{self.organizer.pk}'), before)
+
+    def test_gallery_is_paged_by_cursor(self):
+        for i in range(30):
+            self.add_media(f'photo{i}.jpg')
+        response = self.client.get(reverse('activity_detail', args=[self.activity.pk]))
+        first = response.context['gallery']
+        self.assertEqual(len(first.objects), 12)
+        self.assertContains(response, 'loading="lazy"')
+
+        seen = [media.file.name for media in first.objects]
+        cursor = first.next_cursor
+        while cursor:
+            data = self.client.get(reverse('activity_media', args=[self.activity.pk]), {'after': cursor}).json()
+            seen += re.findall(r'<img src="/media/(activity_media/photo\d+\.jpg)"', data['html'])
+            cursor = data['next_cursor']
+        self.assertEqual(sorted(seen), sorted(f'activity_media/photo{i}.jpg' for i in range(30)))
+
+
+@override_settings(LIVE_COALESCE_SECONDS=0, LIVE_KEEPALIVE_SECONDS=5)
+class LiveEventsTest(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create(username='organizer')
+        self.activity = Activity.objects.create(
+            title='Park Cleanup', description='Bring gloves', location='Windsor',
+            date=timezone.now() + timedelta(days=3), created_by=self.organizer,
+        )
+        self.channel = live.activity_channel(self.activity.pk)
+
+    def test_bursts_are_coalesced(self):
+        subscription = live.Subscription(self.channel, lambda: None)
+        for count in range(1, 6):
+            subscription(live.PARTICIPANTS, {'count': count})
+        for i in range(15):
+            subscription(live.COMMENT, {'id': i})
+        events = subscription.drain()
+        self.assertEqual(events[-1], (live.PARTICIPANTS, {'count': 5}))
+        self.assertEqual([data['id'] for event, data in events[:-1]], list(range(5, 15)))
+        self.assertEqual(subscription.drain(), [])
+
+    def test_registration_is_pushed_to_open_streams(self):
+        response = self.client.get(reverse('activity_events', args=[self.activity.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 5000\n\n')
+        self.assertEqual(next(stream), b'event: participants\ndata: {"count": 0}\n\n')
+
+        member = User.objects.create(username='member')
+        with self.captureOnCommitCallbacks(execute=True):
+            seating.register_user(self.activity, member)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rating.objects.create(activity=self.activity, user=member, comment='See you there')
+        # both changes arrived before the stream woke, so they go out as one batch
+        self.assertIn(b'See you there', next(stream))
+        self.assertEqual(next(stream), b'event: participants\ndata: {"count": 1}\n\n')
+
+        response.close()
+        self.assertFalse(live.get_backend().has_subscribers(self.channel))
+
+    async def test_async_stream_fans_out(self):
+        streams = [live.event_stream(self.channel) for _ in range(50)]
+        for stream in streams:
+            self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+        # idle streams wait on the loop; publish from another thread as a sync view would
+        waiting = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        await asyncio.sleep(0)
+        await asyncio.to_thread(live.get_backend().publish, self.channel, live.PARTICIPANTS, {'count': 7})
+        chunks = await asyncio.gather(*waiting)
+        self.assertEqual(set(chunks), {'event: participants\ndata: {"count": 7}\n\n'})
+        for stream in streams:
+            await stream.aclose()
+        self.assertFalse(live.get_backend().has_subscribers(self.channel))
+
+
+class MetricsTest(TestCase):
+    def test_requests_are_counted_by_url_name(self):
+        user = User.objects.create(username='member')
+        self.client.force_login(user)
+        self.client.get(reverse('home'))
+        self.client.get(reverse('activity_list'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('eco_http_requests_total{view="home",method="GET",status="200"}', body)
+        self.assertIn('eco_http_request_duration_seconds_bucket{view="activity_list",le="+Inf"} ', body)
+        self.assertIn('eco_db_queries_total{view="activity_list"}', body)
+        self.assertIn('eco_template_render_seconds_count{template="main/home.html"}', body)
+        self.assertIn('eco_history_writes_total{view="activity_list"}', body)
+        self.assertIn('eco_cache_requests_total{cache="template-fragments",result="miss"}', body)
+
+    def test_worker_snapshots_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.snapshot_writer.write()
+            with open(os.path.join(directory, 'other-worker.json'), 'w') as handle:
+                json.dump({'eco_upload_bytes_total': [[['activity_detail'], 500]]}, handle)
+            local = dict(metrics.UPLOAD_BYTES._values).get(('activity_detail',), 0)
+            merged = metrics.collect()
+        self.assertEqual(merged['eco_upload_bytes_total'][('activity_detail',)], local + 500)
+
+    def test_exited_workers_are_folded_into_one_file(self):
+        def exited_worker(upload_bytes):
+            process = subprocess.Popen([sys.executable, '-c', ''])
+            process.wait()
+            with open(os.path.join(directory, f'{process.pid}-0123abcd.json'), 'w') as handle:
+                json.dump({'eco_upload_bytes_total': [[['activity_detail'], upload_bytes]]}, handle)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            local = dict(metrics.UPLOAD_BYTES._values).get(('activity_detail',), 0)
+            exited_worker(500)
+            exited_worker(300)
+            self.assertEqual(metrics.collect()['eco_upload_bytes_total'][('activity_detail',)], local + 800)
+            files = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+            self.assertEqual(files, [metrics.snapshot_writer.filename(), metrics.RETIRED_FILENAME])
+
+            exited_worker(200)
+            self.assertEqual(metrics.collect()['eco_upload_bytes_total'][('activity_detail',)], local + 1000)
+            self.assertEqual(metrics.collect()['eco_upload_bytes_total'][('activity_detail',)], local + 1000)
+
+    def test_cache_lookups_are_counted_for_any_backend(self):
+        class InstrumentedFileCache(metrics.InstrumentedCacheMixin, FileBasedCache):
+            pass
+
+        def counted(result):
+            return dict(metrics.CACHE_REQUESTS._values).get(('files', result), 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            files = InstrumentedFileCache(directory, {'METRICS_LABEL': 'files'})
+            files.set('a', 1)
+            files.get('a')
+            files.get('b')
+            self.assertEqual(files.get_many(['a', 'b', 'c']), {'a': 1})
+            # a miss, then the read-back after storing the value
+            files.get_or_set('d', 4)
+        self.assertEqual((counted('hit'), counted('miss')), (3, 4))
+
+    def test_metrics_are_private(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 404)
+
+
+class SlowQueryTest(TestCase):
+    def test_fingerprint_groups_literals_and_in_lists(self):
+        first, normalized = slow_queries.fingerprint("SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s) LIMIT 21")
+        second, _ = slow_queries.fingerprint("SELECT *  FROM t WHERE a = 'yy' AND b IN (%s, %s, %s) LIMIT 5")
+        self.assertEqual(first, second)
+        self.assertEqual(normalized, 'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?')
+
+    def test_text_parameters_are_redacted(self):
+        self.assertEqual(slow_queries.redact([7, None, 'secret@example.com']), '7, None, <str len=18>')
+
+    def test_wrapper_survives_a_connection_opened_inside_a_request(self):
+        self.addCleanup(setattr, connection, 'execute_wrappers', list(connection.execute_wrappers))
+        connection.execute_wrappers.remove(slow_queries.record_slow_queries)
+        # what happens when the first query of a request opens the connection under MetricsMiddleware
+        with connection.execute_wrapper(lambda execute, *args: execute(*args)):
+            slow_queries.install(connection)
+        self.assertIn(slow_queries.record_slow_queries, connection.execute_wrappers)
+        wrappers = list(connection.execute_wrappers)
+        for _ in range(3):
+            self.client.get(reverse('activity_list'))
+        self.assertEqual(connection.execute_wrappers, wrappers)
+
+    def test_slow_queries_are_saved_with_plan_and_caller(self):
+        slow_queries.install(connection)
+        Activity.objects.create(
+            title='Beach cleanup', description='d', location='Beach',
+            date=timezone.now() + timedelta(days=3), created_by=User.objects.create(username='organizer'),
+        )
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('main.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('activity_list'))
+        self.assertTrue(any('view=activity_list' in line for line in logs.output))
+        # nothing is written while the request is handled
+        self.assertFalse(SlowQuery.objects.exists())
+        self.assertGreater(slow_queries.slow_query_buffer.flush(), 0)
+        entry = SlowQuery.objects.filter(view='activity_list', sql__contains='"main_activity"').first()
+        self.assertIsNotNone(entry)
+        self.assertTrue(entry.plan)
+        self.assertTrue(entry.location.startswith('main' + os.sep))
+        self.assertEqual(len(entry.samples), entry.count)
+        self.assertIsNotNone(entry.percentile(0.95))
+
+
+class AnalyticsTest(TestCase):
+    def setUp(self):
+        self.organizer = User.objects.create(username='organizer')
+        Profile.objects.filter(user=self.organizer).update(is_organizer=True)
+        self.members = User.objects.bulk_create(User(username=f'member{i}') for i in range(4))
+        now = timezone.now()
+        self.busy, self.quiet = Activity.objects.bulk_create(
+            Activity(title=title, description='d', location='Windsor', date=now + timedelta(days=5),
+                     created_by=self.organizer)
+            for title in ('Busy cleanup', 'Quiet cleanup')
+        )
+        Registration.objects.bulk_create(
+            Registration(user=member, joined_activity=self.busy, status='cancelled' if i == 0 else 'joined')
+            for i, member in enumerate(self.members)
+        )
+        Rating.objects.bulk_create([
+            Rating(activity=self.busy, user=self.members[1], rating=5, comment='Great'),
+            Rating(activity=self.busy, user=self.members[2], rating=3, comment='Fine'),
+            Rating(activity=self.busy, user=self.members[3], comment='No stars'),
+        ])
+        ActivityCounter.objects.create(
+            activity=self.busy, hour=now.replace(minute=0, second=0, microsecond=0), views=12)
+
+    def test_report_reads_rollups(self):
+        refresh_rollups()
+        today = timezone.localdate()
+        report = organizer_report(self.organizer.pk, today - timedelta(days=6), today)
+        self.assertEqual(len(report['days']), 7)
+        self.assertEqual(report['series']['registrations'], [0] * 6 + [4])
+        self.assertEqual(report['totals']['views'], 12)
+        self.assertEqual(report['totals']['cancellation_rate'], 0.25)
+        self.assertEqual(report['totals']['average_rating'], 4.0)
+        self.assertEqual([row['title'] for row in report['activities']], ['Busy cleanup'])
+
+    def test_refresh_only_recomputes_changed_activities(self):
+        refresh_rollups()
+        # the current hour's view counter may still grow, so its activity is always rechecked
+        self.assertEqual(refresh_rollups(), 1)
+        Registration.objects.create(user=self.organizer, joined_activity=self.quiet)
+        registration = Registration.objects.get(user=self.members[1], joined_activity=self.busy)
+        registration.status = 'cancelled'
+        registration.save()
+        self.assertEqual(refresh_rollups(), 2)
+        totals = {
+            row.activity_id: (row.registrations, row.cancellations)
+            for row in ActivityDailyStats.objects.filter(day=timezone.localdate())
+        }
+        self.assertEqual(totals, {self.busy.pk: (4, 2), self.quiet.pk: (1, 0)})
+
+    def test_api_is_for_organizers(self):
+        refresh_rollups()
+        self.client.force_login(self.members[0])
+        self.assertEqual(self.client.get(reverse('analytics_api')).status_code, 403)
+        self.client.force_login(self.organizer)
+        data = self.client.get(reverse('analytics_api')).json()
+        self.assertEqual(data['totals']['registrations'], 4)
+        self.assertEqual(len(data['series']['views']), 30)
+        self.assertEqual(self.client.get(reverse('analytics_api') + '?start=2026-13-01').status_code, 400)
+        self.assertContains(self.client.get(reverse('organizer_analytics')), 'Busy cleanup')
+
+
+def seed_dataset(users=40, activities=120):
+    """A medium-sized site: enough rows that a per-row query shows up in every budget."""
+    now = timezone.now()
+    User.objects.bulk_create(User(username=f'member{i}', email=f'member{i}@example.com') for i in range(users))
+    members = list(User.objects.filter(username__startswith='member').order_by('pk'))
+    Profile.objects.bulk_create(
+        Profile(user=user, is_organizer=i % 5 == 0, organization_name=f'Org {i}' if i % 5 == 0 else '')
+        for i, user in enumerate(members)
+    )
+    categories = [value for value, _ in Activity.CATEGORY_CHOICES]
+    Activity.objects.bulk_create(
+        Activity(
+            title=f'Activity {i}', description='Help out ' * 20, location='Windsor',
+            latitude=42.3 + i / 1000, longitude=-83.0, geohash=encode_geohash(42.3 + i / 1000, -83.0),
+            category=categories[i % len(categories)], created_by=members[i % users], is_featured=i % 10 == 0,
+            # a third of the activities are in the past so they can be rated
+            date=now + timedelta(days=(i % 30) + 1) if i % 3 else now - timedelta(days=(i % 30) + 1),
+        )
+        for i in range(activities)
+    )
+    all_activities = list(Activity.objects.order_by('pk'))
+    Media.objects.bulk_create(
+        Media(activity=activity, created_by=activity.created_by, file=f'activity_media/photo{activity.pk}_{n}.jpg')
+        for activity in all_activities[::2] for n in range(3)
+    )
+    Registration.objects.bulk_create(
+        Registration(user=members[(i + n) % users], joined_activity=activity, status='joined')
+        for i, activity in enumerate(all_activities) for n in range(8)
+    )
+    Rating.objects.bulk_create(
+        Rating(activity=activity, user=members[(i + n) % users], rating=(n % 5) + 1, comment='Great event')
+        for i, activity in enumerate(all_activities) if activity.date < now for n in range(5)
+    )
+    for activity in all_activities:
+        refresh_cover(activity.pk)
+        if activity.date < now:
+            refresh_summary(activity.pk)
+    UserHistory.objects.bulk_create(
+        UserHistory(user=members[0], action=f'Visited activity: {activity.title}') for activity in all_activities[:40]
+    )
+    return members, all_activities
+
+
+@override_settings(
+    RATELIMIT_ENABLE=False, TRENDING_FLUSH_INTERVAL=10 ** 9, TRENDING_MAX_PENDING=10 ** 9,
+    SLOW_QUERY_THRESHOLD_MS=None,
+)
+class PerformanceBudgetTest(TestCase):
+    """Query-count and latency budgets for every URL in main/urls.py.
+
+    Query budgets are maximums for a cold cache; with 120 activities, 40 users and
+    ~1000 registrations, any per-row query overshoots them by an order of magnitude.
+    Latency budgets are medians in milliseconds, scaled by PERF_BUDGET_TOLERANCE
+    (default 1.0) for slow machines.
+    """
+
+    TIMING_RUNS = 5
+    # form data for the write paths, keyed by page label
+    POST_DATA = {'rate': {'rating': 4, 'comment': 'Lovely morning'}}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.members, cls.activities = seed_dataset()
+        cls.member = cls.members[0]
+        cls.staff = User.objects.create_user('staffer', 'staff@example.com', 'pw', is_staff=True)
+        now = timezone.now()
+        cls.upcoming = next(a for a in cls.activities if a.date > now and a.created_by != cls.member)
+        cls.past = next(a for a in cls.activities if a.date < now)
+        cls.own_rating = Rating.objects.filter(user=cls.member).first()
+        cls.media_cursor = encode_cursor(cls.activities[0].media.order_by('-created_at', '-pk')[0])
+        cls.comments_cursor = encode_cursor(cls.past.ratings.order_by('-created_at', '-pk')[1])
+        refresh_rollups()
+
+    def setUp(self):
+        cache.clear()
+        caches['template_fragments'].clear()
+
+    def tearDown(self):
+        # write buffered view counters inside the test transaction so they are rolled back with it
+        counter_buffer.flush()
+
+    def login(self, who):
+        if who is not None:
+            self.client.force_login(getattr(self, who))
+
+    def request(self, method, url, who, data=None):
+        self.login(who)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        return response, queries
+
+    def assertMaxQueries(self, label, budget, queries):
+        if len(queries) > budget:
+            listing = '\n'.join(f"  {i}. {query['sql']}" for i, query in enumerate(queries.captured_queries, 1))
+            self.fail(f"{label}: {len(queries)} queries, budget is {budget}\n{listing}")
+
+    def pages(self):
+        """(label, method, url, logged in as, max queries); writes run in order, so register precedes cancel."""
+        upcoming, past = self.upcoming.pk, self.past.pk
+        return [
+            ('home', 'get', reverse('home'), None, 8),
+            ('home', 'get', reverse('home'), 'member', 9),
+            ('activity list', 'get', reverse('activity_list'), None, 2),
+            ('activity list', 'get', reverse('activity_list'), 'member', 6),
+            ('activity list, past', 'get', reverse('activity_list') + '?date_filter=past', 'member', 6),
+            ('activity list, trending', 'get', reverse('activity_list') + '?sort=trending', None, 2),
+            ('activity list, near', 'get', reverse('activity_list') + '?near=42.35,-83.0&radius=20', None, 2),
+            ('signup', 'get', reverse('signup'), None, 0),
+            ('login', 'get', reverse('login'), None, 0),
+            ('activity create', 'get', reverse('activity_create'), 'member', 2),
+            ('activity detail', 'get', reverse('activity_detail', args=[upcoming]), None, 9),
+            ('activity detail', 'get', reverse('activity_detail', args=[upcoming]), 'member', 13),
+            ('activity detail, past', 'get', reverse('activity_detail', args=[past]), 'member', 13),
+            ('activity media', 'get', reverse('activity_media', args=[self.activities[0].pk]) + '?after=' + self.media_cursor, None, 2),
+            ('activity events', 'get', reverse('activity_events', args=[upcoming]), None, 2),
+            ('activity comments', 'get', reverse('activity_comments', args=[past]) + '?after=' + self.comments_cursor, None, 2),
+            ('search suggest', 'get', reverse('search_suggest') + '?q=Activity', None, 1),
+            ('activities api', 'get', reverse('activities_api'), None, 1),
+            ('activities api, near', 'get', reverse('activities_api') + '?near=42.35,-83.0&radius=20', None, 2),
+            ('register', 'post', reverse('activity_register', args=[upcoming]), 'member', 11),
+            ('cancel', 'post', reverse('activity_cancel', args=[upcoming]), 'member', 10),
+            ('toggle featured', 'post', reverse('toggle_featured', args=[upcoming]), 'staff', 5),
+            ('delete activity', 'get', reverse('activity_delete', args=[upcoming]), 'member', 4),
+            ('dashboard', 'get', reverse('user_dashboard'), None, 0),
+            ('dashboard', 'get', reverse('user_dashboard'), 'member', 8),
+            ('history', 'get', reverse('user_history'), 'member', 4),
+            ('contact', 'get', reverse('contact_us'), None, 0),
+            ('about', 'get', reverse('about_us'), None, 0),
+            ('rate', 'post', reverse('submit_rating', args=[past]), 'member', 8),
+            ('delete comment', 'post', reverse('delete_comment', args=[self.own_rating.activity_id, self.own_rating.pk]), 'member', 9),
+            ('profile', 'get', reverse('user_profile', args=[self.member.username]), 'member', 6),
+            ('analytics', 'get', reverse('organizer_analytics'), 'member', 6),
+            ('analytics api', 'get', reverse('analytics_api'), 'member', 6),
+            ('activity feed', 'get', reverse('activity_feed'), None, 1),
+            ('official feed', 'get', reverse('official_feed'), None, 1),
+            ('category feed', 'get', reverse('category_feed', args=['Cleanup']), None, 1),
+            ('user feed', 'get', reverse('user_feed', args=[make_user_feed_token(self.member)]), None, 1),
+            ('metrics', 'get', reverse('metrics'), None, 0),
+        ]
+
+    def test_query_budgets(self):
+        for label, method, url, who, budget in self.pages():
+            with self.subTest(label, user=who or 'anonymous'):
+                self.client.logout()
+                cache.clear()
+                caches['template_fragments'].clear()
+                response, queries = self.request(method, url, who, self.POST_DATA.get(label))
+                self.assertLess(response.status_code, 400, f"{label} returned {response.status_code}")
+                self.assertMaxQueries(f"{label} ({who or 'anonymous'})", budget, queries)
+
+    def test_latency_budgets(self):
+        tolerance = float(os.environ.get('PERF_BUDGET_TOLERANCE', '1.0'))
+        for label, url, who, budget_ms in self.timed_pages():
+            with self.subTest(label, user=who or 'anonymous'):
+                self.client.logout()
+                self.login(who)
+                self.client.get(url)  # warm up caches and lazy imports
+                timings = []
+                for _ in range(self.TIMING_RUNS):
+                    started = time.perf_counter()
+                    self.client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                median = statistics.median(timings)
+                self.assertLessEqual(
+                    median, budget_ms * tolerance,
+                    f"{label} ({who or 'anonymous'}) took {median:.1f}ms (median of {self.TIMING_RUNS}), "
+                    f"budget is {budget_ms * tolerance:.0f}ms; set PERF_BUDGET_TOLERANCE to scale budgets on slow machines",
+                )
+
+    def timed_pages(self):
+        """(label, url, logged in as, median budget in ms) for the pages users hit most."""
+        return [
+            ('home', reverse('home'), None, 60),
+            ('activity list', reverse('activity_list'), None, 250),
+            ('activity list', reverse('activity_list'), 'member', 250),
+            ('activity detail', reverse('activity_detail', args=[self.upcoming.pk]), 'member', 80),
+            ('dashboard', reverse('user_dashboard'), 'member', 60),
+            ('activities api', reverse('activities_api'), None, 30),
+            ('activity feed', reverse('activity_feed'), None, 30),
+        ]
@@ -0,0 +1,170 @@
+# main/trending.py
+import atexit
+import logging
+import math
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .background import PeriodicFlusher
+from .models import Activity, ActivityCounter, TrendingActivity
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('views', 'registrations', 'ratings')
+WEIGHTS = {'views': 1.0, 'registrations': 5.0, 'ratings': 3.0}
+HALF_LIFE_HOURS = 24
+WINDOW_DAYS = 7
+
+
+def current_hour():
+    return timezone.now().replace(minute=0, second=0, microsecond=0)
+
+
+class CounterBuffer:
+    """Accumulates counter increments in memory and writes them in one batch.
+
+    Each process keeps its own buffer, written by a background thread every
+    TRENDING_FLUSH_INTERVAL seconds (sooner once TRENDING_MAX_PENDING pairs are waiting),
+    so requests only ever touch memory. A flush turns every (activity, hour) pair into
+    one UPDATE instead of one UPDATE per event.
+    """
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        self._lock = threading.Lock()
+        self._flusher = PeriodicFlusher('trending-counters', self.flush, lambda: self._settings()[0])
+
+    def _settings(self):
+        interval = self.flush_interval
+        if interval is None:
+            interval = getattr(settings, 'TRENDING_FLUSH_INTERVAL', 60)
+        max_pending = self.max_pending
+        if max_pending is None:
+            max_pending = getattr(settings, 'TRENDING_MAX_PENDING', 1000)
+        return interval, max_pending
+
+    def add(self, activity_id, field, amount=1):
+        _, max_pending = self._settings()
+        with self._lock:
+            self._pending[(activity_id, current_hour())][field] += amount
+            full = len(self._pending) >= max_pending
+        if not self._flusher.start():
+            # no flusher thread: keep memory bounded by writing here instead
+            if full:
+                self.flush()
+        elif full:
+            self._flusher.wake()
+
+    def _take(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+        return pending
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, counts in pending.items():
+                for field, amount in counts.items():
+                    self._pending[key][field] += amount
+
+    def flush(self, quiet=False):
+        """Write pending increments to ActivityCounter; returns the number of rows touched."""
+        pending = self._take()
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                # counts for an activity purged since they were recorded are dropped; writing them
+                # would fail the foreign key check at commit on every flush from now on
+                live = set(Activity.all_objects.filter(
+                    pk__in={activity_id for activity_id, _ in pending},
+                ).values_list('pk', flat=True))
+                pending = {key: counts for key, counts in pending.items() if key[0] in live}
+                ActivityCounter.objects.bulk_create(
+                    [ActivityCounter(activity_id=activity_id, hour=hour) for activity_id, hour in pending],
+                    ignore_conflicts=True,
+                )
+                for (activity_id, hour), counts in pending.items():
+                    ActivityCounter.objects.filter(activity_id=activity_id, hour=hour).update(
+                        **{field: F(field) + amount for field, amount in counts.items() if amount}
+                    )
+        except DatabaseError as exc:
+            if quiet:
+                logger.warning("Could not flush activity counters: %s", exc)
+            else:
+                logger.exception("Could not flush activity counters; keeping them for the next flush")
+            self._restore(pending)
+            return 0
+        return len(pending)
+
+
+counter_buffer = CounterBuffer()
+# the database may already be gone at exit (e.g. a torn-down test database)
+atexit.register(counter_buffer.flush, quiet=True)
+
+
+def record_view(activity_id):
+    counter_buffer.add(activity_id, 'views')
+
+
+def record_registration(activity_id):
+    counter_buffer.add(activity_id, 'registrations')
+
+
+def record_rating(activity_id):
+    counter_buffer.add(activity_id, 'ratings')
+
+
+def compute_trending_scores(now=None):
+    """Return {activity_id: score} for upcoming activities from the last WINDOW_DAYS of counters."""
+    now = now or timezone.now()
+    decay = math.log(2) / HALF_LIFE_HOURS
+    scores = defaultdict(float)
+    rows = ActivityCounter.objects.filter(
+        hour__gte=now - timedelta(days=WINDOW_DAYS),
+        activity__date__gte=now,
+        activity__deleted_at__isnull=True,
+    ).values_list('activity_id', 'hour', *FIELDS)
+    for activity_id, hour, *counts in rows.iterator(chunk_size=5000):
+        age_hours = max(0.0, (now - hour).total_seconds() / 3600)
+        weight = math.exp(-decay * age_hours)
+        scores[activity_id] += weight * sum(WEIGHTS[field] * count for field, count in zip(FIELDS, counts))
+    return scores
+
+
+def update_trending(now=None):
+    """Rebuild the TrendingActivity ranking table from ActivityCounter."""
+    now = now or timezone.now()
+    # web workers' counters arrive through their own flusher threads, at most
+    # TRENDING_FLUSH_INTERVAL late; this only matters when called in a process that
+    # records events itself, such as a shell or a test
+    counter_buffer.flush()
+    scores = compute_trending_scores(now)
+    with transaction.atomic():
+        TrendingActivity.objects.all().delete()
+        TrendingActivity.objects.bulk_create(
+            [
+                TrendingActivity(activity_id=activity_id, score=score, computed_at=now)
+                for activity_id, score in scores.items()
+                if score > 0
+            ],
+            batch_size=500,
+        )
+    return len(scores)
+
+
+def trending_activities(limit):
+    """Top upcoming activities by precomputed score, read with one ordered query."""
+    return list(
+        Activity.objects.upcoming().filter(trending__isnull=False)
+        .select_related('created_by__profile', 'cover')
+        .order_by('-trending__score')[:limit]
+    )
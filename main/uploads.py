@@ -0,0 +1,212 @@
+# main/uploads.py
+import os
+import posixpath
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Activity, Media, Registration, UploadSession
+
+#enough of the start of a file to recognise every type we accept
+SNIFF_BYTES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A rejected upload or chunk; `offset` tells the client where to resume."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def sniff(head):
+    """(kind, extension) from the first bytes of a file, or None for types that are not accepted."""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image', '.png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image', '.jpg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image', '.gif'
+    if head[4:8] == b'ftyp':
+        return 'video', '.mov' if head[8:12] == b'qt  ' else '.mp4'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'video', '.avi'
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video', '.mkv'
+    return None
+
+
+def can_upload_media(user, activity):
+    """Media can be added by registered participants once the event has passed"""
+    return (
+        user.is_authenticated
+        and activity.archived_at is None
+        and activity.date < timezone.now()
+        and Registration.objects.filter(user=user, joined_activity=activity, status='joined').exists()
+    )
+
+
+def check_still_open(session):
+    """Drop an upload whose activity was archived or deleted, or whose uploader left it, since it began."""
+    activity = Activity.objects.filter(pk=session.activity_id).first()
+    if activity is None or not can_upload_media(session.user, activity):
+        abort_upload(session)
+        raise UploadError("This activity no longer accepts uploads.", 403)
+
+
+def max_upload_bytes():
+    return getattr(settings, 'MEDIA_MAX_UPLOAD_BYTES', 500 * 1024 * 1024)
+
+
+def max_chunk_bytes():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+
+
+def check_limits(user, size):
+    """Refuse a file of `size` bytes that is too large or would put `user` over quota."""
+    if size > max_upload_bytes():
+        raise UploadError(f"Files can be at most {max_upload_bytes() // (1024 * 1024)} MB.", 413)
+    quota = getattr(settings, 'MEDIA_USER_QUOTA_BYTES', None)
+    if quota is None:
+        return
+    # uploads still in progress hold their full size
+    used = (Media.objects.filter(created_by=user).aggregate(total=Sum('size'))['total'] or 0) + (
+        UploadSession.objects.filter(user=user).aggregate(total=Sum('size'))['total'] or 0
+    )
+    if used + size > quota:
+        raise UploadError("This upload would exceed your storage quota.", 413)
+
+
+def upload_dir():
+    directory = getattr(settings, 'UPLOAD_TEMP_DIR', None) or os.path.join(settings.BASE_DIR, 'upload_parts')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f'{session.pk}.part')
+
+
+def start_upload(activity, user, filename, size):
+    """Open a resumable upload of `size` bytes; limits are checked before any data is sent."""
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError("A file size is required.")
+    check_limits(user, size)
+    session = UploadSession.objects.create(
+        activity=activity, user=user, filename=posixpath.basename(str(filename))[:255] or 'upload', size=size,
+    )
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def _read_head(stream, length):
+    head = b''
+    while len(head) < length:
+        block = stream.read(length - len(head))
+        if not block:
+            break
+        head += block
+    return head
+
+
+def write_chunk(session, offset, stream, length):
+    """Append `length` bytes from `stream` at `offset`, straight to the part file.
+
+    Returns the new Media once the last byte is in, otherwise None.
+    """
+    check_still_open(session)
+    if offset != session.received:
+        raise UploadError("Offset does not match the bytes received so far.", 409, session.received)
+    if length is None:
+        raise UploadError("Content-Length is required.", 411, session.received)
+    if length > max_chunk_bytes() or offset + length > session.size:
+        raise UploadError("Chunk is too large.", 413, session.received)
+
+    extension = session.extension
+    written = 0
+    with open(part_path(session), 'r+b') as handle:
+        handle.seek(offset)
+        try:
+            if offset == 0:
+                head = _read_head(stream, min(SNIFF_BYTES, length))
+                if len(head) < min(SNIFF_BYTES, session.size):
+                    raise UploadError("The first chunk is too short to tell the file type.", 400, 0)
+                detected = sniff(head)
+                if detected is None:
+                    abort_upload(session)
+                    raise UploadError("Only images (PNG, JPG, GIF) and videos (MP4, MOV, AVI, MKV) can be uploaded.", 415)
+                extension = detected[1]
+                handle.write(head)
+                written = len(head)
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                handle.write(block)
+                written += len(block)
+        finally:
+            # keep whatever arrived before a dropped connection, so the client resumes from there
+            if written and not UploadSession.objects.filter(pk=session.pk, received=offset).update(
+                received=offset + written, extension=extension, updated_at=timezone.now(),
+            ):
+                current = UploadSession.objects.filter(pk=session.pk).values_list('received', flat=True).first()
+                raise UploadError("Another request is writing this upload.", 409, current)
+    session.received, session.extension = offset + written, extension
+    if written < length:
+        raise UploadError("The chunk ended early.", 400, session.received)
+    if session.received == session.size:
+        return finish_upload(session)
+    return None
+
+
+def finish_upload(session):
+    """Turn the complete part file into a Media row in one transaction."""
+    check_still_open(session)
+    path = part_path(session)
+    stem = posixpath.splitext(session.filename)[0][:50] or 'upload'
+    with open(path, 'rb') as handle, transaction.atomic():
+        media = Media(activity_id=session.activity_id, created_by_id=session.user_id, size=session.size)
+        media.file.save(stem + session.extension, File(handle), save=False)
+        media.save()
+        session.delete()
+    transaction.on_commit(lambda: _remove(path))
+    return media
+
+
+def abort_upload(session):
+    path = part_path(session)
+    session.delete()
+    _remove(path)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def expire_uploads(max_age=None):
+    """Drop uploads idle longer than UPLOAD_SESSION_MAX_AGE seconds, and part files with no session."""
+    if max_age is None:
+        max_age = getattr(settings, 'UPLOAD_SESSION_MAX_AGE', 24 * 3600)
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=max_age))
+    expired = 0
+    for session in stale.iterator():
+        abort_upload(session)
+        expired += 1
+    cutoff = time.time() - max_age
+    directory = upload_dir()
+    live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith('.part') and entry.name not in live and entry.stat().st_mtime < cutoff:
+                _remove(entry.path)
+    return expired
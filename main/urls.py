@@ -1,26 +1,43 @@
 # main/urls.py
 from django.urls import path
 from . import views
+from .ratelimit import ratelimit
+
+# per-client request budgets; writes are only limited on POST
+WRITE_RATE = '30/m'
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('activities/', views.ActivityListView.as_view(), name='activity_list'),
-    path('signup/', views.signup, name='signup'),
-    path('accounts/login/', views.CustomLoginView.as_view(), name='login'),
-    path('activity/new/', views.activity_create, name='activity_create'),
-    path('activity/<int:pk>/', views.ActivityDetailView.as_view(), name='activity_detail'),
-    path('search-suggest/', views.search_suggest, name='search_suggest'),
-    path('activity/<int:pk>/register/', views.register_activity, name='activity_register'),
-    path('activity/<int:pk>/cancel/', views.cancel_registration, name='activity_cancel'),
+    path('signup/', ratelimit('5/h', key='ip', methods=['POST'])(views.signup), name='signup'),
+    path('accounts/login/', ratelimit('10/m', key='ip', methods=['POST'])(views.CustomLoginView.as_view()), name='login'),
+    path('activity/new/', ratelimit(WRITE_RATE, methods=['POST'])(views.activity_create), name='activity_create'),
+    path('activity/<int:pk>/', ratelimit(WRITE_RATE, methods=['POST'])(views.ActivityDetailView.as_view()), name='activity_detail'),
+    path('activity/<int:pk>/comments/', ratelimit('60/m')(views.activity_comments), name='activity_comments'),
+    path('activity/<int:pk>/media/', ratelimit('60/m')(views.activity_media), name='activity_media'),
+    path('activity/<int:pk>/uploads/', ratelimit(WRITE_RATE, methods=['POST'])(views.media_upload_start), name='media_upload_start'),
+    path('activity/<int:pk>/uploads/<uuid:upload_id>/', ratelimit('600/m')(views.media_upload), name='media_upload'),
+    path('activity/<int:pk>/events/', ratelimit('30/m')(views.activity_events), name='activity_events'),
+    path('search-suggest/', ratelimit('60/m')(views.search_suggest), name='search_suggest'),
+    path('api/activities/', ratelimit('60/m')(views.activities_api), name='activities_api'),
+    path('activity/<int:pk>/register/', ratelimit(WRITE_RATE, methods=['POST'])(views.register_activity), name='activity_register'),
+    path('activity/<int:pk>/cancel/', ratelimit(WRITE_RATE, methods=['POST'])(views.cancel_registration), name='activity_cancel'),
     path('activity/<int:pk>/toggle-featured/', views.toggle_featured, name='toggle_featured'),
     path('activity/<int:pk>/delete/', views.activity_delete, name='activity_delete'),
     path('dashboard/', views.user_dashboard, name='user_dashboard'),
     path('history/', views.user_history, name='user_history'),
-    path('contact/', views.contact_us, name='contact_us'),
+    path('contact/', ratelimit('5/h', key='ip', methods=['POST'])(views.contact_us), name='contact_us'),
     path('about/', views.about_us, name='about_us'),
-    path('activity/<int:pk>/rate/', views.submit_rating, name='submit_rating'),
+    path('activity/<int:pk>/rate/', ratelimit(WRITE_RATE, methods=['POST'])(views.submit_rating), name='submit_rating'),
     path('activity/<int:pk>/comment/<int:rating_id>/delete/', views.delete_comment, name='delete_comment'),
     path('profile/<str:username>/', views.user_profile, name='user_profile'),
+    path('analytics/', views.organizer_analytics, name='organizer_analytics'),
+    path('api/analytics/', ratelimit('60/m')(views.analytics_api), name='analytics_api'),
+    path('feeds/activities.ics', views.activity_feed, name='activity_feed'),
+    path('feeds/official.ics', views.official_feed, name='official_feed'),
+    path('feeds/category/<str:category>.ics', views.category_feed, name='category_feed'),
+    path('feeds/user/<str:token>.ics', views.user_feed, name='user_feed'),
+    path('metrics', views.metrics_view, name='metrics'),
 
 
 ]
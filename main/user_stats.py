@@ -0,0 +1,48 @@
+# main/user_stats.py
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import versioned_key
+from .models import Activity
+
+USER_STATS_MAX_AGE = 60 * 60
+
+
+def compute_user_stats(user_id, now=None):
+    """Dashboard/profile counters for one user in a single conditional-aggregate query."""
+    now = now or timezone.now()
+    created = (
+        Activity.objects.filter(created_by=OuterRef('pk'))
+        .order_by()
+        .values('created_by')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    joined = Q(registrations__status='joined', registrations__joined_activity__deleted_at__isnull=True)
+    upcoming = joined & Q(registrations__joined_activity__date__gte=now)
+    return User.objects.filter(pk=user_id).annotate(
+        created_count=Coalesce(Subquery(created), 0),
+        joined_count=Count('registrations', filter=joined),
+        upcoming_count=Count('registrations', filter=upcoming),
+        next_start=Min('registrations__joined_activity__date', filter=upcoming),
+    ).values('created_count', 'joined_count', 'upcoming_count', 'next_start').first()
+
+
+def get_user_stats(user_id):
+    """Cached stats for `user_id`, rebuilt after the user's activities or registrations change."""
+    key = versioned_key(f'userstats:{user_id}', f'activities.user.{user_id}', f'registrations.user.{user_id}')
+    stats = cache.get(key)
+    if stats is None:
+        now = timezone.now()
+        stats = compute_user_stats(user_id, now) or {
+            'created_count': 0, 'joined_count': 0, 'upcoming_count': 0, 'next_start': None,
+        }
+        timeout = USER_STATS_MAX_AGE
+        if stats['next_start'] is not None:
+            # the next registered event stops counting as upcoming once it starts
+            timeout = max(1, min(timeout, int((stats['next_start'] - now).total_seconds()) + 1))
+        cache.set(key, stats, timeout)
+    return stats
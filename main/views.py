@@ -1,17 +1,49 @@
 # main/views.py
+import json
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.models import User
-from .models import Activity, Media, Registration, UserHistory, Rating, Profile
+from .models import Activity, Media, Registration, UserHistory, Rating, Profile, UploadSession
+from django.conf import settings
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponseRedirect
-from django.db.models import Q
+from django.http import JsonResponse, HttpResponseRedirect, HttpResponse, HttpResponseNotAllowed, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, F, Q
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.template.loader import render_to_string
 from .forms import CustomSignupForm, ContactMessageForm, RatingForm, ProfilePictureForm
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.views import LoginView as DjangoLoginView
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from .feeds import get_feed, make_user_feed_token, read_user_feed_token, upcoming_feed_queryset
+from . import live, metrics, seating
+from .caching import get_version, get_versions
+from .recommendations import get_recommendations
+from .user_stats import get_user_stats
+from .trending import record_rating, record_registration, record_view, trending_activities
+from .geo import filter_bbox, filter_near, parse_bbox, parse_point
+from .media_serving import media_response
+from .ratelimit import client_ip
+from .gallery import gallery_page
+from .paging import decode_cursor
+from .ratings import comment_page, get_summary
+from .analytics import organizer_report, parse_range
+from .deletion import soft_delete_activity
+from .facets import facet_counts, get_facets, normalize_query, search_filter
+from .uploads import UploadError, abort_upload, can_upload_media, start_upload, write_chunk
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEAR_RADIUS_KM = 10
+MAX_NEAR_RADIUS_KM = 500
+API_PAGE_SIZE = 100
 
 class ActivityListView(ListView):
     model = Activity
@@ -19,29 +51,29 @@ class ActivityListView(ListView):
     context_object_name = "activities"
 
     def get_queryset(self):
-        q = self.request.GET.get('q', '')
+        q = normalize_query(self.request.GET.get('q', ''))
         category_filter = self.request.GET.get('category', '')
         date_filter = self.request.GET.get('date_filter', 'upcoming')
         official_filter = self.request.GET.get('official', '')
+        sort = self.request.GET.get('sort', '')
         
         now = timezone.now()
         
         queryset = Activity.objects.all()
         
         if date_filter == 'past':
-            queryset = queryset.filter(date__lt=now).order_by('-date')
+            # archived events carry their frozen totals for the cards
+            queryset = queryset.past(now).select_related('archive').order_by('-date')
+        elif sort == 'trending':
+            queryset = queryset.upcoming(now).order_by(F('trending__score').desc(nulls_last=True), 'date')
         else:
-            queryset = queryset.filter(date__gte=now).order_by('date')
+            queryset = queryset.upcoming(now).order_by('date')
         
         if official_filter == 'true':
-            queryset = queryset.filter(created_by__profile__is_organizer=True, date__gte=now)
+            queryset = queryset.filter(created_by__profile__is_organizer=True).upcoming(now)
         
         if q:
-            queryset = queryset.filter(
-                Q(title__icontains=q) |
-                Q(description__icontains=q) |
-                Q(location__icontains=q)
-            )
+            queryset = queryset.filter(search_filter(q))
         
         if category_filter:
             valid_categories = [choice[0] for choice in Activity.CATEGORY_CHOICES]
@@ -50,7 +82,9 @@ class ActivityListView(ListView):
             else:
                 category_filter = ''
         
-        return queryset
+        queryset, self.distances = apply_location_filters(queryset, self.request.GET)
+        # cards show the organizer badge and the cover image; load both up front
+        return queryset.select_related('created_by__profile', 'cover')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -84,14 +118,26 @@ class ActivityListView(ListView):
         # Add current time for relative date calculations
         from django.utils import timezone
         now = timezone.now()
+        # result counts per category and tab for this search; the location filters are not counted
+        category_options, tab_counts = None, None
+        if not parse_point(request.GET.get('near')) and not parse_bbox(request.GET.get('bbox')):
+            tab = 'past' if date_filter == 'past' else 'official' if official_filter == 'true' else 'upcoming'
+            counts, tab_counts = facet_counts(get_facets(q), tab, category_filter)
+            category_options = [(value, label, counts[value]) for value, label in category_choices]
+
         context.update({
-            'query': q,
+            'query': normalize_query(q),
             'category_filter': category_filter,
             'date_filter': date_filter,
             'official_filter': official_filter,
+            'sort': request.GET.get('sort', ''),
             'category_choices': category_choices,
             'registered_ids': registered_ids,
+            'category_options': category_options,
+            'tab_counts': tab_counts,
             'now': now,
+            'near': request.GET.get('near', '') if parse_point(request.GET.get('near')) else '',
+            'radius': parse_radius(request.GET.get('radius')),
         })
 
         return context
@@ -127,7 +173,7 @@ from .forms import ActivityForm, MediaForm
 def activity_create(request):
     if request.method == 'POST':
         form = ActivityForm(request.POST)
-        media_form = MediaForm(request.POST, request.FILES)
+        media_form = MediaForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             activity = form.save(commit=False)
             activity.created_by = request.user  # link to current user
@@ -156,6 +202,9 @@ class ActivityDetailView(DetailView):
     template_name = "main/activity_detail.html"
     context_object_name = "activity"
 
+    def get_queryset(self):
+        return Activity.objects.select_related('created_by__profile', 'rating_summary', 'cover')
+
     def get_object(self):
         """Always load the object so GET and POST work correctly."""
         return super().get_object()
@@ -176,7 +225,11 @@ class ActivityDetailView(DetailView):
                 action=f"Visited activity: {self.object.title}"
             )
 
-        return super().get(request, *args, **kwargs)
+        # global view counter, flushed in batches
+        record_view(self.object.pk)
+
+        # the object is already loaded, so render directly instead of fetching it again in DetailView.get
+        return self.render_to_response(self.get_context_data(object=self.object))
 
     def post(self, request, *args, **kwargs):
         """Handle media uploads - only allowed after event date if user is registered."""
@@ -185,25 +238,11 @@ class ActivityDetailView(DetailView):
         if not request.user.is_authenticated:
             return redirect('login')
 
-        # Check if user can upload: event must have passed AND user must be registered
-        now = timezone.now()
-        event_passed = self.object.date < now
-        is_registered = Registration.objects.filter(
-            user=request.user,
-            joined_activity=self.object,
-            status='joined'
-        ).exists()
-        
-        can_upload = event_passed and is_registered
-        
-        if not can_upload:
-            if not event_passed:
-                messages.error(request, "You can upload media if you registered and the event has passed.")
-            elif not is_registered:
-                messages.error(request, "You can upload media if you registered and the event has passed.")
+        if not can_upload_media(request.user, self.object):
+            messages.error(request, "You can upload media if you registered and the event has passed.")
             return redirect('activity_detail', pk=self.object.pk)
 
-        form = MediaForm(request.POST, request.FILES)
+        form = MediaForm(request.POST, request.FILES, user=request.user)
 
         if form.is_valid():
             media = form.save(commit=False)
@@ -220,37 +259,48 @@ class ActivityDetailView(DetailView):
 
             return redirect('activity_detail', pk=self.object.pk)
 
-        # DEBUG: Show errors so we know what's wrong
-        print("MEDIA UPLOAD ERRORS:", form.errors)
+        logger.info("Media upload to activity %s rejected: %s", self.object.pk, form.errors.as_json())
         messages.error(request, "Error uploading media. Please try again.")
 
         return self.get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['media_items'] = self.object.media.all().order_by('-created_at')
+        # first gallery page, only fetched if the cached gallery fragment is rebuilt
+        context['gallery'] = SimpleLazyObject(lambda: gallery_page(self.object))
         context['media_form'] = MediaForm()
         context['session_activity_visits'] = self.request.session['activity_visits'].get(
             str(self.object.pk), 1
         )
-        # Check if user is registered
+        # Check if user is registered or waiting for a seat
         context['is_registered'] = False
+        context['waitlist_position'] = None
         if self.request.user.is_authenticated:
-            context['is_registered'] = Registration.objects.filter(
+            registration = Registration.objects.filter(
                 user=self.request.user,
                 joined_activity=self.object,
-                status='joined'
-            ).exists()
-        # Get participant count
-        context['participant_count'] = self.object.registrations.filter(status='joined').count()
+                status__in=('joined', 'waitlisted')
+            ).first()
+            if registration is not None:
+                context['is_registered'] = registration.status == 'joined'
+                context['waitlist_position'] = seating.waitlist_position(registration)
+        # Get participant count; archived events keep theirs frozen
+        context['archive'] = self.object.archive if self.object.archived_at else None
+        if context['archive'] is not None:
+            context['participant_count'] = context['archive'].participants
+        else:
+            context['participant_count'] = self.object.registrations.filter(status='joined').count()
         
         # Check if user can upload media (after event date AND registered)
         now = timezone.now()
         context['event_passed'] = self.object.date < now
-        context['can_upload_media'] = context['event_passed'] and context['is_registered'] and self.request.user.is_authenticated
+        context['can_upload_media'] = (
+            context['event_passed'] and context['is_registered'] and self.request.user.is_authenticated
+            and context['archive'] is None
+        )
         
-        # Get ratings and comments
-        context['ratings'] = self.object.ratings.all().order_by('-created_at')
+        # first page of comments, only fetched if the cached comments fragment is rebuilt
+        context['comments'] = SimpleLazyObject(lambda: comment_page(self.object))
         context['rating_form'] = RatingForm()
         
         # Check if user has already rated
@@ -261,19 +311,77 @@ class ActivityDetailView(DetailView):
             ).first()
         else:
             context['user_rating'] = None
+
+        context['recommended_activities'] = get_recommendations(self.object)
         
-        # Calculate average rating (only from ratings that have a rating value)
-        ratings_with_rating = [r for r in self.object.ratings.all() if r.rating is not None]
-        if ratings_with_rating:
-            context['average_rating'] = sum(r.rating for r in ratings_with_rating) / len(ratings_with_rating)
-            context['total_ratings'] = len(ratings_with_rating)
-        else:
-            context['average_rating'] = 0
-            context['total_ratings'] = 0
-        
+        # average and histogram come from the precomputed summary row
+        summary = get_summary(self.object)
+        context['rating_summary'] = summary
+        context['average_rating'] = summary.average
+        context['total_ratings'] = summary.total
+
+        # versions for the {% cache %} fragments; querysets above stay unevaluated on a hit
+        pk = self.object.pk
+        context['fragment_versions'] = get_versions(
+            activity=f'activity.{pk}',
+            media=f'activity.{pk}.media',
+            ratings=f'activity.{pk}.ratings',
+            organizer=f'profile.{self.object.created_by_id}',
+            usernames='usernames',
+        )
         return context
 
 
+def activity_comments(request, pk):
+    """Further pages of an activity's comments for the "Show More" button"""
+    activity = get_object_or_404(Activity, pk=pk)
+    after = decode_cursor(request.GET.get('after'))
+    if after is None:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    page = comment_page(activity, after)
+    html = render_to_string('main/activity_comment_items.html', {
+        'activity': activity,
+        'ratings': page.objects,
+        'can_moderate': request.user.is_staff or request.user.is_superuser,
+    }, request=request)
+    return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+
+def activity_media(request, pk):
+    """Further pages of an activity's media gallery for the "Show More" button"""
+    activity = get_object_or_404(Activity, pk=pk)
+    after = decode_cursor(request.GET.get('after'))
+    if after is None:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    page = gallery_page(activity, after)
+    html = render_to_string('main/activity_media_items.html', {'media_items': page.objects}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': page.next_cursor})
+
+
+def activity_events(request, pk):
+    """Server-Sent Events stream of participant counts and new comments for one activity"""
+    activity = get_object_or_404(Activity, pk=pk)
+    count = activity.registrations.filter(status='joined').count()
+    initial = [(live.PARTICIPANTS, {'count': count})]
+    channel = live.activity_channel(activity.pk)
+    # ASGI servers park idle connections on the event loop; WSGI needs a thread each
+    if isinstance(request, ASGIRequest):
+        stream = live.event_stream(channel, initial)
+    else:
+        stream = live.event_stream_sync(channel, initial)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, open to METRICS_ALLOWED_IPS only"""
+    if client_ip(request) not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        raise Http404
+    return HttpResponse(metrics.render(metrics.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def search_suggest(request):
     q = request.GET.get('q', '')
     results = []
@@ -289,6 +397,110 @@ def search_suggest(request):
     return JsonResponse({"results": results})
 
 
+def parse_radius(value):
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_NEAR_RADIUS_KM
+    return min(max(radius, 0.1), MAX_NEAR_RADIUS_KM)
+
+
+def apply_location_filters(queryset, params):
+    """Apply the `near`/`radius` and `bbox` query parameters; returns (queryset, {pk: distance_km})."""
+    distances = {}
+    bbox = parse_bbox(params.get('bbox'))
+    if bbox:
+        queryset = filter_bbox(queryset, *bbox)
+    point = parse_point(params.get('near'))
+    if point:
+        queryset, distances = filter_near(queryset, point[0], point[1], parse_radius(params.get('radius')))
+    return queryset, distances
+
+
+def activities_api(request):
+    """JSON list of activities, supporting the same filters as the activity list"""
+    now = timezone.now()
+    queryset = Activity.objects.all()
+    if request.GET.get('date_filter') == 'past':
+        queryset = queryset.past(now).order_by('-date')
+    else:
+        queryset = queryset.upcoming(now).order_by('date')
+
+    category_filter = request.GET.get('category', '')
+    if category_filter in [choice[0] for choice in Activity.CATEGORY_CHOICES]:
+        queryset = queryset.filter(category=category_filter)
+
+    queryset, distances = apply_location_filters(queryset, request.GET)
+    if distances:
+        # every candidate in the radius is already ranked; page by distance, not by date
+        nearest = sorted(distances, key=lambda pk: (distances[pk], pk))[:API_PAGE_SIZE]
+        queryset = queryset.filter(pk__in=nearest)
+    rows = queryset.values('id', 'title', 'category', 'location', 'date', 'latitude', 'longitude')[:API_PAGE_SIZE]
+
+    results = []
+    for row in rows:
+        if row['id'] in distances:
+            row['distance_km'] = round(distances[row['id']], 2)
+        results.append(row)
+    if distances:
+        results.sort(key=lambda row: (distances[row['id']], row['id']))
+
+    return JsonResponse({"results": results})
+
+
+def _ical_response(request, feed_key, version_names, queryset, name, private=False):
+    body, etag = get_feed(feed_key, version_names, queryset, name, request.get_host())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    patch_cache_control(response, private=private, public=not private, max_age=300)
+    return response
+
+
+def activity_feed(request):
+    """iCalendar feed of all upcoming activities"""
+    return _ical_response(
+        request, 'upcoming', ['activities'],
+        upcoming_feed_queryset(), 'Eco Activities',
+    )
+
+
+def category_feed(request, category):
+    valid_categories = [choice[0] for choice in Activity.CATEGORY_CHOICES]
+    if category not in valid_categories:
+        raise Http404("Unknown category")
+    return _ical_response(
+        request, f'category:{category}', ['activities'],
+        upcoming_feed_queryset(category=category), f'Eco Activities: {category}',
+    )
+
+
+def official_feed(request):
+    return _ical_response(
+        request, 'official', ['activities'],
+        upcoming_feed_queryset(official=True), 'Eco Activities: Official Events',
+    )
+
+
+def user_feed(request, token):
+    """Private feed of the activities a user registered for, addressed by a signed token"""
+    user_id = read_user_feed_token(token)
+    if user_id is None:
+        raise Http404("Unknown feed")
+    return _ical_response(
+        request, f'user:{user_id}', ['activities', f'registrations.user.{user_id}'],
+        upcoming_feed_queryset(user_id=user_id), 'My Eco Activities', private=True,
+    )
+
+
+def serve_media(request, path):
+    #uploaded photos and videos, with byte ranges so players can seek
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405, headers={'Allow': 'GET, HEAD'})
+    return media_response(request, path)
+
+
 @login_required
 def register_activity(request, pk):
     activity = get_object_or_404(Activity, pk=pk)
@@ -299,21 +511,23 @@ def register_activity(request, pk):
         return redirect('activity_detail', pk=pk)
 
     if request.method == 'POST':
-        reg, created = Registration.objects.get_or_create(
-            user=request.user,
-            joined_activity=activity,
-            defaults={'status': 'joined'},
-        )
-        if not created and reg.status != 'joined':
-            reg.status = 'joined'
-            reg.save()
+        result = seating.register_user(activity, request.user)
 
-        UserHistory.objects.create(
-            user=request.user,
-            action=f"Registered for activity: {activity.title}"
-        )
-
-        messages.success(request, f"You registered for: {activity.title}")
+        if result == seating.JOINED:
+            record_registration(activity.pk)
+            UserHistory.objects.create(
+                user=request.user,
+                action=f"Registered for activity: {activity.title}"
+            )
+            messages.success(request, f"You registered for: {activity.title}")
+        elif result == seating.WAITLISTED:
+            UserHistory.objects.create(
+                user=request.user,
+                action=f"Joined waitlist for activity: {activity.title}"
+            )
+            messages.info(request, f"{activity.title} is full. You have been added to the waitlist.")
+        else:
+            messages.info(request, f"You are already signed up for: {activity.title}")
     return redirect('activity_detail', pk=pk)
 
 
@@ -327,18 +541,19 @@ def cancel_registration(request, pk):
         return redirect('activity_detail', pk=pk)
 
     if request.method == 'POST':
-        try:
-            reg = Registration.objects.get(user=request.user, joined_activity=activity)
-            reg.status = 'cancelled'
-            reg.save()
-
+        result, promoted = seating.cancel_user(activity, request.user)
+        if result == seating.CANCELLED:
             UserHistory.objects.create(
                 user=request.user,
                 action=f"Cancelled registration for activity: {activity.title}"
             )
+            if promoted is not None:
+                record_registration(activity.pk)
+                UserHistory.objects.create(
+                    user_id=promoted.user_id,
+                    action=f"Registered for activity: {activity.title}"
+                )
             messages.info(request, f"You cancelled: {activity.title}")
-        except Registration.DoesNotExist:
-            pass
     return redirect('activity_detail', pk=pk)
 
 
@@ -380,7 +595,8 @@ def activity_delete(request, pk):
     
     if request.method == 'POST':
         activity_title = activity.title
-        activity.delete()
+        # hidden at once; its registrations, ratings and files are purged in the background
+        soft_delete_activity(activity)
         
         UserHistory.objects.create(
             user=request.user,
@@ -399,8 +615,11 @@ def user_dashboard(request):
     user = request.user
     now = timezone.now()
     
-    # Get or create user profile
-    profile, created = Profile.objects.get_or_create(user=user)
+    # profiles are created with the account; older accounts are backfilled by a migration
+    try:
+        profile = user.profile
+    except Profile.DoesNotExist:
+        profile = Profile.objects.create(user=user)
     
     # Handle profile picture upload/removal
     if request.method == 'POST':
@@ -414,7 +633,7 @@ def user_dashboard(request):
                 messages.error(request, "Error uploading profile picture. Please try again.")
         elif 'remove_photo' in request.POST:
             if profile.user_photo:
-                profile.user_photo.delete()
+                # the file is released by the profile's post_save signal
                 profile.user_photo = None
                 profile.save()
                 messages.success(request, "Profile picture removed successfully!")
@@ -422,23 +641,16 @@ def user_dashboard(request):
     else:
         form = ProfilePictureForm(instance=profile)
     
-    # Statistics
-    activities_created = Activity.objects.filter(created_by=user).count()
-    activities_registered = Registration.objects.filter(
-        user=user, 
-        status='joined',
-        joined_activity__date__gte=now
-    ).count()
-    total_registrations = Registration.objects.filter(user=user, status='joined').count()
+    # Statistics (one query, cached until the user's activities or registrations change)
+    stats = get_user_stats(user.pk)
     
     # Recent activities created by user (last 5)
     my_activities = Activity.objects.filter(created_by=user).order_by('-created_at')[:5]
     
     # Upcoming activities user is registered for (next 5)
-    upcoming_registered = Activity.objects.filter(
+    upcoming_registered = Activity.objects.upcoming(now).filter(
         registrations__user=user,
         registrations__status='joined',
-        date__gte=now
     ).order_by('date')[:5]
     
     # Recent history - filter for registration and activity views only (exclude "Visited activities page")
@@ -452,19 +664,18 @@ def user_dashboard(request):
     ).order_by('-timestamp')[:10]
     
     # Get activity objects for clickable links - create a list with history and activity pairs
-    recent_history_with_activities = []
+    prefixes = ('Visited activity: ', 'Registered for activity: ')
+    titles = {}
     for history in recent_history:
-        activity = None
-        if 'Visited activity:' in history.action:
-            activity_title = history.action.replace('Visited activity: ', '')
-            activity = Activity.objects.filter(title=activity_title).first()
-        elif 'Registered for activity:' in history.action:
-            activity_title = history.action.replace('Registered for activity: ', '')
-            activity = Activity.objects.filter(title=activity_title).first()
-        recent_history_with_activities.append({
-            'history': history,
-            'activity': activity
-        })
+        titles[history.pk] = next((history.action[len(p):] for p in prefixes if history.action.startswith(p)), None)
+    # one lookup for every title; the oldest activity wins, as .first() did
+    activities_by_title = {}
+    for activity in Activity.objects.filter(title__in=set(titles.values()) - {None}).order_by('-pk'):
+        activities_by_title[activity.title] = activity
+    recent_history_with_activities = [
+        {'history': history, 'activity': activities_by_title.get(titles[history.pk])}
+        for history in recent_history
+    ]
     
     # Set last visit cookie
     from django.http import HttpResponse
@@ -472,13 +683,15 @@ def user_dashboard(request):
     response = render(request, 'main/user_dashboard.html', {
         'profile': profile,
         'profile_form': form,
-        'activities_created': activities_created,
-        'activities_registered': activities_registered,
-        'total_registrations': total_registrations,
+        'activities_created': stats['created_count'],
+        'activities_registered': stats['upcoming_count'],
+        'total_registrations': stats['joined_count'],
         'my_activities': my_activities,
         'upcoming_registered': upcoming_registered,
         'recent_history_with_activities': recent_history_with_activities,
         'now': now,
+        'feed_token': make_user_feed_token(user),
+        'fragment_versions': get_versions(activities='activities', registrations=f'registrations.user.{user.pk}'),
     })
     # Set cookie with formatted date/time
     last_visit_str = timezone.now().strftime("%B %d, %Y at %I:%M %p")
@@ -581,6 +794,10 @@ def submit_rating(request, pk):
     now = timezone.now()
     event_passed = activity.date < now
     
+    if request.method == 'POST' and activity.archived_at is not None:
+        messages.error(request, "This event has been archived and no longer takes ratings or comments.")
+        return redirect('activity_detail', pk=pk)
+
     if request.method == 'POST':
         form = RatingForm(request.POST)
         if form.is_valid():
@@ -613,6 +830,7 @@ def submit_rating(request, pk):
                 rating.save()
                 messages.success(request, "Your comment has been updated!")
             else:
+                record_rating(activity.pk)
                 if event_passed:
                     messages.success(request, "Thank you for rating and commenting on this event!")
                 else:
@@ -659,35 +877,138 @@ def delete_comment(request, pk, rating_id):
 
 @login_required
 def user_profile(request, username):
-    profile_user = get_object_or_404(User, username=username)
+    profile_user = get_object_or_404(User.objects.select_related('profile'), username=username)
     
     try:
         profile = profile_user.profile
     except Profile.DoesNotExist:
         profile = None
-    except AttributeError:
-        profile = None
     
-    activities_created = Activity.objects.filter(created_by=profile_user).count()
-    activities_registered = Registration.objects.filter(
-        user=profile_user,
-        status='joined'
-    ).count()
+    stats = get_user_stats(profile_user.pk)
     
     recent_activities = Activity.objects.filter(created_by=profile_user).order_by('-created_at')[:5]
-    recent_ratings = Rating.objects.filter(user=profile_user).order_by('-created_at')[:5]
+    recent_ratings = (
+        Rating.objects.filter(user=profile_user, activity__deleted_at__isnull=True)
+        .select_related('activity').order_by('-created_at')[:5]
+    )
     
     context = {
         'profile_user': profile_user,
         'profile': profile,
-        'activities_created': activities_created,
-        'activities_registered': activities_registered,
+        'activities_created': stats['created_count'],
+        'activities_registered': stats['joined_count'],
         'recent_activities': recent_activities,
         'recent_ratings': recent_ratings,
     }
     
     return render(request, 'main/user_profile.html', context)
 
+def is_organizer(user):
+    return Profile.objects.filter(user=user, is_organizer=True).exists()
+
+
+@login_required
+def organizer_analytics(request):
+    """Registrations, cancellations, ratings and views of the organizer's activities, from the daily rollups"""
+    if not is_organizer(request.user):
+        messages.error(request, "Analytics are available to organizers only.")
+        return redirect('user_dashboard')
+    date_range = parse_range(request.GET.get('start'), request.GET.get('end'))
+    if date_range is None:
+        messages.error(request, "Invalid date range.")
+        date_range = parse_range(None, None)
+    report = organizer_report(request.user.pk, *date_range)
+    peak = max(max(report['series']['registrations']), max(report['series']['views']), 1)
+    days = [
+        {'day': day, 'registrations': registrations, 'cancellations': cancellations, 'views': views}
+        for day, registrations, cancellations, views in zip(
+            report['days'], report['series']['registrations'],
+            report['series']['cancellations'], report['series']['views'],
+        )
+    ]
+    return render(request, 'main/organizer_analytics.html', {'report': report, 'days': days, 'peak': peak})
+
+
+@login_required
+def analytics_api(request):
+    """JSON version of the organizer analytics page"""
+    if not is_organizer(request.user):
+        return JsonResponse({'error': 'Analytics are available to organizers only.'}, status=403)
+    date_range = parse_range(request.GET.get('start'), request.GET.get('end'))
+    if date_range is None:
+        return JsonResponse({'error': 'Invalid date range.'}, status=400)
+    return JsonResponse(organizer_report(request.user.pk, *date_range))
+
+#resumable chunked uploads for large media files
+def _upload_response(session, status=200):
+    response = JsonResponse({
+        'id': str(session.pk),
+        'offset': session.received,
+        'size': session.size,
+        'upload_url': reverse('media_upload', args=[session.activity_id, session.pk]),
+    }, status=status)
+    response['Upload-Offset'] = str(session.received)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _upload_error(error):
+    response = JsonResponse({'error': str(error), 'offset': error.offset}, status=error.status)
+    if error.offset is not None:
+        response['Upload-Offset'] = str(error.offset)
+    return response
+
+
+@login_required
+@require_POST
+def media_upload_start(request, pk):
+    """Open an upload with {"filename", "size"}; size and quota are checked before any bytes are sent"""
+    activity = get_object_or_404(Activity, pk=pk)
+    if not can_upload_media(request.user, activity):
+        return JsonResponse({'error': "You can upload media if you registered and the event has passed."}, status=403)
+    try:
+        data = json.loads(request.body)
+        session = start_upload(activity, request.user, data.get('filename', ''), data.get('size'))
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Expected a JSON object with filename and size.'}, status=400)
+    except UploadError as error:
+        return _upload_error(error)
+    return _upload_response(session, status=201)
+
+
+@login_required
+def media_upload(request, pk, upload_id):
+    """GET/HEAD report the resume offset, PATCH appends a chunk at Upload-Offset, DELETE cancels"""
+    session = get_object_or_404(UploadSession, pk=upload_id, activity_id=pk, user=request.user)
+    if request.method in ('GET', 'HEAD'):
+        return _upload_response(session)
+    if request.method == 'DELETE':
+        abort_upload(session)
+        return HttpResponse(status=204)
+    if request.method != 'PATCH':
+        return HttpResponseNotAllowed(['GET', 'HEAD', 'PATCH', 'DELETE'])
+
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers['Content-Length']) if request.headers.get('Content-Length') else None
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset and Content-Length must be integers.'}, status=400)
+    received = session.received
+    try:
+        # the body is streamed from the request into the part file, never read into memory
+        media = write_chunk(session, offset, request, length)
+    except UploadError as error:
+        return _upload_error(error)
+    finally:
+        metrics.UPLOAD_BYTES.inc(max(session.received - received, 0), view='media_upload')
+    if media is None:
+        return _upload_response(session)
+
+    UserHistory.objects.create(user=request.user, action=f"Uploaded media to: {session.activity.title}")
+    response = JsonResponse({'id': media.pk, 'offset': session.size, 'size': session.size, 'complete': True}, status=201)
+    response['Upload-Offset'] = str(session.size)
+    return response
+
 class CustomLoginView(DjangoLoginView):
     template_name = 'registration/login.html'
     
@@ -719,51 +1040,57 @@ class CustomLoginView(DjangoLoginView):
         context['failed_attempts'] = failed_attempts
         return self.render_to_response(context)
 
-def home(request):
-    """Homepage view with hero section and statistics"""
-    from django.db.models import Count
+def home_statistics():
+    """Site-wide counts for the homepage; only evaluated when the cached fragment is rebuilt"""
     from datetime import timedelta
-    
-    # Calculate statistics
-    total_activities = Activity.objects.count()
-    total_participants = Registration.objects.filter(status='joined').count()
-    
-    # Upcoming activities (next 30 days)
+
     today = timezone.now()
     next_month = today + timedelta(days=30)
-    upcoming_count = Activity.objects.filter(date__gte=today, date__lte=next_month).count()
-    
-    # Activities by category
-    category_counts = Activity.objects.values('category').annotate(count=Count('id'))
-    categories_available = len(category_counts)
+    counts = dict(Activity.objects.values_list('category').annotate(count=Count('id')))
+    return {
+        'total_activities': sum(counts.values()),
+        'total_participants': Registration.objects.filter(status='joined', joined_activity__deleted_at__isnull=True).count(),
+        # Upcoming activities (next 30 days)
+        'upcoming_count': Activity.objects.upcoming(today).filter(date__lte=next_month).count(),
+        'categories_available': len(counts),
+        'categories': [
+            (value, label, counts.get(value)) for value, label in Activity.CATEGORY_CHOICES
+        ],
+    }
+
+def home(request):
+    """Homepage view with hero section and statistics"""
+    today = timezone.now()
     
     # Featured upcoming activities (random 4 from featured upcoming activities)
-    featured_upcoming = Activity.objects.filter(date__gte=today, is_featured=True)
-    if featured_upcoming.exists():
+    featured_list = list(
+        Activity.objects.upcoming(today).filter(is_featured=True).select_related('created_by__profile', 'cover')
+    )
+    if featured_list:
         import random
-        featured_list = list(featured_upcoming)
         if len(featured_list) > 4:
             featured_activities = random.sample(featured_list, 4)
         else:
             featured_activities = featured_list
     else:
-        featured_activities = Activity.objects.filter(date__gte=today).order_by('date')[:4]
-    
-    # Get all categories for highlights
-    all_categories = Activity.CATEGORY_CHOICES
+        # nothing hand-picked: fall back to the precomputed trending ranking
+        featured_activities = trending_activities(4)
+        if not featured_activities:
+            featured_activities = list(
+                Activity.objects.upcoming(today).select_related('created_by__profile', 'cover').order_by('date')[:4]
+            )
     
     # Session tracking for homepage
     session_visit_count = request.session.get('home_visits', 0) + 1
     request.session['home_visits'] = session_visit_count
     
     context = {
-        'total_activities': total_activities,
-        'total_participants': total_participants,
-        'upcoming_count': upcoming_count,
-        'categories_available': categories_available,
-        'category_counts': category_counts,
+        # statistics are computed lazily so a cached fragment skips their queries
+        'stats': SimpleLazyObject(home_statistics),
+        'activities_version': get_version('activities'),
+        'registrations_version': get_version('registrations'),
         'featured_activities': featured_activities,
-        'all_categories': all_categories,
+        'featured_ids': ','.join(str(activity.pk) for activity in featured_activities),
         'session_visit_count': session_visit_count,
     }
     